@@ -0,0 +1,144 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+log = logging.getLogger("__main__." + __name__)
+
+OVERLOADED = "overloaded: too many status requests in progress"
+RATE_LIMITED = "rate limited: too many status requests from this peer"
+
+
+class TokenBucket:
+    """
+    Allows rate events per second on average and bursts of up to burst events.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def try_acquire(self, now: Optional[float] = None) -> bool:
+        """
+        Take one token if there is one.
+        :param now: the current time.monotonic(), for tests.
+        :return: True when the event is allowed.
+        """
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class AdmissionController:
+    """
+    Limits the status requests a client listener serves, so that a server polling
+    aggressively can not starve the client's own heartbeats.
+    Requests over a limit are rejected at once instead of queueing.
+    """
+
+    def __init__(
+        self,
+        max_handlers: int = 100,
+        backlog: int = 100,
+        peer_rate: float = 0.0,
+        peer_burst: float = 10.0,
+        max_peers: int = 1024,
+        heartbeat_wait: float = 0.1,
+    ):
+        """
+        :param max_handlers: the number of status connections served at the same time.
+        :param backlog: the accept backlog of the listening socket.
+        :param peer_rate: status requests per second allowed from one peer address, 0 for no limit.
+        :param peer_burst: status requests one peer may send at once before peer_rate applies.
+        :param max_peers: the number of peer rate limits kept, least recently seen first out.
+        :param heartbeat_wait: the longest a status request waits for heartbeats being sent.
+        """
+        self.max_handlers = max_handlers
+        self.backlog = backlog
+        self.peer_rate = peer_rate
+        self.peer_burst = peer_burst
+        self.max_peers = max_peers
+        self.heartbeat_wait = heartbeat_wait
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._peers: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._heartbeats = 0
+        self._heartbeats_done: Optional[asyncio.Event] = None
+
+    def try_admit(self, peer: Optional[str]) -> Optional[str]:
+        """
+        Admit a connection carrying status requests, release() must be called when it closes.
+        :param peer: the address of the peer, None when it is unknown.
+        :return: None when admitted, otherwise the reason of the rejection.
+        """
+        if self.active >= self.max_handlers:
+            self.rejected += 1
+            return OVERLOADED
+        reason = self.check_rate(peer)
+        if reason is None:
+            self.active += 1
+            self.admitted += 1
+        return reason
+
+    def check_rate(self, peer: Optional[str]) -> Optional[str]:
+        """
+        Apply the peer rate limit to a further request on an admitted connection.
+        :param peer: the address of the peer, None when it is unknown.
+        :return: None when allowed, otherwise the reason of the rejection.
+        """
+        if self.peer_rate <= 0 or peer is None:
+            return None
+        bucket = self._peers.get(peer)
+        if bucket is None:
+            bucket = self._peers[peer] = TokenBucket(self.peer_rate, self.peer_burst)
+            if len(self._peers) > self.max_peers:
+                self._peers.popitem(last=False)
+        else:
+            self._peers.move_to_end(peer)
+        if bucket.try_acquire():
+            return None
+        self.rejected += 1
+        return RATE_LIMITED
+
+    def release(self) -> None:
+        self.active -= 1
+
+    @contextlib.contextmanager
+    def sending_heartbeat(self):
+        """
+        Wrap sending heartbeats, status requests give way to them.
+        """
+        self._heartbeats += 1
+        if self._heartbeats_done is not None:
+            self._heartbeats_done.clear()
+        try:
+            yield
+        finally:
+            self._heartbeats -= 1
+            if self._heartbeats == 0 and self._heartbeats_done is not None:
+                self._heartbeats_done.set()
+
+    async def wait_for_heartbeats(self) -> None:
+        """
+        Wait until no heartbeat is being sent, at most heartbeat_wait seconds.
+        """
+        if self._heartbeats == 0 or self.heartbeat_wait <= 0:
+            return
+        if self._heartbeats_done is None:
+            self._heartbeats_done = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._heartbeats_done.wait(), self.heartbeat_wait)
+        except asyncio.TimeoutError:
+            log.debug("status request waited too long for heartbeats, serving it now")
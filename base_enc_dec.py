@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from message_records import HeartBeat, Record, Status, from_dict
+
 
 class BaseEncoderDecoder(ABC):
     @abstractmethod
@@ -17,3 +19,33 @@ class BaseEncoderDecoder(ABC):
     @abstractmethod
     def decode_status(self, binary_data):
         pass
+
+    @abstractmethod
+    def encode_heartbeat_batch(self, msg_dict):
+        pass
+
+    @abstractmethod
+    def decode_heartbeat_batch(self, binary_data):
+        pass
+
+    @abstractmethod
+    def encode_error(self, msg_dict):
+        pass
+
+    @abstractmethod
+    def decode_error(self, binary_data):
+        pass
+
+    # record API, implemented through the dict format unless a backend has a faster path
+
+    def encode_heartbeat_record(self, record: HeartBeat) -> bytes:
+        return self.encode_heartbeat(record.to_dict())
+
+    def decode_heartbeat_record(self, binary_data) -> Record:
+        return from_dict(self.decode_heartbeat(binary_data))
+
+    def encode_status_record(self, record: Status) -> bytes:
+        return self.encode_status(record.to_dict())
+
+    def decode_status_record(self, binary_data) -> Record:
+        return from_dict(self.decode_status(binary_data))
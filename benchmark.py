@@ -0,0 +1,252 @@
+"""
+Benchmarks of the codecs and of the client against a local server.
+
+    python benchmark.py run --output results.json
+    python benchmark.py compare baseline.json results.json --threshold 0.1
+
+compare exits with status 1 when a result is worse than the baseline by more than threshold.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import sys
+import time
+import timeit
+from typing import Dict, List
+
+from google.protobuf.internal import api_implementation
+
+from client import Client
+from encode_decode_executor import EncodeDecodeExecutor
+from encoder_decoders import ENCODER_DECODERS
+from message_records import HeartBeat
+import messages_pb2 as messages
+from stand_in_server import StandInServer
+
+HEARTBEAT = {
+    "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+    "msg": "I’m here!",
+    "client_host": "127.0.0.1",
+    "client_port": 3000,
+    "identifier": 1234,
+}
+STATUS = {
+    "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+    "message_count": 100,
+    "identifier": 1234,
+}
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile.
+    :param samples: the measured values.
+    :param p: the percentile, 0 < p <= 100.
+    """
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def result(value: float, unit: str, higher_is_better: bool) -> dict:
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def bench_codecs(number: int, repeat: int) -> Dict[str, dict]:
+    """
+    Operations per second of every encoder/decoder, the best of repeat runs of number calls.
+    """
+    results = {}
+    for name, encoder_decoder_class in ENCODER_DECODERS.items():
+        encoder_decoder = EncodeDecodeExecutor(encoder_decoder_class())
+        heartbeat_record = HeartBeat.from_dict(HEARTBEAT)
+        encoded_heartbeat = encoder_decoder.encode_heartbeat(HEARTBEAT)
+        encoded_status = encoder_decoder.encode_status(STATUS)
+        operations = {
+            "encode_heartbeat": lambda: encoder_decoder.encode_heartbeat(HEARTBEAT),
+            "decode_heartbeat": lambda: encoder_decoder.decode_heartbeat(
+                encoded_heartbeat
+            ),
+            "encode_status": lambda: encoder_decoder.encode_status(STATUS),
+            "decode_status": lambda: encoder_decoder.decode_status(encoded_status),
+            "encode_heartbeat_record": lambda: encoder_decoder.encode_heartbeat_record(
+                heartbeat_record
+            ),
+            "decode_heartbeat_record": lambda: encoder_decoder.decode_heartbeat_record(
+                encoded_heartbeat
+            ),
+        }
+        for operation, func in operations.items():
+            best = min(timeit.repeat(func, number=number, repeat=repeat))
+            results[f"codec.{name}.{operation}"] = result(number / best, "ops/s", True)
+    return results
+
+
+async def bench_round_trip(requests: int, warmup: int) -> Dict[str, dict]:
+    """
+    Heartbeat round-trip latency of Client.send_a_message_to_server against a stand-in server.
+    """
+    encoder_decoder = EncodeDecodeExecutor(ENCODER_DECODERS["protobuf"]())
+    server = StandInServer(encoder_decoder)
+    await server.start()
+    port = server.port
+    client = Client(
+        encoder_decoder=encoder_decoder,
+        client_identifier=1234,
+        client_port=3000,
+        client_ip="127.0.0.1",
+        server_ip="127.0.0.1",
+        server_port=port,
+    )
+    samples = []
+    try:
+        for i in range(warmup + requests):
+            start = time.perf_counter()
+            await client.send_a_message_to_server("127.0.0.1", port, HEARTBEAT)
+            if i >= warmup:
+                samples.append((time.perf_counter() - start) * 1000)
+    finally:
+        await client.close()
+        await server.close()
+    return {
+        "client.round_trip_p50": result(percentile(samples, 50), "ms", False),
+        "client.round_trip_p99": result(percentile(samples, 99), "ms", False),
+    }
+
+
+async def bench_status_requests(requests: int, concurrency: int) -> Dict[str, dict]:
+    """
+    Status requests per second answered by Client.handle_server_request, with concurrency
+    connections sending requests at the same time.
+    """
+    encoder_decoder = EncodeDecodeExecutor(ENCODER_DECODERS["protobuf"]())
+    client = Client(
+        encoder_decoder=encoder_decoder,
+        client_identifier=1234,
+        client_port=0,
+        client_ip="127.0.0.1",
+        server_ip="127.0.0.1",
+        server_port=0,
+    )
+    await client.start_server()
+    port = client.server.sockets[0].getsockname()[1]
+    request = encoder_decoder.encode_status(STATUS)
+    ack = encoder_decoder.encode_heartbeat(dict(HEARTBEAT, msg="ack"))
+
+    async def worker(count: int) -> None:
+        for _ in range(count):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            await writer.drain()
+            await reader.read(1024)
+            writer.write(ack)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+
+    per_worker = max(1, requests // concurrency)
+    start = time.perf_counter()
+    workers = [asyncio.ensure_future(worker(per_worker)) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        # a failed worker leaves the others running, they must not outlive the loop
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        # closes the listener and the status sessions still open
+        await client.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "client.status_requests": result(
+            per_worker * concurrency / elapsed, "requests/s", True
+        )
+    }
+
+
+def run(args) -> dict:
+    results = {}
+    results.update(bench_codecs(args.number, args.repeat))
+    results.update(asyncio.run(bench_round_trip(args.requests, args.warmup)))
+    results.update(asyncio.run(bench_status_requests(args.requests, args.concurrency)))
+    return {
+        "metadata": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "protobuf_implementation": api_implementation.Type(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """
+    Find the results which got worse than the baseline by more than threshold.
+    :param baseline: the output of an earlier run.
+    :param current: the output of this run.
+    :param threshold: the allowed relative change, 0.1 is 10%.
+    :return: a description of every regression, a result missing from this run is one.
+    """
+    regressions = []
+    for name, base in baseline["results"].items():
+        now = current["results"].get(name)
+        if now is None:
+            regressions.append(f"{name}: missing from the current run")
+            continue
+        if not base["value"]:
+            continue
+        change = (now["value"] - base["value"]) / base["value"]
+        worse = -change if base["higher_is_better"] else change
+        if worse > threshold:
+            regressions.append(
+                f"{name}: {base['value']:.4g} -> {now['value']:.4g} {base['unit']} "
+                f"({change:+.1%})"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", help="write the results to this JSON file")
+    run_parser.add_argument("--number", type=int, default=10000)
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--requests", type=int, default=2000)
+    run_parser.add_argument("--warmup", type=int, default=100)
+    run_parser.add_argument("--concurrency", type=int, default=50)
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        report = run(args)
+        for name, value in report["results"].items():
+            print(f"{name:55} {value['value']:14.2f} {value['unit']}")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"no regression beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
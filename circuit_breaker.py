@@ -0,0 +1,160 @@
+import contextlib
+import logging
+import random
+import time
+from typing import Optional, Tuple, Type
+
+log = logging.getLogger("__main__." + __name__)
+
+# calls go through, failures are counted
+CLOSED = "closed"
+# calls fail at once until the reset timeout is over
+OPEN = "open"
+# a few probe calls go through, their outcome closes or opens the circuit again
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Raised instead of calling a server which is known to be down.
+    """
+
+
+class Backoff:
+    """
+    Exponentially growing delays with jitter: the n-th delay is between half and all of
+    min(cap, base * factor ** n), so that clients which failed together do not retry together.
+    """
+
+    __slots__ = ("base", "cap", "factor", "rng")
+
+    def __init__(
+        self,
+        base: float = 1.0,
+        cap: float = 30.0,
+        factor: float = 2.0,
+        rng: Optional[random.Random] = None,
+    ):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.rng = rng if rng is not None else random.Random()
+
+    def delay(self, attempt: int) -> float:
+        """
+        :param attempt: the number of failed attempts before this one, from 0.
+        """
+        ceiling = min(self.cap, self.base * self.factor ** min(attempt, 64))
+        return ceiling / 2 + self.rng.uniform(0, ceiling / 2)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a server after failure_threshold failures in a row. While the circuit is
+    open calls raise CircuitOpenError without touching the network; after a backoff delay
+    half_open_max probe calls are let through. A successful probe closes the circuit, a failed
+    one opens it again for a longer delay.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 1.0,
+        max_reset_timeout: float = 30.0,
+        half_open_max: int = 1,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        :param failure_threshold: failures in a row which open the circuit, 0 to never open it.
+        :param reset_timeout: seconds the circuit first stays open, doubled with jitter every
+            time a probe fails.
+        :param max_reset_timeout: the longest the circuit stays open.
+        :param half_open_max: calls let through at the same time to probe the server.
+        """
+        self.failure_threshold = failure_threshold
+        self.half_open_max = half_open_max
+        self.backoff = Backoff(reset_timeout, max_reset_timeout, rng=rng)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0  # times opened since the circuit was last closed
+        self.open_until = 0.0
+        self.rejected = 0
+        self._probes = 0
+
+    def before_call(self, now: Optional[float] = None) -> None:
+        """
+        :param now: the current time.monotonic(), for tests.
+        :raise CircuitOpenError: when the call must not be made.
+        """
+        if self.state == CLOSED:
+            return
+        if now is None:
+            now = time.monotonic()
+        if self.state == OPEN and now >= self.open_until:
+            log.info("circuit half open: probing the server")
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and self._probes < self.half_open_max:
+            self._probes += 1
+            return
+        self.rejected += 1
+        raise CircuitOpenError(
+            f"circuit open: server unavailable, retrying in "
+            f"{max(0.0, self.open_until - now):.1f}s"
+        )
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            log.info("circuit closed: the server is back")
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._probes = 0
+
+    def record_failure(self, now: Optional[float] = None) -> None:
+        if self.state == HALF_OPEN:
+            self._probes -= 1
+        self.failures += 1
+        if self.state == OPEN or self.failure_threshold <= 0:
+            return
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if now is None:
+                now = time.monotonic()
+            delay = self.backoff.delay(self.opened)
+            self.opened += 1
+            self.state = OPEN
+            self.open_until = now + delay
+            log.warning(
+                "circuit open after %s failures: failing fast for %.1fs",
+                self.failures,
+                delay,
+            )
+
+    def record_abandoned(self) -> None:
+        """
+        A call let through ended without an outcome, for instance it was cancelled.
+        """
+        if self.state == HALF_OPEN:
+            self._probes -= 1
+
+    @contextlib.contextmanager
+    def call(self, neutral: Tuple[Type[BaseException], ...] = ()):
+        """
+        Wrap one call to the server: raises CircuitOpenError or records its outcome.
+        Any exception but cancellation counts as a failure.
+        :param neutral: exceptions which say nothing about the server, like a local queue
+            which is full. They end the call without an outcome, as cancellation does.
+        """
+        self.before_call()
+        try:
+            yield
+        except neutral:
+            self.record_abandoned()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.record_abandoned()
+            raise
+        else:
+            self.record_success()
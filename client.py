@@ -1,10 +1,53 @@
 import asyncio
+import functools
 import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
 import messages_pb2 as messages
+from admission import AdmissionController
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from client_state import ClientState
+from connection_pool import ConnectionPool
 from encode_decode_executor import EncodeDecodeExecutor
+from framing import FrameCodec, encode_frame
+from heartbeat_coalescer import HeartbeatCoalescer
+from message_records import HeartBeat, Status
+from metrics import ClientMetrics, client_metrics
+from outbound_queue import OutboundQueueFull
+from outbound_buffer import drain_above, frame_chunks
+from pipelined_channels import PipelinedChannels
+from protobuf_encode_decoder import STATUS_REQUEST_ID_TAG, encode_varint
+from protocol_transport import (
+    PROTOCOL,
+    STREAMS,
+    MessageProtocol,
+    connector,
+    start_message_server,
+)
+from scheduler import SKIP, HeartbeatScheduler
+from udp_transport import DatagramHeartbeatSender
 
 log = logging.getLogger("__main__." + __name__)
 
+# how long a rejected status request may take to arrive before the connection is closed
+REJECT_READ_TIMEOUT = 1.0
+
+
+def is_heartbeat_ack(reply) -> bool:
+    """
+    :param reply: the decoded reply of the server, a record or a dict.
+    :return: whether it acks a heartbeat, an ErrorMessage decodes to an error.
+    """
+    return (
+        bool(reply) and reply.get("type") == messages.MessageType.MESSAGE_TYPE_HEARTBEAT
+    )
+
+
+def peer_host(writer: asyncio.StreamWriter) -> Optional[str]:
+    peername = writer.get_extra_info("peername")
+    return peername[0] if peername else None
+
 
 class Client:
     def __init__(
@@ -15,6 +58,19 @@ class Client:
         client_ip: str,
         server_ip: str,
         server_port: int,
+        connection_pool: Optional[ConnectionPool] = None,
+        framed: bool = False,
+        pipelined: bool = False,
+        admission: Optional[AdmissionController] = None,
+        status_idle_timeout: float = 60.0,
+        metrics: Optional[ClientMetrics] = None,
+        request_timeout: float = 10.0,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        transport: str = STREAMS,
+        datagram_sender: Optional[DatagramHeartbeatSender] = None,
+        outbound_max_pending: int = 1024,
+        state: Optional[ClientState] = None,
+        channels: Optional[PipelinedChannels] = None,
     ):
         self.encoder_decoder = encoder_decoder
         self.client_identifier = client_identifier
@@ -22,19 +78,152 @@ class Client:
         self.client_ip = client_ip
         self.server_ip = server_ip
         self.server_port = server_port
-        self.heartbeat_count = 0
+        self._heartbeat_count = 0
+        self._status_snapshot: Optional[bytes] = None
+        # the heartbeat count survives restarts in the record of this client, if any
+        self.state = state
+        self._state_slot: Optional[int] = None
+        if state is not None:
+            self._state_slot = state.slot(client_identifier)
+            self._heartbeat_count = state.count(self._state_slot)
+        # length-prefixed frames when the server supports them, single read(1024) otherwise
+        self.frame_codec = FrameCodec(encoder_decoder) if framed else None
+        # STREAMS uses StreamReader/StreamWriter, PROTOCOL the MessageProtocol engine which
+        # parses messages straight out of its receive buffer
+        if transport not in (STREAMS, PROTOCOL):
+            raise ValueError(f"unknown transport {transport}")
+        self.transport = transport
+        self.connection_pool = (
+            connection_pool
+            if connection_pool is not None
+            else ConnectionPool(connect=connector(transport, framed))
+        )
+        if pipelined and not framed:
+            raise ValueError("pipelined requires framed messages")
+        self.pipelined = pipelined
+        self.metrics = metrics if metrics is not None else client_metrics()
+        # the pipelined connections, ClientFleet shares them between its clients. The most
+        # requests waiting to be written to one is outbound_max_pending.
+        self.channels = channels
+        if channels is None and framed:
+            self.channels = PipelinedChannels(
+                encoder_decoder,
+                self.connection_pool,
+                outbound_max_pending,
+                self.metrics,
+            )
+        # limits the status requests served, ClientFleet shares one between its clients
+        self.admission = admission if admission is not None else AdmissionController()
+        # set by ClientFleet to send heartbeats in batches together with other clients
+        self.coalescer: Optional[HeartbeatCoalescer] = None
+        # framed status connections stay open for further requests until idle this long
+        self.status_idle_timeout = status_idle_timeout
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._sessions: Set[asyncio.StreamWriter] = set()
+        # pipelined heartbeats waiting for their reply, see send_heartbeat()
+        self._heartbeats: Set[asyncio.Task] = set()
+        # the longest a message may take from connecting to reading its reply, 0 for no limit
+        self.request_timeout = request_timeout
+        # fails heartbeats at once while the server is down, ClientFleet shares one
+        self.circuit_breaker = (
+            circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        )
+        self.metrics.track_pool(self.connection_pool)
+        # when set, heartbeats are sent as UDP datagrams, status requests still use TCP.
+        # It is closed with the client, a sender shared by several clients can be closed
+        # more than once.
+        self.datagram_sender = datagram_sender
+        # every field of a heartbeat but request_id is the same on every tick
+        self.heartbeat_record = HeartBeat(
+            msg="I’m here!",
+            client_host=self.server_ip,
+            client_port=self.client_port,
+            identifier=self.client_identifier,
+        )
+
+    @property
+    def framed(self) -> bool:
+        return self.frame_codec is not None
+
+    @property
+    def heartbeat_count(self) -> int:
+        return self._heartbeat_count
+
+    @heartbeat_count.setter
+    def heartbeat_count(self, value: int) -> None:
+        self._heartbeat_count = value
+        self._status_snapshot = None
+        if self.state is not None:
+            self.state.set_count(self._state_slot, value)
+
+    @property
+    def last_ack(self) -> Optional[float]:
+        """
+        The time.time() the server last acked a heartbeat, None when unknown.
+        """
+        if self.state is None:
+            return None
+        return self.state.last_ack(self._state_slot)
+
+    def record_ack(self) -> None:
+        if self.state is not None:
+            self.state.set_last_ack(self._state_slot)
 
-    async def start_server(self) -> None:
+    def status_snapshot(self) -> bytes:
+        """
+        The serialized StatusMessage of this client without request_id. It is encoded once
+        after every change of heartbeat_count and reused by every status reply until then.
+        """
+        if self._status_snapshot is None:
+            self._status_snapshot = self.encoder_decoder.encode_status_record(
+                Status(
+                    message_count=self._heartbeat_count,
+                    identifier=self.client_identifier,
+                )
+            )
+        return self._status_snapshot
+
+    async def _read_message(self, reader: asyncio.StreamReader) -> bytes:
+        """
+        Read the next serialized message from the stream.
+        :param reader: StreamReader object to read data from.
+        :return: the serialized message, empty bytes when the peer closed the connection.
+        """
+        if isinstance(reader, MessageProtocol):
+            return await reader.read_message()
+        if self.frame_codec is None:
+            return await reader.read(1024)
+        try:
+            return await self.frame_codec.read_payload(reader)
+        except asyncio.IncompleteReadError:
+            return b""
+
+    async def start_server(self, reuse_port: bool = False) -> None:
         """
         This method starts a server to handle status message request from the server.
+        :param reuse_port: listen with SO_REUSEPORT, to share the port with other processes.
         """
-        log.info(f"start_server: starting a server with port {self.client_port}")
-        await asyncio.start_server(
-            self.handle_server_request,
-            self.client_ip,
-            self.client_port,
+        log.info("start_server: starting a server with port %s", self.client_port)
+        self.server = await self.listen(
+            self.handle_server_request, self.client_port, reuse_port
         )
 
+    async def listen(
+        self, handler: Callable, port: int, reuse_port: bool = False
+    ) -> asyncio.AbstractServer:
+        """
+        Start a listener on client_ip with this client's transport.
+        :param handler: called with (reader, writer) for every accepted connection.
+        :param port: the listening port.
+        :param reuse_port: listen with SO_REUSEPORT, to share the port with other processes.
+        """
+        kwargs = {"backlog": self.admission.backlog, "reuse_port": reuse_port or None}
+        if self.transport == PROTOCOL:
+            return await start_message_server(
+                handler, self.client_ip, port, self.framed, **kwargs
+            )
+        return await asyncio.start_server(handler, self.client_ip, port, **kwargs)
+
     async def handle_server_request(
         self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter
     ) -> None:
@@ -43,38 +232,155 @@ class Client:
         :param client_reader: StreamReader object to read data from client.
         :param client_writer: StreamWriter object to write data to client.
         """
+        await self.serve_status_session(client_reader, client_writer)
+
+    async def serve_status_session(
+        self,
+        client_reader: asyncio.StreamReader,
+        client_writer: asyncio.StreamWriter,
+        clients: Optional[Dict[int, "Client"]] = None,
+    ) -> None:
+        """
+        Serve the status requests of one connection and close it. A framed connection is
+        kept open for further requests until it is idle for status_idle_timeout seconds,
+        an unframed one carries a single request.
+        :param client_reader: StreamReader object to read data from client.
+        :param client_writer: StreamWriter object to write data to client.
+        :param clients: the clients of a shared listener by identifier, None to serve
+            only this client.
+        """
         log.info("handle_server_request: serving as a SERVER:")
+        peer = peer_host(client_writer)
+        reason = self.admission.try_admit(peer)
+        if reason is not None:
+            self.metrics.status_rejected.inc()
+            await self.reject_request(reason, client_reader, client_writer)
+            return
 
-        data = await client_reader.read(1024)
-        if not data:
-            log.error("socket closed: could not read server request")
-            raise Exception("socket closed: could not read server request")
+        self._sessions.add(client_writer)
+        served = 0
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(
+                        self._read_message(client_reader), self.status_idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    log.info("closing an idle status connection")
+                    break
+                if not data:
+                    if not served:
+                        log.error("socket closed: could not read server request")
+                    break
 
-        deserialized_dict = self.encoder_decoder.decode_status(binary_data=data)
-        log.info(f"received a request from server: {deserialized_dict}")
+                reason = self.admission.check_rate(peer) if served else None
+                served += 1
+                if reason is not None:
+                    self.metrics.status_rejected.inc()
+                    log.warning("rejecting a status request: %s", reason)
+                    await self._write_error(reason, client_writer)
+                    continue
 
-        status_msg = {
-            "type": messages.MessageType.MESSAGE_TYPE_STATUS,
-            "message_count": self.heartbeat_count,
-            "identifier": self.client_identifier,
-        }
+                request = self.encoder_decoder.decode_status_record(binary_data=data)
+                log.info("received a request from server: %s", request)
+                client = (
+                    self if clients is None else clients.get(request.get("identifier"))
+                )
+                if client is None:
+                    log.error("received a request for an unknown client: %s", request)
+                    break
+                start = time.perf_counter()
+                await self.admission.wait_for_heartbeats()
+                await asyncio.wait_for(
+                    client.reply_to_status_request(
+                        request, client_reader, client_writer
+                    ),
+                    self.status_idle_timeout,
+                )
+                self.metrics.status_requests.inc()
+                self.metrics.status_seconds.observe(time.perf_counter() - start)
+                if not self.framed:
+                    break
+        except asyncio.TimeoutError:
+            log.error("status connection closed: no ack from server")
+        except (ConnectionError, OSError) as e:
+            log.error("status connection closed: %s", e)
+        finally:
+            self._sessions.discard(client_writer)
+            self.admission.release()
+            client_writer.close()
+            try:
+                await client_writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
 
-        serialized_status = self.encoder_decoder.encode_status(msg_dict=status_msg)
-        log.info("Serialized Status message count sending to Server ")
-        client_writer.write(serialized_status)
+    async def _write_error(self, reason: str, client_writer: asyncio.StreamWriter):
+        codec = self.frame_codec or self.encoder_decoder
+        client_writer.write(
+            codec.encode_error(
+                {"type": messages.MessageType.MESSAGE_TYPE_ERROR, "msg": reason}
+            )
+        )
         await client_writer.drain()
 
-        # wait for ack message
-        data = await client_reader.read(1024)
+    async def reject_request(
+        self,
+        reason: str,
+        client_reader: asyncio.StreamReader,
+        client_writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Answer a status connection which was not admitted with an ErrorMessage and close it.
+        The request is read first, closing a socket with unread data resets the connection
+        and the server might never see the error.
+        :param reason: the error text.
+        :param client_reader: StreamReader object to read data from client.
+        :param client_writer: StreamWriter object to write data to client.
+        """
+        log.warning("rejecting a status request: %s", reason)
+        try:
+            await asyncio.wait_for(
+                self._read_message(client_reader), REJECT_READ_TIMEOUT
+            )
+            await self._write_error(reason, client_writer)
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        finally:
+            client_writer.close()
+
+    async def reply_to_status_request(
+        self,
+        request,
+        client_reader: asyncio.StreamReader,
+        client_writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Send this client's status for a decoded status request and wait for the ack.
+        :param request: the decoded status request from the server, a record or a dict.
+        :param client_reader: StreamReader object to read data from client.
+        :param client_writer: StreamWriter object to write data to client.
+        """
+        # the cached snapshot and the request_id are sent as they are, without copying
+        # them into one bytes
+        chunks = [self.status_snapshot()]
+        request_id = request.get("request_id", 0)
+        if request_id:
+            # request_id is the last field, so appending it keeps the canonical field order
+            chunks.append(STATUS_REQUEST_ID_TAG + encode_varint(request_id))
+        if self.framed:
+            chunks = frame_chunks(*chunks)
+        log.info("Serialized Status message count sending to Server ")
+        client_writer.writelines(chunks)
+        await drain_above(client_writer)
 
-        if data is None:
-            log.error("socket closed: could not read ack from server")
-            raise Exception("socket closed: could not read ack from server")
+        # wait for ack message
+        data = await self._read_message(client_reader)
 
-        deserialized_dict = self.encoder_decoder.decode_heartbeat(binary_data=data)
-        log.info(f"received ack message is {deserialized_dict}")
+        if not data:
+            raise ConnectionError("socket closed: could not read ack from server")
 
-        await client_writer.drain()
+        ack = self.encoder_decoder.decode_heartbeat_record(binary_data=data)
+        log.info("received ack message is %s", ack)
 
     async def send_to_server(self, server_ip: str, server_port: int, msg: dict) -> None:
         """
@@ -89,75 +395,304 @@ class Client:
         )
         log.info(reply_from_server)
 
-    async def send_heartbeat_message(self, interval: int, func, *args, **kwargs):
+    async def send_heartbeat_message(
+        self,
+        interval: int,
+        func,
+        *args,
+        jitter: float = 0.0,
+        missed: str = SKIP,
+        **kwargs,
+    ):
         """
         Run func every interval seconds. Runs forever.
+        Calls are fixed-rate, a slow call neither delays nor overlaps the next ones.
 
         :param interval: interval in seconds.
         :param func: function to use.
+        :param jitter: every tick is delayed by a random 0..jitter seconds.
+        :param missed: what to do with ticks that could not run on time, see scheduler.py.
+        """
+        scheduler = HeartbeatScheduler()
+        scheduler.schedule(
+            interval,
+            functools.partial(func, *args, **kwargs),
+            jitter=jitter,
+            missed=missed,
+        )
+        await scheduler.run()
+
+    async def _call_server(self, call: Awaitable):
+        """
+        Await a call to the server through the circuit breaker, within request_timeout.
+        :param call: the coroutine talking to the server, closed unawaited when the circuit
+            is open.
+        :return: the result of call.
+        """
+        try:
+            # a full local queue is not a failure of the server
+            with self.circuit_breaker.call(neutral=(OutboundQueueFull,)):
+                try:
+                    return await asyncio.wait_for(call, self.request_timeout or None)
+                except asyncio.TimeoutError:
+                    raise ConnectionError(
+                        f"no reply from the server within {self.request_timeout}s"
+                    ) from None
+        except CircuitOpenError:
+            call.close()
+            self.metrics.circuit_rejected.inc()
+            raise
+
+    async def _exchange(
+        self, server_ip: str, server_port: int, payload: bytes
+    ) -> bytes:
         """
+        Write one serialized message over a pooled connection and read the reply.
+        :param server_ip: server ip address
+        :param server_port: server port number
+        :param payload: the encoded message, framed when the client is framed.
+        :return: the serialized reply.
+        """
+        # a reused connection may have been closed by the server while it was idle,
+        # in that case the message is sent once more over a fresh connection.
         while True:
-            await asyncio.gather(
-                func(*args, **kwargs),
-                asyncio.sleep(interval),
-            )
+            conn = await self.connection_pool.acquire(server_ip, server_port)
+            try:
+                conn.writer.write(payload)
+                self.metrics.bytes_out.inc(len(payload))
+                await conn.writer.drain()
+                data = await self._read_message(conn.reader)
+            except (ConnectionError, OSError):
+                await self.connection_pool.release(conn, reuse=False)
+                if conn.reused:
+                    self.metrics.reconnects.inc()
+                    continue
+                raise
+            except BaseException:
+                await self.connection_pool.release(conn, reuse=False)
+                raise
 
-    async def send_a_message_to_server(
-        self, server_ip: str, server_port: int, msg: dict
-    ) -> dict:
+            if not data:
+                await self.connection_pool.release(conn, reuse=False)
+                if conn.reused:
+                    self.metrics.reconnects.inc()
+                    continue
+                log.error("socket closed: server did not reply")
+                raise ConnectionError("socket closed: server did not reply")
+
+            self.metrics.bytes_in.inc(len(data))
+            await self.connection_pool.release(conn)
+            return data
+
+    async def send_a_message_to_server(self, server_ip: str, server_port: int, msg):
         """
         Serves message sending to the server.
         :param server_ip: server ip address
         :param server_port: server port number
-        :param msg: the message to send
-        :return: return the message what server send a reply to the client. In failure return empty dictionary.
+        :param msg: the message to send, a dict or a HeartBeat record.
+        :return: return the message what server send a reply to the client, a record when msg
+            is a record. In failure return empty dictionary.
         """
-
+        metrics = self.metrics
+        metrics.sent.inc()
+        metrics.in_flight.inc()
+        start = time.perf_counter()
+        replied = False
         try:
+            codec = self.frame_codec or self.encoder_decoder
+            if isinstance(msg, HeartBeat):
+                serialized_bnr = codec.encode_heartbeat_record(msg)
+                decode = self.encoder_decoder.decode_heartbeat_record
+            else:
+                serialized_bnr = codec.encode_heartbeat(msg_dict=msg)
+                decode = self.encoder_decoder.decode_heartbeat
+            log.info("Client connected sending data %s", msg)
+            data = await self._call_server(
+                self._exchange(server_ip, server_port, serialized_bnr)
+            )
 
-            client_reader, client_writer = await asyncio.open_connection(
-                server_ip, server_port
+            deserialized_obj = decode(binary_data=data)
+            replied = is_heartbeat_ack(deserialized_obj)
+            log.info(
+                "deserialized heartbeat reply data from server is %s", deserialized_obj
             )
+            return deserialized_obj
+        except (ConnectionError, OSError) as e:
+            log.error("Connection error while sending heartbeat%s", e)
+            return {}
+        finally:
+            metrics.in_flight.dec()
+            if replied:
+                metrics.acked.inc()
+                metrics.heartbeat_seconds.observe(time.perf_counter() - start)
+            else:
+                metrics.failed.inc()
 
-            serialized_bnr = self.encoder_decoder.encode_heartbeat(msg_dict=msg)
+    async def send_datagram_heartbeat(self, msg: HeartBeat):
+        """
+        Send a heartbeat as a datagram through datagram_sender.
+        :param msg: the heartbeat record to send.
+        :return: the ack of the server, None when the sender does not wait for acks.
+            In failure return empty dictionary.
+        """
+        metrics = self.metrics
+        metrics.sent.inc()
+        metrics.in_flight.inc()
+        start = time.perf_counter()
+        replied = False
+        try:
+            ack, sent = await self._call_server(self.datagram_sender.send(msg))
+            metrics.bytes_out.inc(sent)
+            replied = ack is not None
+            return ack
+        except (ConnectionError, OSError) as e:
+            log.error("Connection error while sending heartbeat datagram %s", e)
+            metrics.failed.inc()
+            return {}
+        finally:
+            metrics.in_flight.dec()
+            if replied:
+                metrics.acked.inc()
+                metrics.heartbeat_seconds.observe(time.perf_counter() - start)
 
-            log.info(f"Client connected sending data {msg}")
+    async def send_heartbeat_batch(
+        self, server_ip: str, server_port: int, heartbeats: List[dict]
+    ) -> dict:
+        """
+        Send many heartbeats as one HeartBeatBatch message. Batches can outgrow a single
+        read(1024), so servers receiving large batches should use framed messages.
+        :param server_ip: server ip address
+        :param server_port: server port number
+        :param heartbeats: the heartbeat messages to send
+        :return: the decoded batch reply of the server. In failure return empty dictionary.
+        """
+        msg = {
+            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT_BATCH,
+            "heartbeats": heartbeats,
+        }
+        self.metrics.sent.inc(len(heartbeats))
+        try:
+            # large batches are encoded and decoded off the event loop
+            serialized_batch = await self.encoder_decoder.aencode_heartbeat_batch(msg)
+            if self.frame_codec is not None:
+                serialized_batch = encode_frame(serialized_batch)
+            log.info("Client sending a batch of %s heartbeats", len(heartbeats))
+            data = await self._call_server(
+                self._exchange(server_ip, server_port, serialized_batch)
+            )
 
-            client_writer.write(serialized_bnr)
-            await client_writer.drain()
+            deserialized_obj = await self.encoder_decoder.adecode_heartbeat_batch(data)
+            acks = len(deserialized_obj.get("heartbeats", []))
+            self.metrics.acked.inc(acks)
+            self.metrics.failed.inc(len(heartbeats) - acks)
+            log.info("server replied to the batch with %s acks", acks)
+            return deserialized_obj
+        except (ConnectionError, OSError) as e:
+            self.metrics.failed.inc(len(heartbeats))
+            log.error("Connection error while sending heartbeat batch%s", e)
+            return {}
 
-            data = await client_reader.read(1024)
-            if not data:
-                log.error("socket closed: server did not reply")
-                raise Exception("socket closed: server did not reply")
+    async def send_pipelined(
+        self, server_ip: str, server_port: int, msg, conflate: bool = False
+    ):
+        """
+        Send a message over a shared connection without waiting for earlier replies on it.
+        The server must echo the request_id of every message in its reply.
+        :param server_ip: server ip address
+        :param server_port: server port number
+        :param msg: the message to send, a dict or a HeartBeat record.
+        :param conflate: when msg is a HeartBeat which can not be written yet, let a later
+            heartbeat of the same identifier replace it, see OutboundQueue.
+        :return: the reply carrying the same request_id, a record when msg is a record.
+            In failure return empty dictionary.
+        """
+        if not self.framed:
+            raise ValueError("pipelining requires framed messages")
 
-            deserialized_obj = self.encoder_decoder.decode_heartbeat(binary_data=data)
-            log.info(
-                f"deserialized heartbeat reply data from server is {deserialized_obj}"
+        metrics = self.metrics
+        metrics.sent.inc()
+        metrics.in_flight.inc()
+        start = time.perf_counter()
+        replied = False
+        try:
+            reply = await self._call_server(
+                self.channels.send(server_ip, server_port, msg, conflate)
             )
-
-            client_writer.close()
-            return deserialized_obj
+            replied = is_heartbeat_ack(reply)
+            log.info("reply to pipelined request from server is %s", reply)
+            return reply if isinstance(msg, HeartBeat) else reply.to_dict()
         except (ConnectionError, OSError) as e:
-            log.error(f"Connection error while sending heartbeat{e}")
+            log.error("Connection error while sending pipelined request: %s", e)
             return {}
+        finally:
+            metrics.in_flight.dec()
+            if replied:
+                metrics.acked.inc()
+                metrics.heartbeat_seconds.observe(time.perf_counter() - start)
+            else:
+                metrics.failed.inc()
+
+    async def close(self) -> None:
+        """
+        Close the status listener and its connections, the pipelined connections, every
+        idle pooled connection and the datagram sender.
+        """
+        if self.server is not None:
+            self.server.close()
+        for writer in list(self._sessions):
+            writer.close()
+        if self.server is not None:
+            await self.server.wait_closed()
+            self.server = None
+        heartbeats = list(self._heartbeats)
+        for heartbeat in heartbeats:
+            heartbeat.cancel()
+        await asyncio.gather(*heartbeats, return_exceptions=True)
+        if self.channels is not None:
+            await self.channels.close()
+        await self.connection_pool.close()
+        if self.datagram_sender is not None:
+            self.datagram_sender.close()
 
     async def send_heartbeat(self) -> None:
         """
         This function is called by send_heartbeat_message(), see main.py with an interval.
         This function send message to server. Keeps heartbeat message count.
         """
-        log.info(f"sending heartbeat to: {self.server_ip}:{self.server_port}")
-        msg = {
-            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
-            "msg": "I’m here!",
-            "identifier": self.client_identifier,
-            "client_host": self.server_ip,
-            "client_port": self.client_port,
-        }
+        log.info("sending heartbeat to: %s:%s", self.server_ip, self.server_port)
+        msg = self.heartbeat_record
 
         self.heartbeat_count = self.heartbeat_count + 1
-        reply_from_server = await self.send_a_message_to_server(
-            server_ip=self.server_ip, server_port=self.server_port, msg=msg
-        )
+        if self.datagram_sender is not None:
+            with self.admission.sending_heartbeat():
+                reply_from_server = await self.send_datagram_heartbeat(msg)
+            if is_heartbeat_ack(reply_from_server):
+                self.record_ack()
+            log.info(reply_from_server)
+            return
+        if self.coalescer is not None:
+            await self.coalescer.add(msg)
+            return
+        if self.pipelined:
+            # the tick does not wait for the reply, like a batched heartbeat: a heartbeat
+            # still queued behind a slow server when the next tick comes is replaced by it
+            task = asyncio.ensure_future(self._send_pipelined_heartbeat(msg))
+            self._heartbeats.add(task)
+            task.add_done_callback(self._heartbeats.discard)
+            return
+        with self.admission.sending_heartbeat():
+            reply_from_server = await self.send_a_message_to_server(
+                server_ip=self.server_ip, server_port=self.server_port, msg=msg
+            )
+        if is_heartbeat_ack(reply_from_server):
+            self.record_ack()
+        log.info(reply_from_server)
+
+    async def _send_pipelined_heartbeat(self, msg: HeartBeat) -> None:
+        with self.admission.sending_heartbeat():
+            reply_from_server = await self.send_pipelined(
+                self.server_ip, self.server_port, msg, conflate=True
+            )
+        if is_heartbeat_ack(reply_from_server):
+            self.record_ack()
         log.info(reply_from_server)
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+from typing import Dict, List, MutableSequence, Optional
+
+from admission import AdmissionController
+from circuit_breaker import CircuitBreaker
+from client import Client
+from client_state import ClientState
+from connection_pool import ConnectionPool
+from encode_decode_executor import EncodeDecodeExecutor
+from heartbeat_coalescer import HeartbeatCoalescer
+from pipelined_channels import PipelinedChannels
+from protocol_transport import STREAMS, connector
+from udp_transport import DatagramHeartbeatSender
+from scheduler import SKIP, HeartbeatScheduler
+
+log = logging.getLogger("__main__." + __name__)
+
+
+class _SharedCountClients(dict):
+    """
+    The clients of a fleet by identifier, for a listener shared with other processes.
+    The heartbeat count of a client sent by another process is read before it is served.
+    """
+
+    def __init__(
+        self,
+        clients: Dict[int, Client],
+        first_identifier: int,
+        senders: range,
+        heartbeat_counts: MutableSequence[int],
+    ):
+        super().__init__(clients)
+        self.first_identifier = first_identifier
+        self.senders = senders
+        self.heartbeat_counts = heartbeat_counts
+
+    def get(self, identifier, default=None):
+        client = super().get(identifier, default)
+        if client is not None and identifier not in self.senders:
+            count = self.heartbeat_counts[identifier - self.first_identifier]
+            if client.heartbeat_count != count:
+                client.heartbeat_count = count
+        return client
+
+
+class ClientFleet:
+    """
+    Runs many client identities on one event loop. The clients share the encoder,
+    the connection pool, the pipelined connections and, by default, a single listening
+    socket.
+    """
+
+    def __init__(
+        self,
+        encoder_decoder: EncodeDecodeExecutor,
+        first_identifier: int,
+        count: int,
+        client_port: int,
+        client_ip: str,
+        server_ip: str,
+        server_port: int,
+        shared_listener: bool = True,
+        connection_pool: Optional[ConnectionPool] = None,
+        framed: bool = False,
+        pipelined: bool = False,
+        batch_size: int = 0,
+        batch_delay: float = 0.05,
+        admission: Optional[AdmissionController] = None,
+        status_idle_timeout: float = 60.0,
+        senders: Optional[range] = None,
+        heartbeat_counts: Optional[MutableSequence[int]] = None,
+        reuse_port: bool = False,
+        request_timeout: float = 10.0,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        transport: str = STREAMS,
+        datagram_sender: Optional[DatagramHeartbeatSender] = None,
+        outbound_max_pending: int = 1024,
+        state: Optional[ClientState] = None,
+    ):
+        """
+        :param first_identifier: identifiers run from first_identifier to first_identifier + count - 1.
+        :param count: the number of client identities.
+        :param client_port: the listening port. Without a shared listener every identity
+            listens on its own port, from client_port to client_port + count - 1.
+        :param shared_listener: serve status requests for every identity from one socket,
+            dispatching on the identifier of the request.
+        :param batch_size: when set, heartbeats of all identities are sent as HeartBeatBatch
+            messages of up to batch_size heartbeats, waiting at most batch_delay seconds.
+        :param admission: limits the status requests served by all identities together.
+        :param status_idle_timeout: see Client.
+        :param senders: the identifiers this fleet sends heartbeats for, all of them by default.
+            Status requests are served for every identity.
+        :param heartbeat_counts: heartbeat counts shared with fleets in other processes, indexed
+            by identifier - first_identifier. The counts of the senders are written to it, the
+            others are read from it when their status is requested.
+        :param reuse_port: listen with SO_REUSEPORT, so that fleets in several processes share
+            the listening port.
+        :param request_timeout: see Client.
+        :param circuit_breaker: shared by every identity, they all talk to the same server.
+        :param transport: see Client.
+        :param datagram_sender: sends the heartbeats of every identity as datagrams from one
+            socket, instead of batches or TCP messages. Closed with the fleet.
+        :param outbound_max_pending: see Client.
+        :param state: keeps the heartbeat count and last ack of the senders, see Client.
+        """
+        self.encoder_decoder = encoder_decoder
+        self.client_ip = client_ip
+        self.client_port = client_port
+        self.shared_listener = shared_listener
+        self.reuse_port = reuse_port
+        self.first_identifier = first_identifier
+        self.senders = (
+            senders
+            if senders is not None
+            else range(first_identifier, first_identifier + count)
+        )
+        self.heartbeat_counts = heartbeat_counts
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connection_pool = (
+            connection_pool
+            if connection_pool is not None
+            else ConnectionPool(connect=connector(transport, framed))
+        )
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.admission = admission if admission is not None else AdmissionController()
+        self.circuit_breaker = (
+            circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        )
+        # one pipelined connection per server for every identity, however many there are
+        self.channels: Optional[PipelinedChannels] = None
+        if pipelined:
+            self.channels = PipelinedChannels(
+                encoder_decoder, self.connection_pool, outbound_max_pending
+            )
+        self.clients: Dict[int, Client] = {}
+        for index in range(count):
+            identifier = first_identifier + index
+            self.clients[identifier] = Client(
+                encoder_decoder=encoder_decoder,
+                client_identifier=identifier,
+                client_port=client_port if shared_listener else client_port + index,
+                client_ip=client_ip,
+                server_ip=server_ip,
+                server_port=server_port,
+                connection_pool=self.connection_pool,
+                framed=framed,
+                pipelined=pipelined,
+                admission=self.admission,
+                status_idle_timeout=status_idle_timeout,
+                request_timeout=request_timeout,
+                circuit_breaker=self.circuit_breaker,
+                transport=transport,
+                datagram_sender=datagram_sender,
+                outbound_max_pending=outbound_max_pending,
+                # only the process sending an identity's heartbeats writes its record
+                state=state if identifier in self.senders else None,
+                channels=self.channels,
+            )
+            if heartbeat_counts is not None:
+                # a restarted process carries on counting where the previous one stopped
+                self.clients[identifier].heartbeat_count = heartbeat_counts[index]
+        self.status_clients: Dict[int, Client] = self.clients
+        if heartbeat_counts is not None:
+            self.status_clients = _SharedCountClients(
+                self.clients, first_identifier, self.senders, heartbeat_counts
+            )
+        self.datagram_sender = datagram_sender
+        self.coalescer: Optional[HeartbeatCoalescer] = None
+        if batch_size:
+            self.coalescer = HeartbeatCoalescer(
+                self._send_batch, max_batch=batch_size, max_delay=batch_delay
+            )
+            for client in self.clients.values():
+                client.coalescer = self.coalescer
+
+    @property
+    def heartbeat_count(self) -> int:
+        return sum(client.heartbeat_count for client in self.clients.values())
+
+    async def start_server(self) -> None:
+        """
+        Start the listener(s) which handle status message requests from the server.
+        """
+        if not self.shared_listener:
+            for client in self.clients.values():
+                await client.start_server(reuse_port=self.reuse_port)
+            return
+        log.info(
+            "start_server: starting a shared server with port %s for %s clients",
+            self.client_port,
+            len(self.clients),
+        )
+        # every client of the fleet listens with the same settings
+        any_client = next(iter(self.clients.values()))
+        self.server = await any_client.listen(
+            self.handle_server_request, self.client_port, self.reuse_port
+        )
+
+    async def handle_server_request(
+        self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Callback of the shared listener. Hands the request to the client it is addressed to.
+        :param client_reader: StreamReader object to read data from client.
+        :param client_writer: StreamWriter object to write data to client.
+        """
+        # every client of the fleet reads and decodes with the same settings
+        any_client = next(iter(self.clients.values()))
+        await any_client.serve_status_session(
+            client_reader, client_writer, self.status_clients
+        )
+
+    async def send_heartbeats(
+        self, interval: int, jitter: float = 0.0, missed: str = SKIP
+    ) -> None:
+        """
+        Send heartbeats for every sender forever from one scheduler. The first tick of each
+        client is staggered across one interval so that they do not all wake at the same instant.
+        :param interval: interval in seconds.
+        :param jitter: every tick is delayed by a random 0..jitter seconds.
+        :param missed: what to do with ticks that could not run on time, see scheduler.py.
+        """
+        scheduler = HeartbeatScheduler()
+        senders = [self.clients[identifier] for identifier in self.senders]
+        step = interval / len(senders)
+        for index, client in enumerate(senders):
+            if self.heartbeat_counts is None:
+                func, args = client.send_heartbeat, ()
+            else:
+                func, args = self._send_shared_heartbeat, (client,)
+            scheduler.schedule(
+                interval,
+                func,
+                *args,
+                start_delay=index * step,
+                jitter=jitter,
+                missed=missed,
+            )
+        await scheduler.run()
+
+    async def _send_shared_heartbeat(self, client: Client) -> None:
+        try:
+            await client.send_heartbeat()
+        finally:
+            self.heartbeat_counts[client.client_identifier - self.first_identifier] = (
+                client.heartbeat_count
+            )
+
+    async def _send_batch(self, heartbeats: List[dict]) -> None:
+        # every client of the fleet reports to the same server
+        any_client = next(iter(self.clients.values()))
+        with self.admission.sending_heartbeat():
+            reply = await any_client.send_heartbeat_batch(
+                self.server_ip, self.server_port, heartbeats
+            )
+        for ack in reply.get("heartbeats", []):
+            client = self.clients.get(ack.get("identifier"))
+            if client is not None:
+                client.record_ack()
+
+    async def close(self) -> None:
+        """
+        Flush waiting heartbeats, close the shared listener and the connections of every client.
+        """
+        if self.coalescer is not None:
+            await self.coalescer.flush()
+        if self.server is not None:
+            self.server.close()
+        # the connections of the shared listener are closed by the client serving them
+        for client in self.clients.values():
+            await client.close()
+        if self.server is not None:
+            await self.server.wait_closed()
+        if self.datagram_sender is not None:
+            self.datagram_sender.close()
@@ -0,0 +1,146 @@
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Optional
+
+log = logging.getLogger("__main__." + __name__)
+
+MAGIC = b"CLST"
+VERSION = 1
+# magic, version, record size, capacity, records in use; padded to one record
+HEADER = struct.Struct("<4sHHQQ8x")
+# in use flag, identifier, heartbeat count, time of the last ack (time.time(), 0 for never)
+RECORD = struct.Struct("<B7xqqd")
+COUNT = struct.Struct("<q")
+LAST_ACK = struct.Struct("<d")
+COUNT_OFFSET = 16
+LAST_ACK_OFFSET = 24
+USED = 1
+
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+def capacity_for(records: int) -> int:
+    """
+    The capacity of a file for this many identifiers: a power of two, at most half full.
+    """
+    capacity = 1024
+    while capacity < 2 * records:
+        capacity *= 2
+    return capacity
+
+
+class ClientState:
+    """
+    The heartbeat count and the time of the last ack of every client identifier, kept in a
+    memory-mapped file of fixed-size records so that a restarted client carries on counting.
+    Records are found by open addressing on the identifier and are updated in place: a
+    heartbeat costs one store into the mapping, the kernel writes it back to the file, only
+    close() waits for the disk. Opening a file reads its header and nothing else.
+    Processes may share a file when every identifier got its record before they start, see
+    slot(); they then update different records only.
+    """
+
+    def __init__(self, path: str, capacity: int = 1024):
+        """
+        :param path: the state file, created when missing.
+        :param capacity: the number of records of a new file, a power of two, see
+            capacity_for(). An existing file keeps its own capacity.
+        :raise ValueError: when the file is not a state file of this version.
+        """
+        if capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size == 0:
+                # a sparse file, pages are allocated when records are written
+                os.ftruncate(fd, RECORD.size * (capacity + 1))
+                self._map = mmap.mmap(fd, 0)
+                HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD.size, capacity, 0)
+                log.info("created the client state %s for %s records", path, capacity)
+            else:
+                self._map = mmap.mmap(fd, 0)
+        finally:
+            os.close(fd)
+        magic, version, record_size, capacity, _ = HEADER.unpack_from(
+            self._map[: HEADER.size].ljust(HEADER.size, b"\0")
+        )
+        if (magic, version, record_size) != (MAGIC, VERSION, RECORD.size) or len(
+            self._map
+        ) != RECORD.size * (capacity + 1):
+            self._map.close()
+            raise ValueError(f"{path} is not a client state file")
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self._shift = 64 - capacity.bit_length() + 1
+
+    def __len__(self) -> int:
+        return HEADER.unpack_from(self._map)[4]
+
+    def _offset(self, index: int) -> int:
+        return RECORD.size * (index + 1)
+
+    def slot(self, identifier: int) -> int:
+        """
+        The record of an identifier, added with a count of 0 when it has none.
+        :return: the index of the record, for the other methods.
+        :raise ValueError: when the file is full.
+        """
+        index = ((identifier * _GOLDEN) & 0xFFFFFFFFFFFFFFFF) >> self._shift
+        for _ in range(self.capacity):
+            offset = self._offset(index)
+            used, record_identifier, _, _ = RECORD.unpack_from(self._map, offset)
+            if not used:
+                # the flag is written last, a record is never seen half added
+                RECORD.pack_into(self._map, offset, 0, identifier, 0, 0.0)
+                self._map[offset] = USED
+                magic, version, record_size, capacity, records = HEADER.unpack_from(
+                    self._map
+                )
+                HEADER.pack_into(
+                    self._map, 0, magic, version, record_size, capacity, records + 1
+                )
+                return index
+            if record_identifier == identifier:
+                return index
+            index = (index + 1) & self._mask
+        raise ValueError(f"{self.path} is full: {self.capacity} records")
+
+    def count(self, index: int) -> int:
+        return COUNT.unpack_from(self._map, self._offset(index) + COUNT_OFFSET)[0]
+
+    def set_count(self, index: int, count: int) -> None:
+        COUNT.pack_into(self._map, self._offset(index) + COUNT_OFFSET, count)
+
+    def last_ack(self, index: int) -> Optional[float]:
+        """
+        :return: the time.time() of the last ack, None when no heartbeat was acked.
+        """
+        value = LAST_ACK.unpack_from(self._map, self._offset(index) + LAST_ACK_OFFSET)[
+            0
+        ]
+        return value or None
+
+    def set_last_ack(self, index: int, when: Optional[float] = None) -> None:
+        LAST_ACK.pack_into(
+            self._map,
+            self._offset(index) + LAST_ACK_OFFSET,
+            time.time() if when is None else when,
+        )
+
+    def flush(self) -> None:
+        """
+        Write the changed records to the disk and wait for it.
+        """
+        self._map.flush()
+
+    def close(self) -> None:
+        if not self._map.closed:
+            self._map.flush()
+            self._map.close()
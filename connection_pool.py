@@ -0,0 +1,197 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+log = logging.getLogger("__main__." + __name__)
+
+PoolKey = Tuple[str, int]
+
+
+class PooledConnection:
+    """
+    A reader/writer pair checked out of a ConnectionPool.
+    """
+
+    __slots__ = ("key", "reader", "writer", "last_used", "reused")
+
+    def __init__(
+        self, key: PoolKey, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+        self.reused = False
+
+    def is_healthy(self) -> bool:
+        """
+        A connection is healthy when neither side has closed it and the reader has not failed.
+        """
+        return (
+            not self.writer.is_closing()
+            and not self.reader.at_eof()
+            and self.reader.exception() is None
+        )
+
+
+class ConnectionPool:
+    """
+    Keeps TCP connections to servers open between messages, keyed by (server_ip, server_port).
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_idle_per_key: int = 10,
+        idle_timeout: float = 30.0,
+        connect: Optional[Callable[[str, int], Awaitable[tuple]]] = None,
+    ):
+        """
+        :param max_connections: the maximum number of connections checked out at the same time.
+        :param max_idle_per_key: the maximum number of idle connections kept per server.
+        :param idle_timeout: idle connections older than this many seconds are closed.
+        :param connect: opens a connection as (reader, writer), asyncio.open_connection
+            by default.
+        """
+        self.max_connections = max_connections
+        self.max_idle_per_key = max_idle_per_key
+        self.idle_timeout = idle_timeout
+        self.connect = connect if connect is not None else asyncio.open_connection
+        self._idle: Dict[PoolKey, Deque[PooledConnection]] = {}
+        self._limit: Optional[asyncio.Semaphore] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self.open_connections = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # created lazily so that the semaphore binds to the running loop
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.max_connections)
+        return self._limit
+
+    def _pop_idle(self, key: PoolKey) -> Optional[PooledConnection]:
+        idle = self._idle.get(key)
+        now = time.monotonic()
+        while idle:
+            conn = idle.pop()  # most recently used first
+            if conn.is_healthy() and now - conn.last_used < self.idle_timeout:
+                conn.reused = True
+                return conn
+            log.debug("discarding stale pooled connection to %s", key)
+            self._discard(conn)
+        return None
+
+    def _discard(self, conn: PooledConnection) -> None:
+        self.open_connections -= 1
+        conn.writer.close()
+
+    async def acquire(self, server_ip: str, server_port: int) -> PooledConnection:
+        """
+        Check out a connection to the server, reusing an idle one when possible.
+        :param server_ip: server ip address
+        :param server_port: server port number
+        :return: a connection which must be handed back with release().
+        """
+        await self._semaphore().acquire()
+        try:
+            key = (server_ip, server_port)
+            conn = self._pop_idle(key)
+            if conn is None:
+                reader, writer = await self.connect(server_ip, server_port)
+                self.open_connections += 1
+                conn = PooledConnection(key, reader, writer)
+            return conn
+        except BaseException:
+            self._semaphore().release()
+            raise
+
+    async def release(self, conn: PooledConnection, reuse: bool = True) -> None:
+        """
+        Hand a connection back to the pool.
+        :param conn: the connection returned by acquire().
+        :param reuse: keep the connection open for the next message. Set False after an error.
+        """
+        self._semaphore().release()
+        if reuse and conn.is_healthy():
+            conn.last_used = time.monotonic()
+            idle = self._idle.setdefault(conn.key, deque())
+            idle.append(conn)
+            # the reaper stops when nothing is idle, it is started again from here
+            self._start_reaper()
+            if len(idle) <= self.max_idle_per_key:
+                return
+            conn = idle.popleft()
+        self.open_connections -= 1
+        await self._close(conn)
+
+    @contextlib.asynccontextmanager
+    async def connection(
+        self, server_ip: str, server_port: int
+    ) -> AsyncIterator[PooledConnection]:
+        """
+        Context manager around acquire()/release(). The connection is dropped if the body raises.
+        """
+        conn = await self.acquire(server_ip, server_port)
+        try:
+            yield conn
+        except BaseException:
+            await self.release(conn, reuse=False)
+            raise
+        await self.release(conn)
+
+    def evict_idle(self) -> int:
+        """
+        Close idle connections which are unhealthy or older than idle_timeout.
+        :return: the number of closed connections.
+        """
+        now = time.monotonic()
+        evicted = 0
+        for key, idle in list(self._idle.items()):
+            keep = deque(
+                conn
+                for conn in idle
+                if conn.is_healthy() and now - conn.last_used < self.idle_timeout
+            )
+            for conn in idle:
+                if conn not in keep:
+                    self._discard(conn)
+                    evicted += 1
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        return evicted
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.ensure_future(self._reap())
+
+    async def _reap(self) -> None:
+        while self._idle:
+            await asyncio.sleep(self.idle_timeout / 2)
+            evicted = self.evict_idle()
+            if evicted:
+                log.debug("evicted %s idle connections", evicted)
+
+    async def close(self) -> None:
+        """
+        Close every idle connection and stop the eviction task.
+        """
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                self.open_connections -= 1
+                await self._close(conn)
+
+    @staticmethod
+    async def _close(conn: PooledConnection) -> None:
+        conn.writer.close()
+        try:
+            await conn.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
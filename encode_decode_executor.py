@@ -1,6 +1,147 @@
+import asyncio
+import concurrent.futures
+import multiprocessing
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from metrics import CODEC_BUCKETS, Histogram, Registry
+
+CODEC_METHODS = (
+    "encode_heartbeat",
+    "encode_status",
+    "decode_heartbeat",
+    "decode_status",
+    "encode_heartbeat_batch",
+    "decode_heartbeat_batch",
+    "encode_error",
+    "decode_error",
+    "encode_heartbeat_record",
+    "decode_heartbeat_record",
+    "encode_status_record",
+    "decode_status_record",
+)
+
+THREAD = "thread"
+PROCESS = "process"
+# roughly the encoded size of one heartbeat, to estimate the size of a batch to encode
+HEARTBEAT_SIZE = 40
+
+
+def make_codec_pool(
+    kind: Optional[str], workers: Optional[int] = None
+) -> Optional[concurrent.futures.Executor]:
+    """
+    :param kind: THREAD, PROCESS or None for no pool.
+    :param workers: the number of threads or processes, None for the default of the pool.
+    :return: a pool for EncodeDecodeExecutor, the caller shuts it down.
+    """
+    if not kind:
+        return None
+    if kind == THREAD:
+        return concurrent.futures.ThreadPoolExecutor(workers, "codec")
+    if kind == PROCESS:
+        # forking a process running an event loop and logging threads is not safe
+        return concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    raise ValueError(f"unknown codec pool {kind}")
+
+
+def _payload_size(value) -> int:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    heartbeats = value.get("heartbeats") if hasattr(value, "get") else None
+    return len(heartbeats) * HEARTBEAT_SIZE if heartbeats else 0
+
+
+# the backends of the pool threads or processes, an instance is never used by two threads
+_pool_backends = threading.local()
+
+
+def _pool_call(factory: Callable, name: str, value):
+    """
+    Run one method in a pool thread or process, on a backend of its own built once by
+    factory. Only the factory, a class, is sent to a process pool, not the backend with its
+    caches.
+    :return: the result and the seconds the call took.
+    """
+    backends = getattr(_pool_backends, "backends", None)
+    if backends is None:
+        backends = _pool_backends.backends = {}
+    backend = backends.get(factory)
+    if backend is None:
+        backend = backends[factory] = factory()
+    start = time.perf_counter()
+    result = getattr(backend, name)(value)
+    return result, time.perf_counter() - start
+
+
+def _timed(method, histogram: Histogram):
+    perf_counter = time.perf_counter
+    observe = histogram.observe
+
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            observe(perf_counter() - start)
+
+    return timed
+
+
 class EncodeDecodeExecutor:
-    def __init__(self, executor):
+    def __init__(
+        self,
+        executor,
+        registry: Optional[Registry] = None,
+        pool: Optional[concurrent.futures.Executor] = None,
+        offload_threshold: int = 16384,
+        backend_factory: Optional[Callable] = None,
+    ):
+        """
+        :param executor: the encoder/decoder to use.
+        :param registry: when given, the time of every call is recorded in a histogram per
+            method. Without it the methods are not wrapped and cost nothing extra.
+        :param pool: where the async methods (aencode_*, adecode_*) run messages of at least
+            offload_threshold bytes, see make_codec_pool. Without it they run inline.
+        :param offload_threshold: smaller messages are encoded and decoded inline, handing
+            them to the pool costs more than it saves.
+        :param backend_factory: builds the encoder/decoder of every pool thread or process,
+            the class of executor by default. The backends keep caches and buffers which are
+            not thread-safe, so executor itself is only used on the event loop.
+        """
         self.executor = executor
+        self.pool = pool
+        self.offload_threshold = offload_threshold
+        self.backend_factory = (
+            backend_factory if backend_factory is not None else type(executor)
+        )
+        self.histograms: Dict[str, Histogram] = {}
+        if registry is not None:
+            for name in CODEC_METHODS:
+                histogram = registry.histogram(
+                    "codec_seconds",
+                    "Time to encode or decode one message.",
+                    CODEC_BUCKETS,
+                    method=name,
+                )
+                self.histograms[name] = histogram
+                # the instance attribute shadows the method
+                setattr(self, name, _timed(getattr(self, name), histogram))
+
+    async def _offload(self, name: str, value):
+        if self.pool is None or _payload_size(value) < self.offload_threshold:
+            return getattr(self, name)(value)
+        result, seconds = await asyncio.get_running_loop().run_in_executor(
+            self.pool, _pool_call, self.backend_factory, name, value
+        )
+        # histograms are only touched on the event loop
+        histogram = self.histograms.get(name)
+        if histogram is not None:
+            histogram.observe(seconds)
+        return result
 
     def encode_heartbeat(self, msg_dict):
         return self.executor.encode_heartbeat(msg_dict)
@@ -13,3 +154,63 @@ class EncodeDecodeExecutor:
 
     def decode_status(self, binary_data):
         return self.executor.decode_status(binary_data)
+
+    def encode_heartbeat_batch(self, msg_dict):
+        return self.executor.encode_heartbeat_batch(msg_dict)
+
+    def decode_heartbeat_batch(self, binary_data):
+        return self.executor.decode_heartbeat_batch(binary_data)
+
+    def encode_error(self, msg_dict):
+        return self.executor.encode_error(msg_dict)
+
+    def decode_error(self, binary_data):
+        return self.executor.decode_error(binary_data)
+
+    def encode_heartbeat_record(self, record):
+        return self.executor.encode_heartbeat_record(record)
+
+    def decode_heartbeat_record(self, binary_data):
+        return self.executor.decode_heartbeat_record(binary_data)
+
+    def encode_status_record(self, record):
+        return self.executor.encode_status_record(record)
+
+    def decode_status_record(self, binary_data):
+        return self.executor.decode_status_record(binary_data)
+
+    async def aencode_heartbeat(self, msg_dict):
+        return await self._offload("encode_heartbeat", msg_dict)
+
+    async def aencode_status(self, msg_dict):
+        return await self._offload("encode_status", msg_dict)
+
+    async def adecode_heartbeat(self, binary_data):
+        return await self._offload("decode_heartbeat", binary_data)
+
+    async def adecode_status(self, binary_data):
+        return await self._offload("decode_status", binary_data)
+
+    async def aencode_heartbeat_batch(self, msg_dict):
+        return await self._offload("encode_heartbeat_batch", msg_dict)
+
+    async def adecode_heartbeat_batch(self, binary_data):
+        return await self._offload("decode_heartbeat_batch", binary_data)
+
+    async def aencode_error(self, msg_dict):
+        return await self._offload("encode_error", msg_dict)
+
+    async def adecode_error(self, binary_data):
+        return await self._offload("decode_error", binary_data)
+
+    async def aencode_heartbeat_record(self, record):
+        return await self._offload("encode_heartbeat_record", record)
+
+    async def adecode_heartbeat_record(self, binary_data):
+        return await self._offload("decode_heartbeat_record", binary_data)
+
+    async def aencode_status_record(self, record):
+        return await self._offload("encode_status_record", record)
+
+    async def adecode_status_record(self, binary_data):
+        return await self._offload("decode_status_record", binary_data)
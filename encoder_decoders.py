@@ -0,0 +1,9 @@
+from fast_wire_encoder_decoder import FastWireEncoderDecoder
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+
+# the backends by the names of ENCODER_DECODER; importing this module has no side effects,
+# unlike main.py which loads the .env file
+ENCODER_DECODERS = {
+    "protobuf": ProtobufEncoderDecoder,
+    "fast_wire": FastWireEncoderDecoder,
+}
@@ -0,0 +1,490 @@
+import logging
+import numbers
+
+from base_enc_dec import BaseEncoderDecoder
+from message_records import INCORRECT_DECODER, HeartBeat, Record, Status
+import messages_pb2 as messages
+
+log = logging.getLogger("__main__." + __name__)
+
+MAX_UINT32 = 0xFFFFFFFF
+MIN_INT32 = -0x80000000
+MAX_INT32 = 0x7FFFFFFF
+
+# wire types of the protobuf encoding
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+FIXED32 = 5
+
+# (field number << 3) | wire type of every field in messages.proto
+HEARTBEAT_TYPE = 0x08
+HEARTBEAT_MSG = 0x12
+HEARTBEAT_CLIENT_HOST = 0x1A
+HEARTBEAT_CLIENT_PORT = 0x20
+HEARTBEAT_IDENTIFIER = 0x28
+HEARTBEAT_REQUEST_ID = 0x30
+STATUS_TYPE = 0x08
+STATUS_MESSAGE_COUNT = 0x10
+STATUS_IDENTIFIER = 0x18
+STATUS_REQUEST_ID = 0x20
+BATCH_TYPE = 0x08
+BATCH_HEARTBEATS = 0x12
+ERROR_TYPE = 0x08
+ERROR_ERROR = 0x12
+
+_INT_TYPES = "(<class 'int'>,)"
+_STRING_TYPES = "(<class 'bytes'>, <class 'str'>)"
+
+
+class WireDecodeError(ValueError):
+    """
+    Raised when binary data is not a valid protobuf encoding.
+    """
+
+
+def _type_error(field: str, value, expected: str) -> TypeError:
+    # the same message as the protobuf runtime, so both backends report errors alike
+    return TypeError(
+        "Cannot set %s to %.1024r: %.1024r has type %s, but expected one of: %s"
+        % (field, value, value, type(value), expected)
+    )
+
+
+def _check_enum(field: str, value) -> int:
+    if not isinstance(value, numbers.Integral):
+        raise _type_error(field, value, _INT_TYPES)
+    if not MIN_INT32 <= value <= MAX_INT32:
+        raise ValueError("Value out of range: %d" % value)
+    return int(value)
+
+
+def _check_uint32(value) -> int:
+    value = int(value)
+    if not 0 <= value <= MAX_UINT32:
+        raise ValueError("Value out of range: %d" % value)
+    return value
+
+
+def _check_string(field: str, value) -> bytes:
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    if isinstance(value, bytes):
+        try:
+            value.decode("utf-8")
+        except UnicodeDecodeError:
+            raise ValueError(
+                "%.1024r has type bytes, but isn't valid UTF-8 encoding. Non-UTF-8 "
+                "strings must be converted to unicode objects before being added."
+                % value
+            )
+        return value
+    raise _type_error(field, value, _STRING_TYPES)
+
+
+def _put_varint(buffer: bytearray, pos: int, value: int) -> int:
+    if value < 0:
+        value += 1 << 64  # negative int32 values are sign extended to 10 bytes
+    while value > 0x7F:
+        buffer[pos] = (value & 0x7F) | 0x80
+        value >>= 7
+        pos += 1
+    buffer[pos] = value
+    return pos + 1
+
+
+def _put_bytes(buffer: bytearray, pos: int, tag: int, value: bytes) -> int:
+    buffer[pos] = tag
+    pos = _put_varint(buffer, pos + 1, len(value))
+    end = pos + len(value)
+    buffer[pos:end] = value
+    return end
+
+
+def _get_varint(data, pos: int, end: int):
+    result = 0
+    shift = 0
+    while True:
+        if pos >= end or shift > 63:
+            raise WireDecodeError("Truncated message.")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(data, pos: int, end: int):
+    """
+    Iterate over the (tag, value) pairs of an encoded message. Varint values are ints,
+    length-delimited values are (start, end) offsets into data, fixed width values are skipped.
+    """
+    while pos < end:
+        tag, pos = _get_varint(data, pos, end)
+        wire_type = tag & 0x07
+        if wire_type == VARINT:
+            value, pos = _get_varint(data, pos, end)
+        elif wire_type == LENGTH_DELIMITED:
+            length, pos = _get_varint(data, pos, end)
+            value = (pos, pos + length)
+            pos += length
+        elif wire_type == FIXED64:
+            pos += 8
+            value = None
+        elif wire_type == FIXED32:
+            pos += 4
+            value = None
+        else:
+            raise WireDecodeError("Unsupported wire type %d." % wire_type)
+        if pos > end:
+            raise WireDecodeError("Truncated message.")
+        yield tag, value
+
+
+def _enum_value(value: int) -> int:
+    value &= 0xFFFFFFFF
+    return value - (1 << 32) if value > MAX_INT32 else value
+
+
+class FastWireEncoderDecoder(BaseEncoderDecoder):
+    """
+    Encodes the messages of messages.proto straight into a reusable bytearray and decodes
+    them from a memoryview, without building generated message objects. The output is
+    byte-for-byte the same as ProtobufEncoderDecoder. Records are encoded and decoded
+    without going through the dict format.
+    An instance is not thread-safe: every encode writes into the same bytearray, so two
+    threads sharing one would return each other's bytes. Give each thread its own
+    instance, as EncodeDecodeExecutor does for its pool threads.
+    """
+
+    def __init__(self, buffer_size: int = 256):
+        """
+        :param buffer_size: the initial size of the reused encode buffer, it grows as needed.
+        """
+        self._buffer = bytearray(buffer_size)
+
+    def _reserve(self, size: int) -> bytearray:
+        if len(self._buffer) < size:
+            self._buffer = bytearray(max(size, 2 * len(self._buffer)))
+        return self._buffer
+
+    def _result(self, end: int) -> bytes:
+        with memoryview(self._buffer) as view:
+            return bytes(view[:end])
+
+    @staticmethod
+    def _heartbeat_fields(
+        msg_type, msg, client_host, identifier, client_port, request_id
+    ) -> tuple:
+        # validated in the same order as ProtobufEncoderDecoder sets the fields
+        return (
+            _check_enum("HeartBeatMessage.type", msg_type),
+            _check_string("HeartBeatMessage.msg", msg),
+            _check_string("HeartBeatMessage.client_host", client_host),
+            _check_uint32(identifier),
+            _check_uint32(client_port),
+            _check_uint32(request_id),
+        )
+
+    @classmethod
+    def _heartbeat_dict_fields(cls, msg_dict: dict) -> tuple:
+        return cls._heartbeat_fields(
+            msg_dict.get("type"),
+            msg_dict.get("msg"),
+            msg_dict.get("client_host"),
+            msg_dict.get("identifier"),
+            msg_dict.get("client_port"),
+            msg_dict.get("request_id", 0),
+        )
+
+    @staticmethod
+    def _put_heartbeat(buffer: bytearray, pos: int, fields: tuple) -> int:
+        msg_type, msg, client_host, identifier, client_port, request_id = fields
+        if msg_type:
+            buffer[pos] = HEARTBEAT_TYPE
+            pos = _put_varint(buffer, pos + 1, msg_type)
+        if msg:
+            pos = _put_bytes(buffer, pos, HEARTBEAT_MSG, msg)
+        if client_host:
+            pos = _put_bytes(buffer, pos, HEARTBEAT_CLIENT_HOST, client_host)
+        if client_port:
+            buffer[pos] = HEARTBEAT_CLIENT_PORT
+            pos = _put_varint(buffer, pos + 1, client_port)
+        if identifier:
+            buffer[pos] = HEARTBEAT_IDENTIFIER
+            pos = _put_varint(buffer, pos + 1, identifier)
+        if request_id:
+            buffer[pos] = HEARTBEAT_REQUEST_ID
+            pos = _put_varint(buffer, pos + 1, request_id)
+        return pos
+
+    @staticmethod
+    def _heartbeat_size(fields: tuple) -> int:
+        # upper bound: 1 byte tag and at most 10 bytes of varint per field
+        return len(fields[1]) + len(fields[2]) + 6 * 11
+
+    def _encode_error(self, e: Exception) -> bytes:
+        error = str(e).encode("utf-8")
+        buffer = self._reserve(len(error) + 16)
+        buffer[0] = ERROR_TYPE
+        buffer[1] = messages.MessageType.MESSAGE_TYPE_ERROR
+        return self._result(_put_bytes(buffer, 2, ERROR_ERROR, error))
+
+    def _encode_heartbeat_fields(self, fields: tuple) -> bytes:
+        buffer = self._reserve(self._heartbeat_size(fields))
+        return self._result(self._put_heartbeat(buffer, 0, fields))
+
+    def encode_heartbeat(self, msg_dict: dict) -> bytes:
+        """
+        Serialize a heartbeat message.
+        :param msg_dict: the data to serialize
+        :return: binary string format data.
+        """
+        try:
+            fields = self._heartbeat_dict_fields(msg_dict)
+        except TypeError as e:
+            log.error(f"encode_heartbeat exception happened")
+            return self._encode_error(e)
+        return self._encode_heartbeat_fields(fields)
+
+    def encode_heartbeat_record(self, record: HeartBeat) -> bytes:
+        """
+        Serialize a heartbeat record.
+        :param record: the data to serialize
+        :return: binary string format data.
+        """
+        try:
+            fields = self._heartbeat_fields(
+                record.type,
+                record.msg,
+                record.client_host,
+                record.identifier,
+                record.client_port,
+                record.request_id,
+            )
+        except TypeError as e:
+            log.error(f"encode_heartbeat exception happened")
+            return self._encode_error(e)
+        return self._encode_heartbeat_fields(fields)
+
+    def _encode_status(self, msg_type, message_count, identifier, request_id) -> bytes:
+        try:
+            msg_type = _check_enum("StatusMessage.type", msg_type)
+            identifier = _check_uint32(identifier)
+            message_count = _check_uint32(message_count)
+            request_id = _check_uint32(request_id)
+        except TypeError as e:
+            log.error(f"encode_status exception happened")
+            return self._encode_error(e)
+        buffer = self._reserve(4 * 11)
+        pos = 0
+        if msg_type:
+            buffer[pos] = STATUS_TYPE
+            pos = _put_varint(buffer, pos + 1, msg_type)
+        if message_count:
+            buffer[pos] = STATUS_MESSAGE_COUNT
+            pos = _put_varint(buffer, pos + 1, message_count)
+        if identifier:
+            buffer[pos] = STATUS_IDENTIFIER
+            pos = _put_varint(buffer, pos + 1, identifier)
+        if request_id:
+            buffer[pos] = STATUS_REQUEST_ID
+            pos = _put_varint(buffer, pos + 1, request_id)
+        return self._result(pos)
+
+    def encode_status(self, msg_dict: dict) -> bytes:
+        """
+        Serialize a status message.
+        :param msg_dict: the data to serialize
+        :return: binary string format data.
+        """
+        return self._encode_status(
+            msg_dict.get("type"),
+            msg_dict.get("message_count"),
+            msg_dict.get("identifier"),
+            msg_dict.get("request_id", 0),
+        )
+
+    def encode_status_record(self, record: Status) -> bytes:
+        """
+        Serialize a status record.
+        :param record: the data to serialize
+        :return: binary string format data.
+        """
+        return self._encode_status(*record)
+
+    def encode_heartbeat_batch(self, msg_dict: dict) -> bytes:
+        """
+        Serialize many heartbeat messages as one HeartBeatBatch.
+        :param msg_dict: the data to serialize, the heartbeats are a list under "heartbeats".
+        :return: binary string format data.
+        """
+        try:
+            msg_type = _check_enum("HeartBeatBatch.type", msg_dict.get("type"))
+            heartbeats = [
+                self._heartbeat_dict_fields(heartbeat)
+                for heartbeat in msg_dict.get("heartbeats")
+            ]
+        except TypeError as e:
+            log.error(f"encode_heartbeat_batch exception happened")
+            return self._encode_error(e)
+        buffer = self._reserve(
+            11 + sum(self._heartbeat_size(fields) + 6 for fields in heartbeats)
+        )
+        pos = 0
+        if msg_type:
+            buffer[pos] = BATCH_TYPE
+            pos = _put_varint(buffer, pos + 1, msg_type)
+        for fields in heartbeats:
+            buffer[pos] = BATCH_HEARTBEATS
+            # write the body after a one byte length and move it when the length is longer
+            start = pos + 2
+            end = self._put_heartbeat(buffer, start, fields)
+            length = end - start
+            if length < 0x80:
+                buffer[pos + 1] = length
+                pos = end
+            else:
+                body = bytes(buffer[start:end])
+                pos = _put_varint(buffer, pos + 1, length)
+                buffer[pos : pos + length] = body
+                pos += length
+        return self._result(pos)
+
+    @staticmethod
+    def _parse_heartbeat(data, pos: int, end: int) -> HeartBeat:
+        msg_type = 0
+        msg = client_host = ""
+        identifier = client_port = request_id = 0
+        for tag, value in _fields(data, pos, end):
+            if tag == HEARTBEAT_TYPE:
+                msg_type = _enum_value(value)
+            elif tag == HEARTBEAT_MSG:
+                msg = str(data[value[0] : value[1]], "utf-8")
+            elif tag == HEARTBEAT_CLIENT_HOST:
+                client_host = str(data[value[0] : value[1]], "utf-8")
+            elif tag == HEARTBEAT_CLIENT_PORT:
+                client_port = value & MAX_UINT32
+            elif tag == HEARTBEAT_IDENTIFIER:
+                identifier = value & MAX_UINT32
+            elif tag == HEARTBEAT_REQUEST_ID:
+                request_id = value & MAX_UINT32
+        return HeartBeat(
+            msg_type, msg, client_host, client_port, identifier, request_id
+        )
+
+    @staticmethod
+    def _parse_status(data) -> Status:
+        msg_type = message_count = identifier = request_id = 0
+        for tag, value in _fields(data, 0, len(data)):
+            if tag == STATUS_TYPE:
+                msg_type = _enum_value(value)
+            elif tag == STATUS_MESSAGE_COUNT:
+                message_count = value & MAX_UINT32
+            elif tag == STATUS_IDENTIFIER:
+                identifier = value & MAX_UINT32
+            elif tag == STATUS_REQUEST_ID:
+                request_id = value & MAX_UINT32
+        return Status(msg_type, message_count, identifier, request_id)
+
+    def decode_heartbeat_record(self, binary_data: bytes) -> Record:
+        """
+        Deserialize binary data for a heartbeat message.
+        :param binary_data: the data to deserialize.
+        :return: a HeartBeat record, an Error record for any other message.
+        """
+        with memoryview(binary_data) as data:
+            record = self._parse_heartbeat(data, 0, len(data))
+        if record.type == messages.MessageType.MESSAGE_TYPE_HEARTBEAT:
+            return record
+        log.error(f"decode_heartbeat exception happened")
+        return INCORRECT_DECODER
+
+    def decode_heartbeat(self, binary_data: bytes) -> dict:
+        """
+        Deserialize binary data for a heartbeat message.
+        :param binary_data: the data to deserialize.
+        :return: a decoded dict format message. request_id is only present when it is set.
+        """
+        return self.decode_heartbeat_record(binary_data).to_dict()
+
+    def decode_status_record(self, binary_data: bytes) -> Record:
+        """
+        Deserialize binary data for a status message.
+        :param binary_data: the data to deserialize.
+        :return: a Status record, an Error record for any other message.
+        """
+        with memoryview(binary_data) as data:
+            record = self._parse_status(data)
+        if record.type == messages.MessageType.MESSAGE_TYPE_STATUS:
+            return record
+        log.error(f"decode_status exception happened")
+        return INCORRECT_DECODER
+
+    def decode_status(self, binary_data: bytes) -> dict:
+        """
+        Deserialize binary data for a status message.
+        :param binary_data: the data to deserialize.
+        :return: a decoded dict format message. request_id is only present when it is set.
+        """
+        return self.decode_status_record(binary_data).to_dict()
+
+    def encode_error(self, msg_dict: dict) -> bytes:
+        """
+        Serialize an error message.
+        :param msg_dict: the data to serialize, the error text is under "msg".
+        :return: binary string format data.
+        """
+        try:
+            msg_type = _check_enum("ErrorMessage.type", msg_dict.get("type"))
+            error = _check_string("ErrorMessage.error", msg_dict.get("msg"))
+        except TypeError as e:
+            log.error(f"encode_error exception happened")
+            return self._encode_error(e)
+        buffer = self._reserve(len(error) + 22)
+        pos = 0
+        if msg_type:
+            buffer[pos] = ERROR_TYPE
+            pos = _put_varint(buffer, pos + 1, msg_type)
+        if error:
+            pos = _put_bytes(buffer, pos, ERROR_ERROR, error)
+        return self._result(pos)
+
+    def decode_error(self, binary_data: bytes) -> dict:
+        """
+        Deserialize binary data for an error message.
+        :param binary_data: the data to deserialize.
+        :return: a decoded dict format message with the error text under "msg".
+        """
+        msg_type = 0
+        error = ""
+        with memoryview(binary_data) as data:
+            for tag, value in _fields(data, 0, len(data)):
+                if tag == ERROR_TYPE:
+                    msg_type = _enum_value(value)
+                elif tag == ERROR_ERROR:
+                    error = str(data[value[0] : value[1]], "utf-8")
+        if msg_type != messages.MessageType.MESSAGE_TYPE_ERROR:
+            log.error(f"decode_error exception happened")
+            return INCORRECT_DECODER.to_dict()
+        return {"type": msg_type, "msg": error}
+
+    def decode_heartbeat_batch(self, binary_data: bytes) -> dict:
+        """
+        Deserialize binary data for a HeartBeatBatch message.
+        :param binary_data: the data to deserialize.
+        :return: a decoded dict format message with the heartbeats as a list of dicts.
+        """
+        msg_type = 0
+        heartbeats = []
+        with memoryview(binary_data) as data:
+            for tag, value in _fields(data, 0, len(data)):
+                if tag == BATCH_TYPE:
+                    msg_type = _enum_value(value)
+                elif tag == BATCH_HEARTBEATS:
+                    heartbeats.append(self._parse_heartbeat(data, *value).to_dict())
+        if msg_type != messages.MessageType.MESSAGE_TYPE_HEARTBEAT_BATCH:
+            log.error(f"decode_heartbeat_batch exception happened")
+            return INCORRECT_DECODER.to_dict()
+        return {"type": msg_type, "heartbeats": heartbeats}
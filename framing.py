@@ -0,0 +1,119 @@
+import asyncio
+import struct
+from typing import List
+
+from encode_decode_executor import EncodeDecodeExecutor
+
+# every frame is a 4 byte big-endian payload length followed by the payload itself
+HEADER = struct.Struct("!I")
+HEADER_SIZE = HEADER.size
+MAX_FRAME_SIZE = 1024 * 1024
+
+
+class FrameError(ConnectionError):
+    """
+    Raised when a frame header announces a payload larger than the allowed maximum.
+    The stream can not be read any further, so it is a connection error.
+    """
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """
+    Prefix a serialized message with its length.
+    :param payload: the serialized message.
+    :return: the frame to write to the socket.
+    """
+    return HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(
+    reader: asyncio.StreamReader, max_frame_size: int = MAX_FRAME_SIZE
+) -> bytes:
+    """
+    Read exactly one frame from the stream, however the bytes were split into TCP segments.
+    :param reader: StreamReader object to read data from.
+    :param max_frame_size: the largest accepted payload.
+    :return: the payload without the length prefix.
+    :raises asyncio.IncompleteReadError: when the peer closes the connection mid-frame.
+    """
+    header = await reader.readexactly(HEADER_SIZE)
+    (length,) = HEADER.unpack(header)
+    if length > max_frame_size:
+        raise FrameError(f"frame of {length} bytes exceeds {max_frame_size} bytes")
+    return await reader.readexactly(length)
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for callers which receive raw chunks instead of owning a StreamReader.
+    """
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """
+        Append received bytes and return every frame which is now complete.
+        :param data: bytes received from the socket.
+        :return: the payloads of the completed frames, in order.
+        """
+        self._buffer += data
+        frames = []
+        offset = 0
+        end = len(self._buffer)
+        with memoryview(self._buffer) as view:
+            while end - offset >= HEADER_SIZE:
+                (length,) = HEADER.unpack_from(view, offset)
+                if length > self.max_frame_size:
+                    raise FrameError(
+                        f"frame of {length} bytes exceeds {self.max_frame_size} bytes"
+                    )
+                start = offset + HEADER_SIZE
+                if end - start < length:
+                    break
+                frames.append(bytes(view[start : start + length]))
+                offset = start + length
+        del self._buffer[:offset]
+        return frames
+
+
+class FrameCodec:
+    """
+    Wraps an EncodeDecodeExecutor so that every encoded message is written as one frame.
+    """
+
+    def __init__(
+        self,
+        encoder_decoder: EncodeDecodeExecutor,
+        max_frame_size: int = MAX_FRAME_SIZE,
+    ):
+        self.encoder_decoder = encoder_decoder
+        self.max_frame_size = max_frame_size
+
+    def encode_heartbeat(self, msg_dict: dict) -> bytes:
+        return encode_frame(self.encoder_decoder.encode_heartbeat(msg_dict))
+
+    def encode_status(self, msg_dict: dict) -> bytes:
+        return encode_frame(self.encoder_decoder.encode_status(msg_dict))
+
+    def encode_heartbeat_record(self, record) -> bytes:
+        return encode_frame(self.encoder_decoder.encode_heartbeat_record(record))
+
+    def encode_status_record(self, record) -> bytes:
+        return encode_frame(self.encoder_decoder.encode_status_record(record))
+
+    def encode_error(self, msg_dict: dict) -> bytes:
+        return encode_frame(self.encoder_decoder.encode_error(msg_dict))
+
+    def encode_heartbeat_batch(self, msg_dict: dict) -> bytes:
+        return encode_frame(self.encoder_decoder.encode_heartbeat_batch(msg_dict))
+
+    async def read_payload(self, reader: asyncio.StreamReader) -> bytes:
+        return await read_frame(reader, self.max_frame_size)
+
+    async def read_heartbeat(self, reader: asyncio.StreamReader) -> dict:
+        return self.encoder_decoder.decode_heartbeat(await self.read_payload(reader))
+
+    async def read_status(self, reader: asyncio.StreamReader) -> dict:
+        return self.encoder_decoder.decode_status(await self.read_payload(reader))
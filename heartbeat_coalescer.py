@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Set
+
+log = logging.getLogger("__main__." + __name__)
+
+
+class HeartbeatCoalescer:
+    """
+    Collects heartbeats of many clients and sends them as one HeartBeatBatch,
+    when max_batch heartbeats are waiting or max_delay seconds after the first one.
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[[List[dict]], Awaitable],
+        max_batch: int = 100,
+        max_delay: float = 0.05,
+    ):
+        """
+        :param send_batch: coroutine function which sends a list of heartbeat dicts.
+        :param max_batch: flush as soon as this many heartbeats are waiting.
+        :param max_delay: flush at the latest this many seconds after the first heartbeat.
+        """
+        self.send_batch = send_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: List[dict] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # the batches sent when max_delay ran out, the loop only keeps weak references
+        self._flushes: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def add(self, msg_dict: dict) -> None:
+        """
+        Queue a heartbeat. The caller which fills the batch also sends it.
+        :param msg_dict: the heartbeat to send.
+        """
+        self._pending.append(msg_dict)
+        if len(self._pending) >= self.max_batch:
+            await self._send_pending()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.max_delay, self._flush_later)
+
+    def _flush_later(self) -> None:
+        self._timer = None
+        flush = asyncio.ensure_future(self._send_pending())
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flushes.discard)
+
+    async def flush(self) -> None:
+        """
+        Send every waiting heartbeat now and wait for the batches already being sent.
+        """
+        await self._send_pending()
+        if self._flushes:
+            await asyncio.gather(*self._flushes)
+
+    async def _send_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            await self.send_batch(batch)
+        except Exception as e:
+            log.error("sending a batch of %s heartbeats failed: %s", len(batch), e)
@@ -0,0 +1,141 @@
+import math
+from typing import Dict, Iterable, List
+
+
+class LatencyHistogram:
+    """
+    A histogram of integer values, laid out like HdrHistogram: every power of two range is
+    split into the same number of linear sub-buckets, so every recorded value is kept with
+    the requested number of significant figures whatever its magnitude.
+    Recording is a few integer operations and the memory used is fixed.
+    """
+
+    def __init__(
+        self,
+        lowest: int = 1,
+        highest: int = 3600 * 1000 * 1000,
+        significant_figures: int = 2,
+    ):
+        """
+        :param lowest: the smallest value told apart from 0, 1 or more.
+        :param highest: the largest value kept, larger values are recorded as highest.
+        :param significant_figures: decimal precision of the values, 1 to 5.
+        """
+        if lowest < 1 or highest < 2 * lowest:
+            raise ValueError("highest must be at least twice lowest, lowest at least 1")
+        if not 1 <= significant_figures <= 5:
+            raise ValueError("significant_figures must be between 1 and 5")
+        self.lowest = lowest
+        self.highest = highest
+        self.significant_figures = significant_figures
+
+        largest_single_unit = 2 * 10**significant_figures
+        self._sub_bucket_count = 1 << math.ceil(math.log2(largest_single_unit))
+        self._sub_bucket_half_count = self._sub_bucket_count // 2
+        self._sub_bucket_half_count_magnitude = (
+            self._sub_bucket_half_count.bit_length() - 1
+        )
+        self._unit_magnitude = lowest.bit_length() - 1
+        self._sub_bucket_mask = (self._sub_bucket_count - 1) << self._unit_magnitude
+
+        bucket_count = 1
+        smallest_untrackable = self._sub_bucket_count << self._unit_magnitude
+        while smallest_untrackable <= highest:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self._counts = [0] * ((bucket_count + 1) * self._sub_bucket_half_count)
+        self.total_count = 0
+        self.min = 0
+        self.max = 0
+        self._sum = 0
+
+    def _index(self, value: int) -> int:
+        bucket_index = (value | self._sub_bucket_mask).bit_length() - (
+            self._unit_magnitude + self._sub_bucket_half_count_magnitude + 1
+        )
+        sub_bucket_index = value >> (bucket_index + self._unit_magnitude)
+        return ((bucket_index + 1) << self._sub_bucket_half_count_magnitude) + (
+            sub_bucket_index - self._sub_bucket_half_count
+        )
+
+    def _value_range(self, index: int):
+        # the lowest value counted at index and the size of the range counted there
+        bucket_index = (index >> self._sub_bucket_half_count_magnitude) - 1
+        sub_bucket_index = (index & (self._sub_bucket_half_count - 1)) + (
+            self._sub_bucket_half_count
+        )
+        if bucket_index < 0:
+            sub_bucket_index -= self._sub_bucket_half_count
+            bucket_index = 0
+        shift = bucket_index + self._unit_magnitude
+        return sub_bucket_index << shift, 1 << shift
+
+    def record(self, value: float, count: int = 1) -> None:
+        """
+        :param value: the value to record, rounded to an integer and capped at highest.
+        :param count: how many times the value was seen.
+        """
+        value = min(max(int(round(value)), 0), self.highest)
+        self._counts[self._index(value)] += count
+        if self.total_count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.total_count += count
+        self._sum += value * count
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """
+        Add the values of a histogram created with the same parameters.
+        """
+        if len(other._counts) != len(self._counts) or other.lowest != self.lowest:
+            raise ValueError("only histograms with the same parameters can be merged")
+        if not other.total_count:
+            return
+        for index, count in enumerate(other._counts):
+            if count:
+                self._counts[index] += count
+        if self.total_count == 0 or other.min < self.min:
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        self.total_count += other.total_count
+        self._sum += other._sum
+
+    def reset(self) -> None:
+        self._counts = [0] * len(self._counts)
+        self.total_count = self.min = self.max = self._sum = 0
+
+    @property
+    def mean(self) -> float:
+        return self._sum / self.total_count if self.total_count else 0.0
+
+    def value_at_percentile(self, percentile: float) -> int:
+        """
+        :param percentile: 0 to 100.
+        :return: the highest value equivalent to the recorded value at that percentile.
+        """
+        if not self.total_count:
+            return 0
+        wanted = max(1, math.ceil(percentile / 100 * self.total_count))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= wanted:
+                low, size = self._value_range(index)
+                return min(low + size - 1, self.max)
+        return self.max
+
+    def percentiles(
+        self, percentiles: Iterable[float] = (50, 90, 99, 99.9)
+    ) -> Dict[float, int]:
+        return {p: self.value_at_percentile(p) for p in percentiles}
+
+    def recorded_values(self) -> List[tuple]:
+        """
+        :return: (lowest value, count) for every non empty bucket, in order.
+        """
+        return [
+            (self._value_range(index)[0], count)
+            for index, count in enumerate(self._counts)
+            if count
+        ]
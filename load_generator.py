@@ -0,0 +1,333 @@
+"""
+Open-loop heartbeat load generator, to find the rate at which one client host saturates.
+
+    python load_generator.py --rate 1000 --max-rate 20000 --steps 10 --duration 60 \
+        --identities 10 --max-identities 1000 --connections 10 --max-connections 200
+
+Heartbeats are started on a fixed schedule whether or not earlier ones were answered, and
+their latency is measured from the time they were due, so queueing in the client is not
+hidden by a slower send rate (coordinated omission). Every second a line with the
+throughput, latency percentiles and error counts is printed.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from typing import Dict, List, Optional
+
+from client import Client
+from connection_pool import ConnectionPool
+from encode_decode_executor import EncodeDecodeExecutor
+from histogram import LatencyHistogram
+from encoder_decoders import ENCODER_DECODERS
+from pipelined_channels import PipelinedChannels
+import messages_pb2 as messages
+from stand_in_server import StandInServer
+
+log = logging.getLogger("__main__." + __name__)
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class SecondStats:
+    """
+    What happened during one second of the run. Latencies are in microseconds.
+    """
+
+    __slots__ = ("sent", "ok", "errors", "dropped", "histogram")
+
+    def __init__(self):
+        self.sent = 0
+        self.ok = 0
+        self.errors = 0
+        # due while max_in_flight heartbeats were outstanding, so never started
+        self.dropped = 0
+        self.histogram = LatencyHistogram()
+
+    def to_dict(self) -> dict:
+        return {
+            "sent": self.sent,
+            "ok": self.ok,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "latency_us": {
+                str(p): v for p, v in self.histogram.percentiles(PERCENTILES).items()
+            },
+            "latency_max_us": self.histogram.max,
+        }
+
+
+class Step:
+    """
+    One stage of the ramp: rate heartbeats per second spread over identities clients
+    which share connections pooled connections.
+    """
+
+    __slots__ = ("rate", "identities", "connections", "duration")
+
+    def __init__(self, rate: float, identities: int, connections: int, duration: float):
+        self.rate = rate
+        self.identities = identities
+        self.connections = connections
+        self.duration = duration
+
+
+def ramp(args) -> List[Step]:
+    steps = max(1, args.steps)
+
+    def at(start, end, i):
+        if end is None or steps == 1:
+            return start
+        return start + (end - start) * i / (steps - 1)
+
+    return [
+        Step(
+            at(args.rate, args.max_rate, i),
+            int(round(at(args.identities, args.max_identities, i))),
+            int(round(at(args.connections, args.max_connections, i))),
+            args.duration / steps,
+        )
+        for i in range(steps)
+    ]
+
+
+class LoadGenerator:
+    def __init__(
+        self,
+        encoder_decoder: EncodeDecodeExecutor,
+        server_ip: str,
+        server_port: int,
+        first_identifier: int = 1234,
+        framed: bool = False,
+        pipelined: bool = False,
+        max_in_flight: int = 10000,
+        report=print,
+    ):
+        """
+        :param encoder_decoder: the encoder/decoder of the clients.
+        :param server_ip: server ip address
+        :param server_port: server port number
+        :param first_identifier: the clients are first_identifier, first_identifier + 1, ...
+        :param framed: see Client.
+        :param pipelined: see Client. The identities of a step then share one connection.
+        :param max_in_flight: heartbeats due while this many are outstanding are dropped.
+        :param report: called with a line of text every second.
+        """
+        self.encoder_decoder = encoder_decoder
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.first_identifier = first_identifier
+        self.framed = framed
+        self.pipelined = pipelined
+        self.max_in_flight = max_in_flight
+        self.report = report
+        self.seconds: Dict[int, SecondStats] = {}
+        self.total = LatencyHistogram()
+        self._in_flight = 0
+        self._start = 0.0
+
+    def _second(self, now: float) -> SecondStats:
+        second = int(now - self._start)
+        stats = self.seconds.get(second)
+        if stats is None:
+            stats = self.seconds[second] = SecondStats()
+        return stats
+
+    async def _send(self, client: Client, due: float) -> None:
+        loop = asyncio.get_running_loop()
+        client.heartbeat_count += 1
+        try:
+            if self.pipelined:
+                reply = await client.send_pipelined(
+                    self.server_ip, self.server_port, client.heartbeat_record
+                )
+            else:
+                reply = await client.send_a_message_to_server(
+                    self.server_ip, self.server_port, client.heartbeat_record
+                )
+            ok = (
+                bool(reply)
+                and reply.type == messages.MessageType.MESSAGE_TYPE_HEARTBEAT
+            )
+        except Exception as e:
+            log.debug("heartbeat failed: %s", e)
+            ok = False
+        finally:
+            self._in_flight -= 1
+
+        now = loop.time()
+        stats = self._second(now)
+        if ok:
+            stats.ok += 1
+            latency = (now - due) * 1000000
+            stats.histogram.record(latency)
+            self.total.record(latency)
+        else:
+            stats.errors += 1
+
+    async def run_step(self, step: Step) -> None:
+        pool = ConnectionPool(max_connections=step.connections)
+        # pipelined identities share one connection, they would otherwise each hold one
+        # and starve the pool when there are more identities than connections
+        channels = (
+            PipelinedChannels(self.encoder_decoder, pool) if self.pipelined else None
+        )
+        clients = [
+            Client(
+                encoder_decoder=self.encoder_decoder,
+                client_identifier=self.first_identifier + i,
+                client_port=0,
+                client_ip="0.0.0.0",
+                server_ip=self.server_ip,
+                server_port=self.server_port,
+                connection_pool=pool,
+                framed=self.framed,
+                pipelined=self.pipelined,
+                channels=channels,
+            )
+            for i in range(step.identities)
+        ]
+        log.warning(
+            "step: %.0f heartbeats/s from %s identities over at most %s connections "
+            "for %.1fs",
+            step.rate,
+            step.identities,
+            step.connections,
+            step.duration,
+        )
+        loop = asyncio.get_running_loop()
+        tasks = set()
+        begin = loop.time()
+        total = int(step.rate * step.duration)
+        for k in range(total):
+            due = begin + k / step.rate
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            stats = self._second(loop.time())
+            if self._in_flight >= self.max_in_flight:
+                stats.dropped += 1
+                continue
+            stats.sent += 1
+            self._in_flight += 1
+            task = asyncio.ensure_future(self._send(clients[k % len(clients)], due))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        for client in clients:
+            await client.close()
+
+    async def _reporter(self) -> None:
+        loop = asyncio.get_running_loop()
+        second = 0
+        while True:
+            await asyncio.sleep(self._start + second + 1 - loop.time())
+            self.report(self.format_second(second, self.seconds.get(second)))
+            second += 1
+
+    @staticmethod
+    def format_second(second: int, stats: Optional[SecondStats]) -> str:
+        if stats is None:
+            stats = SecondStats()
+        latencies = " ".join(
+            f"p{p}={v / 1000:.2f}ms"
+            for p, v in stats.histogram.percentiles(PERCENTILES).items()
+        )
+        return (
+            f"{second:5d}s sent={stats.sent} ok={stats.ok}/s errors={stats.errors} "
+            f"dropped={stats.dropped} {latencies} max={stats.histogram.max / 1000:.2f}ms"
+        )
+
+    async def run(self, steps: List[Step]) -> dict:
+        """
+        Run the steps one after the other.
+        :return: the per-second and the overall results.
+        """
+        self._start = asyncio.get_running_loop().time()
+        reporter = asyncio.ensure_future(self._reporter())
+        try:
+            for step in steps:
+                await self.run_step(step)
+        finally:
+            reporter.cancel()
+        return {
+            "seconds": {
+                second: stats.to_dict()
+                for second, stats in sorted(self.seconds.items())
+            },
+            "total": {
+                "ok": self.total.total_count,
+                "errors": sum(s.errors for s in self.seconds.values()),
+                "dropped": sum(s.dropped for s in self.seconds.values()),
+                "latency_us": {
+                    str(p): v for p, v in self.total.percentiles(PERCENTILES).items()
+                },
+                "latency_max_us": self.total.max,
+            },
+        }
+
+
+async def main(args) -> dict:
+    encoder_decoder = EncodeDecodeExecutor(ENCODER_DECODERS[args.encoder_decoder]())
+    server = None
+    server_ip, server_port = args.server_ip, args.server_port
+    if args.stand_in:
+        # shares the CPU with the load generator, only meant for trying it out
+        server = StandInServer(encoder_decoder, framed=args.framed)
+        await server.start()
+        server_ip, server_port = "127.0.0.1", server.port
+    generator = LoadGenerator(
+        encoder_decoder,
+        server_ip,
+        server_port,
+        first_identifier=args.identifier,
+        framed=args.framed,
+        pipelined=args.pipelined,
+        max_in_flight=args.max_in_flight,
+    )
+    try:
+        results = await generator.run(ramp(args))
+    finally:
+        if server is not None:
+            await server.close()
+    total = results["total"]
+    print(
+        f"total ok={total['ok']} errors={total['errors']} dropped={total['dropped']} "
+        + " ".join(f"p{p}={v / 1000:.2f}ms" for p, v in total["latency_us"].items())
+    )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server-ip", default="127.0.0.1")
+    parser.add_argument("--server-port", type=int, default=4000)
+    parser.add_argument("--stand-in", action="store_true", help="run a stand-in server")
+    parser.add_argument("--encoder-decoder", default="protobuf")
+    parser.add_argument("--framed", action="store_true")
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="all identities share one pipelined connection, needs --framed",
+    )
+    parser.add_argument("--identifier", type=int, default=1234)
+    parser.add_argument("--rate", type=float, default=100.0)
+    parser.add_argument("--max-rate", type=float)
+    parser.add_argument("--identities", type=int, default=1)
+    parser.add_argument("--max-identities", type=int)
+    parser.add_argument("--connections", type=int, default=10)
+    parser.add_argument("--max-connections", type=int)
+    parser.add_argument("--steps", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--max-in-flight", type=int, default=10000)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(main(arguments))
+    if arguments.output:
+        with open(arguments.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0)
@@ -0,0 +1,124 @@
+import logging
+import logging.handlers
+import os
+import queue
+from typing import Dict, Optional, Tuple
+
+from admission import TokenBucket
+
+FORMAT = "%(asctime)s %(levelname)s [%(module)s:%(lineno)d] %(message)s"
+
+# handlers write in the calling thread, blocking the event loop on disk and console I/O
+SYNC = "sync"
+# records are put on a queue and written by a background thread
+QUEUE = "queue"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Passes at most rate records per second, with bursts of up to burst records, for every
+    message template. Per-message logs are throttled while rare messages always get through.
+    The number of records dropped is added to the next record passed for the same template.
+    """
+
+    def __init__(
+        self, rate: float = 10.0, burst: float = 20.0, max_templates: int = 1024
+    ):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_templates = max_templates
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._suppressed: Dict[Tuple[str, str], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # a filter shared by several handlers decides once for every record
+        passed = getattr(record, "rate_limit_passed", None)
+        if passed is None:
+            passed = record.rate_limit_passed = self._filter(record)
+        return passed
+
+    def _filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, str(record.msg))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_templates:
+                self._buckets.clear()
+            bucket = self._buckets[key] = TokenBucket(
+                self.rate, self.burst, record.created
+            )
+        if not bucket.try_acquire(record.created):
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+
+# arguments which can not change between the log call and the listener thread
+_SCALARS = (str, bytes, int, float, type(None))
+
+
+def _immutable(value) -> bool:
+    if isinstance(value, _SCALARS):
+        return True
+    # tuples of scalars, message records included
+    return isinstance(value, tuple) and all(_immutable(item) for item in value)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler which leaves formatting to the listener thread when it is safe. The
+    standard one formats every message in the logging thread before queueing it.
+    A record with a mutable argument, a message dict for instance, is formatted before it
+    is queued, since the caller may change the argument before the listener formats it.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args and not _immutable(record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def configure_logging(
+    mode: str = QUEUE,
+    filename: Optional[str] = "log/client.log",
+    level=logging.DEBUG,
+    rate_limit: float = 0.0,
+) -> Optional[logging.handlers.QueueListener]:
+    """
+    Log to a file and to the console.
+    :param mode: SYNC writes in the calling thread, QUEUE in a background thread.
+    :param filename: the log file, None to log to the console only.
+    :param level: the level of the root logger, a number or a name like "INFO".
+    :param rate_limit: records per second passed for every message template, 0 for no limit.
+    :return: the listener of QUEUE mode, stop() it at exit to flush the queue.
+    """
+    if mode not in (SYNC, QUEUE):
+        raise ValueError(f"unknown log mode {mode}")
+    formatter = logging.Formatter(FORMAT)
+    handlers = [logging.StreamHandler()]
+    if filename:
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        handlers.append(logging.FileHandler(filename, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    listener = None
+    if mode == QUEUE:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(
+            log_queue, *handlers, respect_handler_level=True
+        )
+        handlers = [LazyQueueHandler(log_queue)]
+        listener.start()
+    rate_limit_filter = RateLimitFilter(rate_limit, 2 * rate_limit)
+    for handler in handlers:
+        if rate_limit > 0:
+            handler.addFilter(rate_limit_filter)
+        root.addHandler(handler)
+    return listener
@@ -1,9 +1,24 @@
 import asyncio
 import logging
 
+from admission import AdmissionController
+from circuit_breaker import CircuitBreaker
 from client import Client
-from encode_decode_executor import EncodeDecodeExecutor
-from protobuf_encode_decoder import ProtobufEncoderDecoder
+from client_fleet import ClientFleet
+from client_state import ClientState, capacity_for
+from encode_decode_executor import (
+    PROCESS,
+    THREAD,
+    EncodeDecodeExecutor,
+    make_codec_pool,
+)
+from encoder_decoders import ENCODER_DECODERS
+from logging_setup import QUEUE, configure_logging
+from metrics import REGISTRY, start_metrics_server
+from protocol_transport import STREAMS
+from scheduler import SKIP
+from supervisor import Supervisor
+from udp_transport import TCP, UDP, DatagramHeartbeatSender
 from dotenv import load_dotenv
 import os
 
@@ -19,13 +34,199 @@ async def main():
     client_port = int(os.getenv("CLIENT_PORT", 3000))
     client_identifier = int(os.getenv("CLIENT_IDENTIFIER", 1234))
     heartbeat_interval = int(os.getenv("HEARTBEAT_INTERVAL_SECONDS", 60))
+    framed = bool(int(os.getenv("FRAMED", 0)))
+    pipelined = bool(int(os.getenv("PIPELINED", 0)))
+    fleet_size = int(os.getenv("FLEET_SIZE", 1))
+    heartbeat_jitter = float(os.getenv("HEARTBEAT_JITTER_SECONDS", 0))
+    heartbeat_missed = os.getenv("HEARTBEAT_MISSED", SKIP)
+    heartbeat_batch_size = int(os.getenv("HEARTBEAT_BATCH_SIZE", 0))
+    encoder_decoder_name = os.getenv("ENCODER_DECODER", "protobuf")
+    status_max_handlers = int(os.getenv("STATUS_MAX_HANDLERS", 100))
+    status_backlog = int(os.getenv("STATUS_BACKLOG", 100))
+    status_peer_rate = float(os.getenv("STATUS_PEER_RATE", 0))
+    status_peer_burst = float(os.getenv("STATUS_PEER_BURST", 10))
+    status_idle_timeout = float(os.getenv("STATUS_IDLE_TIMEOUT_SECONDS", 60))
+    metrics_ip = os.getenv("METRICS_IP", "0.0.0.0")
+    metrics_port = int(os.getenv("METRICS_PORT", 0))
+    workers = int(os.getenv("WORKERS", 1))
+    transport = os.getenv("TRANSPORT", STREAMS)
+    heartbeat_transport = os.getenv("HEARTBEAT_TRANSPORT", TCP)
+    udp_ack = bool(int(os.getenv("UDP_ACK", 1)))
+    udp_ack_timeout = float(os.getenv("UDP_ACK_TIMEOUT_SECONDS", 0.5))
+    udp_retries = int(os.getenv("UDP_RETRIES", 3))
+    request_timeout = float(os.getenv("REQUEST_TIMEOUT_SECONDS", 10))
+    outbound_max_pending = int(os.getenv("OUTBOUND_MAX_PENDING", 1024))
+    state_file = os.getenv("STATE_FILE", "")
+    circuit_failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+    circuit_reset_timeout = float(os.getenv("CIRCUIT_RESET_SECONDS", 1))
+    circuit_max_reset_timeout = float(os.getenv("CIRCUIT_MAX_RESET_SECONDS", 30))
+    codec_pool_kind = os.getenv("CODEC_POOL", "")
+    codec_pool_workers = int(os.getenv("CODEC_POOL_WORKERS", 0)) or None
+    codec_offload_bytes = int(os.getenv("CODEC_OFFLOAD_BYTES", 16384))
+    worker_restart_delay = float(os.getenv("WORKER_RESTART_DELAY_SECONDS", 1))
 
     log.info(f"server ip is {server_ip} server port is {server_port}")
     log.info(f"client ip is {client_ip} client port is {client_port}")
     log.info(f"client_identifier  is {client_identifier}")
     log.info(f"heartbeat_interval  is {heartbeat_interval}")
+    log.info(f"framed  is {framed} pipelined is {pipelined}")
+    log.info(f"fleet_size  is {fleet_size} heartbeat_jitter is {heartbeat_jitter}")
+    log.info(f"heartbeat_missed  is {heartbeat_missed}")
+    log.info(f"heartbeat_batch_size  is {heartbeat_batch_size}")
+    log.info(f"encoder_decoder  is {encoder_decoder_name}")
+    log.info(
+        f"status_max_handlers  is {status_max_handlers} status_backlog is {status_backlog}"
+    )
+    log.info(
+        f"status_peer_rate  is {status_peer_rate} status_peer_burst is {status_peer_burst}"
+    )
+    log.info(f"status_idle_timeout  is {status_idle_timeout}")
+    log.info(f"metrics ip is {metrics_ip} metrics port is {metrics_port}")
+    log.info(f"workers  is {workers} worker_restart_delay is {worker_restart_delay}")
+    log.info(
+        f"codec_pool  is {codec_pool_kind or None} codec_pool_workers is "
+        f"{codec_pool_workers} codec_offload_bytes is {codec_offload_bytes}"
+    )
+    log.info(f"transport  is {transport}")
+    log.info(
+        f"heartbeat_transport  is {heartbeat_transport} udp_ack is {udp_ack} "
+        f"udp_ack_timeout is {udp_ack_timeout} udp_retries is {udp_retries}"
+    )
+    datagram_settings = None
+    if heartbeat_transport == UDP:
+        datagram_settings = {
+            "ack": udp_ack,
+            "ack_timeout": udp_ack_timeout,
+            "retries": udp_retries,
+        }
+    log.info(
+        f"request_timeout  is {request_timeout} circuit_failure_threshold is "
+        f"{circuit_failure_threshold} circuit_reset_timeout is {circuit_reset_timeout} "
+        f"circuit_max_reset_timeout is {circuit_max_reset_timeout}"
+    )
+    log.info(f"outbound_max_pending  is {outbound_max_pending}")
+    log.info(f"state_file  is {state_file or None}")
+    circuit_breaker_settings = {
+        "failure_threshold": circuit_failure_threshold,
+        "reset_timeout": circuit_reset_timeout,
+        "max_reset_timeout": circuit_max_reset_timeout,
+    }
+    if workers > fleet_size:
+        # every worker needs at least one identifier
+        log.warning(
+            "WORKERS=%s is more than FLEET_SIZE=%s, using %s workers",
+            workers,
+            fleet_size,
+            fleet_size,
+        )
+        workers = fleet_size
+    if workers > 1 and codec_pool_kind == PROCESS:
+        # worker processes can not start processes of their own
+        log.warning("CODEC_POOL=process is not supported with WORKERS, using threads")
+        codec_pool_kind = THREAD
+
+    registry = None
+    if metrics_port:
+        # codec timings are only recorded when somebody collects them
+        registry = REGISTRY
+        await start_metrics_server(metrics_ip, metrics_port, registry)
+    if workers > 1:
+        # the fleet is split between processes sharing client_port with SO_REUSEPORT
+        supervisor = Supervisor(
+            config={
+                "encoder_decoder": ENCODER_DECODERS[encoder_decoder_name],
+                "fleet": {
+                    "client_port": client_port,
+                    "client_ip": client_ip,
+                    "server_ip": server_ip,
+                    "server_port": server_port,
+                    "framed": framed,
+                    "pipelined": pipelined,
+                    "batch_size": heartbeat_batch_size,
+                    "status_idle_timeout": status_idle_timeout,
+                    "request_timeout": request_timeout,
+                    "transport": transport,
+                    "outbound_max_pending": outbound_max_pending,
+                },
+                "circuit_breaker": circuit_breaker_settings,
+                "datagram": datagram_settings,
+                "state": state_file,
+                "admission": {
+                    "max_handlers": status_max_handlers,
+                    "backlog": status_backlog,
+                    "peer_rate": status_peer_rate,
+                    "peer_burst": status_peer_burst,
+                },
+                "codec_pool": {
+                    "kind": codec_pool_kind,
+                    "workers": codec_pool_workers,
+                    "offload_threshold": codec_offload_bytes,
+                },
+                "heartbeat_interval": heartbeat_interval,
+                "heartbeat_jitter": heartbeat_jitter,
+                "heartbeat_missed": heartbeat_missed,
+                "logging": {
+                    "mode": os.getenv("LOG_MODE", QUEUE),
+                    "level": os.getenv("LOG_LEVEL", "DEBUG").upper(),
+                    "rate_limit": float(os.getenv("LOG_RATE_LIMIT", 0)),
+                },
+            },
+            first_identifier=client_identifier,
+            count=fleet_size,
+            workers=workers,
+            restart_delay=worker_restart_delay,
+        )
+        log.info(f"MAIN begin {workers} workers for a fleet of {fleet_size} clients")
+        await supervisor.run()
+        return
+    encoder_decoder = EncodeDecodeExecutor(
+        ENCODER_DECODERS[encoder_decoder_name](),
+        registry,
+        pool=make_codec_pool(codec_pool_kind, codec_pool_workers),
+        offload_threshold=codec_offload_bytes,
+    )
+    admission = AdmissionController(
+        max_handlers=status_max_handlers,
+        backlog=status_backlog,
+        peer_rate=status_peer_rate,
+        peer_burst=status_peer_burst,
+    )
+    # the mapping is written back by the kernel, also when the process is killed
+    state = ClientState(state_file, capacity_for(fleet_size)) if state_file else None
+    datagram_sender = None
+    if datagram_settings is not None:
+        datagram_sender = DatagramHeartbeatSender(
+            encoder_decoder, server_ip, server_port, **datagram_settings
+        )
+    if fleet_size > 1:
+        # identifiers client_identifier.. and one shared listener on client_port
+        fleet = ClientFleet(
+            encoder_decoder=encoder_decoder,
+            first_identifier=client_identifier,
+            count=fleet_size,
+            client_port=client_port,
+            client_ip=client_ip,
+            server_ip=server_ip,
+            server_port=server_port,
+            framed=framed,
+            pipelined=pipelined,
+            batch_size=heartbeat_batch_size,
+            admission=admission,
+            status_idle_timeout=status_idle_timeout,
+            request_timeout=request_timeout,
+            circuit_breaker=CircuitBreaker(**circuit_breaker_settings),
+            transport=transport,
+            datagram_sender=datagram_sender,
+            outbound_max_pending=outbound_max_pending,
+            state=state,
+        )
+        log.info(f"MAIN begin fleet of {fleet_size} clients")
+        await fleet.start_server()
+        await fleet.send_heartbeats(
+            heartbeat_interval, jitter=heartbeat_jitter, missed=heartbeat_missed
+        )
+        return
 
-    encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
     client = Client(
         encoder_decoder=encoder_decoder,
         client_identifier=client_identifier,
@@ -33,6 +234,16 @@ async def main():
         client_ip=client_ip,
         server_ip=server_ip,
         server_port=server_port,
+        framed=framed,
+        pipelined=pipelined,
+        admission=admission,
+        status_idle_timeout=status_idle_timeout,
+        request_timeout=request_timeout,
+        circuit_breaker=CircuitBreaker(**circuit_breaker_settings),
+        transport=transport,
+        datagram_sender=datagram_sender,
+        outbound_max_pending=outbound_max_pending,
+        state=state,
     )
 
     log.info(f"MAIN begin: {server_ip} {server_port} {client_port} {client_identifier}")
@@ -57,6 +268,8 @@ async def main():
         client.send_heartbeat_message(
             heartbeat_interval,
             client.send_heartbeat,
+            jitter=heartbeat_jitter,
+            missed=heartbeat_missed,
         )
     )
     await t2
@@ -66,19 +279,13 @@ async def main():
 
 
 if __name__ == "__main__":
-    logging.basicConfig(
-        filename="log/client.log", encoding="utf-8", level=logging.DEBUG
+    log_listener = configure_logging(
+        mode=os.getenv("LOG_MODE", QUEUE),
+        level=os.getenv("LOG_LEVEL", "DEBUG").upper(),
+        rate_limit=float(os.getenv("LOG_RATE_LIMIT", 0)),
     )
-
-    formatter = logging.Formatter(
-        "%(asctime)s %(levelname)s " + "[%(module)s:%(lineno)d] %(message)s"
-    )
-
-    # setup console logging
-    log.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.DEBUG)
-
-    ch.setFormatter(formatter)
-    log.addHandler(ch)
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    finally:
+        if log_listener is not None:
+            log_listener.stop()
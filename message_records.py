@@ -0,0 +1,124 @@
+from typing import NamedTuple, Union
+
+import messages_pb2 as messages
+
+
+class HeartBeat(NamedTuple):
+    """
+    A heartbeat message. Tuples have no per-instance dict, fields are read by position.
+    """
+
+    type: int = messages.MessageType.MESSAGE_TYPE_HEARTBEAT
+    msg: str = ""
+    client_host: str = ""
+    client_port: int = 0
+    identifier: int = 0
+    request_id: int = 0
+
+    @classmethod
+    def from_dict(cls, msg_dict: dict) -> "HeartBeat":
+        return cls(
+            msg_dict.get("type"),
+            msg_dict.get("msg"),
+            msg_dict.get("client_host"),
+            msg_dict.get("client_port"),
+            msg_dict.get("identifier"),
+            msg_dict.get("request_id", 0),
+        )
+
+    def to_dict(self) -> dict:
+        """
+        The dict format of the encode/decode API. request_id is only present when it is set.
+        """
+        msg_dict = {
+            "type": self.type,
+            "msg": self.msg,
+            "client_host": self.client_host,
+            "identifier": self.identifier,
+            "client_port": self.client_port,
+        }
+        if self.request_id:
+            msg_dict["request_id"] = self.request_id
+        return msg_dict
+
+    def get(self, key: str, default=None):
+        # lets a record go through code written for the dict format; only fields are
+        # keys, tuple methods such as count and index are not
+        return getattr(self, key) if key in self._fields else default
+
+
+class Status(NamedTuple):
+    """
+    A status message.
+    """
+
+    type: int = messages.MessageType.MESSAGE_TYPE_STATUS
+    message_count: int = 0
+    identifier: int = 0
+    request_id: int = 0
+
+    @classmethod
+    def from_dict(cls, msg_dict: dict) -> "Status":
+        return cls(
+            msg_dict.get("type"),
+            msg_dict.get("message_count"),
+            msg_dict.get("identifier"),
+            msg_dict.get("request_id", 0),
+        )
+
+    def to_dict(self) -> dict:
+        """
+        The dict format of the encode/decode API. request_id is only present when it is set.
+        """
+        msg_dict = {
+            "type": self.type,
+            "message_count": self.message_count,
+            "identifier": self.identifier,
+        }
+        if self.request_id:
+            msg_dict["request_id"] = self.request_id
+        return msg_dict
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+
+class Error(NamedTuple):
+    """
+    An error, either decoded from an ErrorMessage or returned by a decoder given the wrong message.
+    """
+
+    type: int = messages.MessageType.MESSAGE_TYPE_ERROR
+    error: str = ""
+
+    @classmethod
+    def from_dict(cls, msg_dict: dict) -> "Error":
+        return cls(msg_dict.get("type"), msg_dict.get("msg"))
+
+    def to_dict(self) -> dict:
+        # the dict format names the error text "msg"
+        return {"type": self.type, "msg": self.error}
+
+    def get(self, key: str, default=None):
+        if key == "msg":
+            return self.error
+        return getattr(self, key) if key in self._fields else default
+
+
+INCORRECT_DECODER = Error(error="incorrect decoder")
+
+Record = Union[HeartBeat, Status, Error]
+
+
+def from_dict(msg_dict: dict) -> Record:
+    """
+    Convert a message in the dict format to its record type.
+    :param msg_dict: a heartbeat, status or error message dict.
+    :return: the record.
+    """
+    msg_type = msg_dict.get("type")
+    if msg_type == messages.MessageType.MESSAGE_TYPE_ERROR:
+        return Error.from_dict(msg_dict)
+    if "message_count" in msg_dict:
+        return Status.from_dict(msg_dict)
+    return HeartBeat.from_dict(msg_dict)
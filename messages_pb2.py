@@ -19,7 +19,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
     syntax="proto3",
     serialized_options=None,
     create_key=_descriptor._internal_create_key,
-    serialized_pb=b'\n\x08my.proto"y\n\x10HeartBeatMessage\x12\x1a\n\x04type\x18\x01 \x01(\x0e\x32\x0c.MessageType\x12\x0b\n\x03msg\x18\x02 \x01(\t\x12\x13\n\x0b\x63lient_host\x18\x03 \x01(\t\x12\x13\n\x0b\x63lient_port\x18\x04 \x01(\r\x12\x12\n\nidentifier\x18\x05 \x01(\r"V\n\rStatusMessage\x12\x1a\n\x04type\x18\x01 \x01(\x0e\x32\x0c.MessageType\x12\x15\n\rmessage_count\x18\x02 \x01(\r\x12\x12\n\nidentifier\x18\x03 \x01(\r"9\n\x0c\x45rrorMessage\x12\x1a\n\x04type\x18\x01 \x01(\x0e\x32\x0c.MessageType\x12\r\n\x05\x65rror\x18\x02 \x01(\t*Z\n\x0bMessageType\x12\x1a\n\x16MESSAGE_TYPE_HEARTBEAT\x10\x00\x12\x17\n\x13MESSAGE_TYPE_STATUS\x10\x01\x12\x16\n\x12MESSAGE_TYPE_ERROR\x10\x03\x62\x06proto3',
+    serialized_pb=b'\n\x08my.proto"\x8d\x01\n\x10HeartBeatMessage\x12\x1a\n\x04type\x18\x01 \x01(\x0e\x32\x0c.MessageType\x12\x0b\n\x03msg\x18\x02 \x01(\t\x12\x13\n\x0b\x63lient_host\x18\x03 \x01(\t\x12\x13\n\x0b\x63lient_port\x18\x04 \x01(\r\x12\x12\n\nidentifier\x18\x05 \x01(\r\x12\x12\n\nrequest_id\x18\x06 \x01(\r"j\n\rStatusMessage\x12\x1a\n\x04type\x18\x01 \x01(\x0e\x32\x0c.MessageType\x12\x15\n\rmessage_count\x18\x02 \x01(\r\x12\x12\n\nidentifier\x18\x03 \x01(\r\x12\x12\n\nrequest_id\x18\x04 \x01(\r"S\n\x0eHeartBeatBatch\x12\x1a\n\x04type\x18\x01 \x01(\x0e\x32\x0c.MessageType\x12%\n\nheartbeats\x18\x02 \x03(\x0b\x32\x11.HeartBeatMessage"9\n\x0c\x45rrorMessage\x12\x1a\n\x04type\x18\x01 \x01(\x0e\x32\x0c.MessageType\x12\r\n\x05\x65rror\x18\x02 \x01(\t*|\n\x0bMessageType\x12\x1a\n\x16MESSAGE_TYPE_HEARTBEAT\x10\x00\x12\x17\n\x13MESSAGE_TYPE_STATUS\x10\x01\x12\x16\n\x12MESSAGE_TYPE_ERROR\x10\x03\x12 \n\x1cMESSAGE_TYPE_HEARTBEAT_BATCH\x10\x04\x62\x06proto3',
 )
 
 _MESSAGETYPE = _descriptor.EnumDescriptor(
@@ -53,11 +53,19 @@ _MESSAGETYPE = _descriptor.EnumDescriptor(
             type=None,
             create_key=_descriptor._internal_create_key,
         ),
+        _descriptor.EnumValueDescriptor(
+            name="MESSAGE_TYPE_HEARTBEAT_BATCH",
+            index=3,
+            number=4,
+            serialized_options=None,
+            type=None,
+            create_key=_descriptor._internal_create_key,
+        ),
     ],
     containing_type=None,
     serialized_options=None,
-    serialized_start=282,
-    serialized_end=372,
+    serialized_start=408,
+    serialized_end=532,
 )
 _sym_db.RegisterEnumDescriptor(_MESSAGETYPE)
 
@@ -65,6 +73,7 @@ MessageType = enum_type_wrapper.EnumTypeWrapper(_MESSAGETYPE)
 MESSAGE_TYPE_HEARTBEAT = 0
 MESSAGE_TYPE_STATUS = 1
 MESSAGE_TYPE_ERROR = 3
+MESSAGE_TYPE_HEARTBEAT_BATCH = 4
 
 
 _HEARTBEATMESSAGE = _descriptor.Descriptor(
@@ -170,6 +179,25 @@ _HEARTBEATMESSAGE = _descriptor.Descriptor(
             file=DESCRIPTOR,
             create_key=_descriptor._internal_create_key,
         ),
+        _descriptor.FieldDescriptor(
+            name="request_id",
+            full_name="HeartBeatMessage.request_id",
+            index=5,
+            number=6,
+            type=13,
+            cpp_type=3,
+            label=1,
+            has_default_value=False,
+            default_value=0,
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key,
+        ),
     ],
     extensions=[],
     nested_types=[],
@@ -179,8 +207,8 @@ _HEARTBEATMESSAGE = _descriptor.Descriptor(
     syntax="proto3",
     extension_ranges=[],
     oneofs=[],
-    serialized_start=12,
-    serialized_end=133,
+    serialized_start=13,
+    serialized_end=154,
 )
 
 
@@ -249,6 +277,25 @@ _STATUSMESSAGE = _descriptor.Descriptor(
             file=DESCRIPTOR,
             create_key=_descriptor._internal_create_key,
         ),
+        _descriptor.FieldDescriptor(
+            name="request_id",
+            full_name="StatusMessage.request_id",
+            index=3,
+            number=4,
+            type=13,
+            cpp_type=3,
+            label=1,
+            has_default_value=False,
+            default_value=0,
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key,
+        ),
     ],
     extensions=[],
     nested_types=[],
@@ -258,8 +305,68 @@ _STATUSMESSAGE = _descriptor.Descriptor(
     syntax="proto3",
     extension_ranges=[],
     oneofs=[],
-    serialized_start=135,
-    serialized_end=221,
+    serialized_start=156,
+    serialized_end=262,
+)
+
+
+_HEARTBEATBATCH = _descriptor.Descriptor(
+    name="HeartBeatBatch",
+    full_name="HeartBeatBatch",
+    filename=None,
+    file=DESCRIPTOR,
+    containing_type=None,
+    create_key=_descriptor._internal_create_key,
+    fields=[
+        _descriptor.FieldDescriptor(
+            name="type",
+            full_name="HeartBeatBatch.type",
+            index=0,
+            number=1,
+            type=14,
+            cpp_type=8,
+            label=1,
+            has_default_value=False,
+            default_value=0,
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key,
+        ),
+        _descriptor.FieldDescriptor(
+            name="heartbeats",
+            full_name="HeartBeatBatch.heartbeats",
+            index=1,
+            number=2,
+            type=11,
+            cpp_type=10,
+            label=3,
+            has_default_value=False,
+            default_value=[],
+            message_type=None,
+            enum_type=None,
+            containing_type=None,
+            is_extension=False,
+            extension_scope=None,
+            serialized_options=None,
+            file=DESCRIPTOR,
+            create_key=_descriptor._internal_create_key,
+        ),
+    ],
+    extensions=[],
+    nested_types=[],
+    enum_types=[],
+    serialized_options=None,
+    is_extendable=False,
+    syntax="proto3",
+    extension_ranges=[],
+    oneofs=[],
+    serialized_start=264,
+    serialized_end=347,
 )
 
 
@@ -318,15 +425,18 @@ _ERRORMESSAGE = _descriptor.Descriptor(
     syntax="proto3",
     extension_ranges=[],
     oneofs=[],
-    serialized_start=223,
-    serialized_end=280,
+    serialized_start=349,
+    serialized_end=406,
 )
 
 _HEARTBEATMESSAGE.fields_by_name["type"].enum_type = _MESSAGETYPE
 _STATUSMESSAGE.fields_by_name["type"].enum_type = _MESSAGETYPE
+_HEARTBEATBATCH.fields_by_name["type"].enum_type = _MESSAGETYPE
+_HEARTBEATBATCH.fields_by_name["heartbeats"].message_type = _HEARTBEATMESSAGE
 _ERRORMESSAGE.fields_by_name["type"].enum_type = _MESSAGETYPE
 DESCRIPTOR.message_types_by_name["HeartBeatMessage"] = _HEARTBEATMESSAGE
 DESCRIPTOR.message_types_by_name["StatusMessage"] = _STATUSMESSAGE
+DESCRIPTOR.message_types_by_name["HeartBeatBatch"] = _HEARTBEATBATCH
 DESCRIPTOR.message_types_by_name["ErrorMessage"] = _ERRORMESSAGE
 DESCRIPTOR.enum_types_by_name["MessageType"] = _MESSAGETYPE
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
@@ -353,6 +463,17 @@ StatusMessage = _reflection.GeneratedProtocolMessageType(
 )
 _sym_db.RegisterMessage(StatusMessage)
 
+HeartBeatBatch = _reflection.GeneratedProtocolMessageType(
+    "HeartBeatBatch",
+    (_message.Message,),
+    {
+        "DESCRIPTOR": _HEARTBEATBATCH,
+        "__module__": "my_pb2"
+        # @@protoc_insertion_point(class_scope:HeartBeatBatch)
+    },
+)
+_sym_db.RegisterMessage(HeartBeatBatch)
+
 ErrorMessage = _reflection.GeneratedProtocolMessageType(
     "ErrorMessage",
     (_message.Message,),
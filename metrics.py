@@ -0,0 +1,312 @@
+import asyncio
+import bisect
+import logging
+import weakref
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+log = logging.getLogger("__main__." + __name__)
+
+# seconds, for network round trips
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# seconds, for encoding and decoding a single message
+CODEC_BUCKETS = (
+    0.000005,
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.01,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    A value which only goes up. inc() is a single attribute update.
+    """
+
+    __slots__ = ("labels", "value")
+    kind = "counter"
+
+    def __init__(self, labels: Labels = ()):
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def samples(self, name: str) -> Iterable[str]:
+        yield f"{name}{_format_labels(self.labels)} {_format_value(self.value)}"
+
+
+class Gauge:
+    """
+    A value which goes up and down, or is read from a function when it is collected.
+    """
+
+    __slots__ = ("labels", "value", "function")
+    kind = "gauge"
+
+    def __init__(self, labels: Labels = (), function: Optional[Callable] = None):
+        self.labels = labels
+        self.value = 0
+        self.function = function
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def samples(self, name: str) -> Iterable[str]:
+        value = self.function() if self.function is not None else self.value
+        yield f"{name}{_format_labels(self.labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """
+    Counts observations in fixed buckets, the bucket is found with one bisect.
+    Counts are kept per bucket and summed up only when the histogram is collected.
+    """
+
+    __slots__ = ("labels", "bounds", "counts", "sum", "count")
+    kind = "histogram"
+
+    def __init__(self, labels: Labels = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.labels = labels
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str) -> Iterable[str]:
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            yield f"{name}_bucket{_format_labels(self.labels, le)} {cumulative}"
+        yield f"{name}_sum{_format_labels(self.labels)} {_format_value(self.sum)}"
+        yield f"{name}_count{_format_labels(self.labels)} {self.count}"
+
+
+class Registry:
+    """
+    The metrics of a process, rendered in the Prometheus text format.
+    Asking twice for the same name and labels returns the same metric.
+    """
+
+    def __init__(self):
+        # name -> (kind, help, {labels: metric})
+        self._families: Dict[str, Tuple[str, str, Dict[Labels, object]]] = {}
+
+    def _get(self, factory, name: str, help_text: str, labels: dict, **kwargs):
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (factory.kind, help_text, {})
+        elif family[0] != factory.kind:
+            raise ValueError(f"metric {name} is already a {family[0]}")
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = factory(key, **kwargs)
+        return metric
+
+    def counter(self, name: str, help_text: str, **labels) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        function: Optional[Callable] = None,
+        **labels,
+    ) -> Gauge:
+        gauge = self._get(Gauge, name, help_text, labels)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+        **labels,
+    ) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, (kind, help_text, metrics) in sorted(self._families.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in metrics.values():
+                lines.extend(metric.samples(name))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class ClientMetrics:
+    """
+    The metrics of Client, shared by every client of a registry.
+    """
+
+    def __init__(self, registry: Registry = REGISTRY):
+        self.sent = registry.counter(
+            "client_heartbeats_sent_total", "Heartbeats sent to the server."
+        )
+        self.acked = registry.counter(
+            "client_heartbeats_acked_total", "Heartbeats the server replied to."
+        )
+        self.failed = registry.counter(
+            "client_heartbeats_failed_total", "Heartbeats which got no reply."
+        )
+        self.bytes_out = registry.counter(
+            "client_bytes_sent_total", "Bytes written to the server."
+        )
+        self.bytes_in = registry.counter(
+            "client_bytes_received_total", "Bytes read from the server."
+        )
+        self.reconnects = registry.counter(
+            "client_reconnects_total",
+            "Connections opened again because the previous one was lost.",
+        )
+        self.retransmits = registry.counter(
+            "client_heartbeat_retransmits_total",
+            "Heartbeat datagrams sent again because they were not acked in time.",
+        )
+        self.conflated = registry.counter(
+            "client_heartbeats_conflated_total",
+            "Queued heartbeats replaced by a later one before they were written.",
+        )
+        self.circuit_rejected = registry.counter(
+            "client_circuit_rejected_total",
+            "Messages not sent because the circuit breaker was open.",
+        )
+        self.heartbeat_seconds = registry.histogram(
+            "client_heartbeat_seconds", "Heartbeat round trip time."
+        )
+        self.in_flight = registry.gauge(
+            "client_heartbeats_in_flight", "Heartbeats waiting for their reply."
+        )
+        self.status_requests = registry.counter(
+            "client_status_requests_total", "Status requests served."
+        )
+        self.status_rejected = registry.counter(
+            "client_status_rejected_total", "Status requests rejected by admission."
+        )
+        self.status_seconds = registry.histogram(
+            "client_status_seconds",
+            "Time from reading a status request to reading the ack of the reply.",
+        )
+        self._pools = weakref.WeakSet()
+        registry.gauge(
+            "client_open_connections",
+            "Open connections to the server.",
+            function=lambda: sum(pool.open_connections for pool in self._pools),
+        )
+
+    def track_pool(self, pool) -> None:
+        self._pools.add(pool)
+
+
+_client_metrics: "weakref.WeakKeyDictionary[Registry, ClientMetrics]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def client_metrics(registry: Registry = REGISTRY) -> ClientMetrics:
+    """
+    The ClientMetrics of a registry, created on first use.
+    """
+    metrics = _client_metrics.get(registry)
+    if metrics is None:
+        metrics = _client_metrics[registry] = ClientMetrics(registry)
+    return metrics
+
+
+async def _serve_metrics(
+    registry: Registry, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        request = await reader.readuntil(b"\r\n\r\n")
+        method, path = request.split(b" ", 2)[:2]
+        if method == b"GET" and path.split(b"?")[0] in (b"/metrics", b"/"):
+            status = b"200 OK"
+            body = registry.render().encode("utf-8")
+        else:
+            status = b"404 Not Found"
+            body = b"not found\n"
+        writer.write(
+            b"HTTP/1.1 "
+            + status
+            + b"\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8"
+            + b"\r\nContent-Length: "
+            + str(len(body)).encode()
+            + b"\r\nConnection: close\r\n\r\n"
+            + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+        pass
+    except (ConnectionError, OSError) as e:
+        log.error("metrics request failed: %s", e)
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(
+    host: str, port: int, registry: Registry = REGISTRY
+) -> asyncio.AbstractServer:
+    """
+    Serve the metrics for Prometheus on http://host:port/metrics from the running event loop.
+    """
+    log.info("start_metrics_server: serving metrics on %s:%s", host, port)
+    return await asyncio.start_server(
+        lambda reader, writer: _serve_metrics(registry, reader, writer), host, port
+    )
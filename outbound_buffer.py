@@ -0,0 +1,87 @@
+import asyncio
+from typing import List, Optional, Union
+
+from framing import HEADER
+
+# bytes waiting in the transport above which writers wait for drain()
+HIGH_WATER = 64 * 1024
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+async def drain_above(writer, high_water: int = HIGH_WATER) -> None:
+    """
+    Wait for drain() only when more than high_water bytes wait in the transport, below
+    that the write is already on its way and waiting would only cost a coroutine switch.
+    :param writer: a StreamWriter or a MessageProtocol.
+    """
+    if writer.transport.get_write_buffer_size() > high_water:
+        await writer.drain()
+
+
+def frame_chunks(*parts: BytesLike) -> List[BytesLike]:
+    """
+    The chunks of one frame whose payload is the concatenation of parts, for writelines():
+    the length prefix and the parts are written without being copied into one bytes first.
+    """
+    return [HEADER.pack(sum(len(part) for part in parts)), *parts]
+
+
+class OutboundBuffer:
+    """
+    Collects the frames written to one connection while the event loop runs other
+    callbacks and hands them to the transport with a single writelines() call on the next
+    pass of the loop. Frames of many coroutines sharing a connection leave in one send.
+    """
+
+    def __init__(self, writer, high_water: int = HIGH_WATER):
+        """
+        :param writer: a StreamWriter or a MessageProtocol.
+        :param high_water: see drain_above().
+        """
+        self.writer = writer
+        self.high_water = high_water
+        self.chunks: List[BytesLike] = []
+        self.pending_bytes = 0
+        self.flushes = 0
+        self._flush_handle: Optional[asyncio.Handle] = None
+
+    def write(self, data: BytesLike) -> None:
+        self.chunks.append(data)
+        self.pending_bytes += len(data)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_soon(self.flush)
+
+    def write_frame(self, *parts: BytesLike) -> int:
+        """
+        Queue one frame whose payload is the concatenation of parts.
+        :return: the size of the frame.
+        """
+        chunks = frame_chunks(*parts)
+        for chunk in chunks:
+            self.write(chunk)
+        return sum(len(chunk) for chunk in chunks)
+
+    def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self.chunks:
+            return
+        chunks, self.chunks = self.chunks, []
+        self.pending_bytes = 0
+        self.flushes += 1
+        if not self.writer.is_closing():
+            self.writer.writelines(chunks)
+
+    async def drain(self) -> None:
+        """
+        Return at once unless the queued and the unsent bytes cross the high-water mark,
+        then send the queued frames and wait for the transport to drain.
+        """
+        if (
+            self.pending_bytes + self.writer.transport.get_write_buffer_size()
+            > self.high_water
+        ):
+            self.flush()
+            await self.writer.drain()
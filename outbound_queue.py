@@ -0,0 +1,182 @@
+import asyncio
+import collections
+import logging
+from typing import Deque, Dict, Hashable, List, Optional
+
+from metrics import ClientMetrics, client_metrics
+from outbound_buffer import HIGH_WATER, OutboundBuffer
+
+log = logging.getLogger("__main__." + __name__)
+
+# priority classes, lower goes first
+HEARTBEAT = 0
+BULK = 1
+PRIORITIES = (HEARTBEAT, BULK)
+
+
+class OutboundQueueFull(ConnectionError):
+    """
+    Raised instead of queueing a message while max_pending messages wait to be written.
+    """
+
+
+class _Entry:
+    __slots__ = ("payload", "priority", "key", "waiter")
+
+    def __init__(self, payload: bytes, priority: int, key, waiter):
+        self.payload = payload
+        self.priority = priority
+        self.key = key
+        self.waiter = waiter
+
+
+def _follow(newer: asyncio.Future, older: asyncio.Future) -> None:
+    # a conflated message gets the outcome of the message which replaced it
+    if older.done():
+        return
+    if newer.cancelled():
+        older.set_exception(
+            ConnectionError("the message which replaced it was given up")
+        )
+    elif newer.exception() is not None:
+        older.set_exception(newer.exception())
+    else:
+        older.set_result(newer.result())
+
+
+class OutboundQueue:
+    """
+    The messages waiting to be written to one connection, written by a single writer task
+    so that senders never contend for drain(). Heartbeats go before bulk messages.
+    A heartbeat queued with the key of a heartbeat which is still waiting replaces it in
+    its place in the line: only the latest one is written and the waiter of the replaced
+    one gets the outcome of the latest. Messages whose waiter gave up, for instance on a
+    timeout, are dropped unwritten.
+    """
+
+    def __init__(
+        self,
+        writer,
+        max_pending: int = 1024,
+        high_water: int = HIGH_WATER,
+        metrics: Optional[ClientMetrics] = None,
+    ):
+        """
+        :param writer: a StreamWriter or a MessageProtocol.
+        :param max_pending: the most messages waiting to be written.
+        :param high_water: the writer task waits for drain() above this many unsent bytes,
+            it is also the most bytes written in one go.
+        :param metrics: where the bytes written and the conflated heartbeats are counted.
+        """
+        self.buffer = OutboundBuffer(writer, high_water)
+        self.max_pending = max_pending
+        self.metrics = metrics if metrics is not None else client_metrics()
+        self._queues: Dict[int, Deque[_Entry]] = {
+            priority: collections.deque() for priority in PRIORITIES
+        }
+        self._keyed: Dict[Hashable, _Entry] = {}
+        self._pending = 0
+        self._ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._error: Optional[Exception] = None
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def put(
+        self,
+        payload: bytes,
+        priority: int = BULK,
+        key: Optional[Hashable] = None,
+        waiter: Optional[asyncio.Future] = None,
+    ) -> None:
+        """
+        Queue one message, it is written as a frame.
+        :param payload: the encoded message.
+        :param priority: HEARTBEAT or BULK.
+        :param key: messages with the same key replace each other while they wait, None
+            to never replace one.
+        :param waiter: the future resolved by the reply to the message, it fails when the
+            message can not be written.
+        :raise OutboundQueueFull: when max_pending messages are waiting.
+        :raise ConnectionError: when the connection was lost.
+        """
+        if self._error is not None:
+            raise self._error
+        if key is not None:
+            entry = self._keyed.get(key)
+            if entry is not None:
+                if entry.waiter is not None and waiter is not None:
+                    waiter.add_done_callback(
+                        lambda newer, older=entry.waiter: _follow(newer, older)
+                    )
+                entry.payload = payload
+                entry.waiter = waiter
+                self.metrics.conflated.inc()
+                return
+        if self._pending >= self.max_pending:
+            raise OutboundQueueFull(
+                f"{self._pending} messages are waiting to be written"
+            )
+        entry = _Entry(payload, priority, key, waiter)
+        self._queues[priority].append(entry)
+        if key is not None:
+            self._keyed[key] = entry
+        self._pending += 1
+        if self._task is None:
+            self._ready = asyncio.Event()
+            self._task = asyncio.ensure_future(self._write())
+        self._ready.set()
+
+    def _take(self) -> List[_Entry]:
+        # the waiting messages in priority order, up to high_water bytes but at least one
+        batch: List[_Entry] = []
+        size = 0
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and (not batch or size < self.buffer.high_water):
+                entry = queue.popleft()
+                self._pending -= 1
+                if entry.key is not None:
+                    del self._keyed[entry.key]
+                if entry.waiter is not None and entry.waiter.done():
+                    continue
+                batch.append(entry)
+                size += len(entry.payload)
+        return batch
+
+    async def _write(self) -> None:
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._pending:
+                    for entry in self._take():
+                        self.metrics.bytes_out.inc(
+                            self.buffer.write_frame(entry.payload)
+                        )
+                    self.buffer.flush()
+                    await self.buffer.drain()
+        except (ConnectionError, OSError) as e:
+            log.error("could not write to the connection: %s", e)
+            self._fail(ConnectionError(str(e)))
+
+    def _fail(self, error: Exception) -> None:
+        self._error = error
+        for queue in self._queues.values():
+            for entry in queue:
+                if entry.waiter is not None and not entry.waiter.done():
+                    entry.waiter.set_exception(error)
+            queue.clear()
+        self._keyed.clear()
+        self._pending = 0
+
+    async def close(self) -> None:
+        """
+        Stop the writer task and fail the waiters of the messages not written yet.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._error is None:
+            self._fail(ConnectionError("socket closed: the connection was closed"))
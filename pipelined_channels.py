@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from connection_pool import ConnectionPool, PooledConnection
+from encode_decode_executor import EncodeDecodeExecutor
+from framing import HEADER_SIZE, FrameCodec
+from message_records import HeartBeat, Record
+from metrics import ClientMetrics, client_metrics
+from outbound_queue import BULK, HEARTBEAT, OutboundQueue
+from protocol_transport import MessageProtocol
+
+log = logging.getLogger("__main__." + __name__)
+
+MAX_REQUEST_ID = 0xFFFFFFFF
+
+
+class _Channel:
+    """
+    A long-lived framed connection carrying many outstanding requests at the same time.
+    """
+
+    __slots__ = (
+        "conn",
+        "outbound",
+        "in_flight",
+        "last_request_id",
+        "reader_task",
+        "closed",
+    )
+
+    def __init__(self, conn: PooledConnection, outbound: OutboundQueue):
+        self.conn = conn
+        # the single writer of the connection, senders only queue their requests
+        self.outbound = outbound
+        # replies are matched to the awaiting future through the request_id they echo
+        self.in_flight: Dict[int, asyncio.Future] = {}
+        self.last_request_id = 0
+        self.reader_task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def next_request_id(self) -> int:
+        # 0 means "no request id" on the wire, so ids run from 1 to MAX_REQUEST_ID
+        self.last_request_id = self.last_request_id % MAX_REQUEST_ID + 1
+        return self.last_request_id
+
+
+class PipelinedChannels:
+    """
+    One pipelined connection per server, shared by every client given the same instance.
+    ClientFleet shares one between its identities: whatever their number they take a single
+    connection out of the pool per server, and their heartbeats wait in the same
+    OutboundQueue, where a heartbeat still queued is replaced by the next one of the same
+    identifier. Request ids are unique per connection.
+    """
+
+    def __init__(
+        self,
+        encoder_decoder: EncodeDecodeExecutor,
+        connection_pool: ConnectionPool,
+        max_pending: int = 1024,
+        metrics: Optional[ClientMetrics] = None,
+    ):
+        """
+        :param connection_pool: where the connections are taken from, each one holds a slot
+            of the pool until it is closed.
+        :param max_pending: the most requests waiting to be written to one connection.
+        :param metrics: where the bytes read are counted, and by the queues the bytes
+            written and the conflated heartbeats.
+        """
+        self.encoder_decoder = encoder_decoder
+        self.frame_codec = FrameCodec(encoder_decoder)
+        self.connection_pool = connection_pool
+        self.max_pending = max_pending
+        self.metrics = metrics if metrics is not None else client_metrics()
+        self._channels: Dict[Tuple[str, int], _Channel] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def in_flight(self) -> int:
+        """
+        The requests waiting for their reply on every connection.
+        """
+        return sum(len(channel.in_flight) for channel in self._channels.values())
+
+    async def _get(self, server_ip: str, server_port: int) -> _Channel:
+        key = (server_ip, server_port)
+        channel = self._channels.get(key)
+        if channel is not None:
+            return channel
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                conn = await self.connection_pool.acquire(server_ip, server_port)
+                channel = _Channel(
+                    conn,
+                    OutboundQueue(conn.writer, self.max_pending, metrics=self.metrics),
+                )
+                channel.reader_task = asyncio.ensure_future(
+                    self._read_replies(key, channel)
+                )
+                self._channels[key] = channel
+            return channel
+
+    async def _read_message(self, reader) -> bytes:
+        if isinstance(reader, MessageProtocol):
+            return await reader.read_message()
+        try:
+            return await self.frame_codec.read_payload(reader)
+        except asyncio.IncompleteReadError:
+            return b""
+
+    async def _read_replies(self, key: Tuple[str, int], channel: _Channel) -> None:
+        """
+        Resolve the in-flight request futures of a channel until its connection closes.
+        """
+        error: Exception = ConnectionError("socket closed: server did not reply")
+        try:
+            while True:
+                data = await self._read_message(channel.conn.reader)
+                if not data:
+                    break
+                self.metrics.bytes_in.inc(len(data) + HEADER_SIZE)
+                reply = self.encoder_decoder.decode_heartbeat_record(binary_data=data)
+                future = channel.in_flight.get(reply.get("request_id", 0))
+                if future is None:
+                    log.error("received a reply for no pending request: %s", reply)
+                elif not future.done():
+                    future.set_result(reply)
+        except (ConnectionError, OSError) as e:
+            error = ConnectionError(str(e))
+        finally:
+            channel.closed = True
+            if self._channels.get(key) is channel:
+                del self._channels[key]
+            await channel.outbound.close()
+            for future in channel.in_flight.values():
+                if not future.done():
+                    future.set_exception(error)
+            await self.connection_pool.release(channel.conn, reuse=False)
+
+    async def send(
+        self, server_ip: str, server_port: int, msg, conflate: bool = False
+    ) -> Record:
+        """
+        Queue a message for the connection to the server and wait for the reply with its
+        request_id, which is set here.
+        :param msg: a HeartBeat record, or a heartbeat dict sent as a bulk message.
+        :param conflate: a conflated heartbeat still waiting to be written is replaced by the
+            next one with the same identifier, both get the reply to the latest.
+        :return: the reply record.
+        :raise OutboundQueueFull: when max_pending requests wait for the connection.
+        :raise ConnectionError: when the connection was lost before the reply.
+        """
+        channel = await self._get(server_ip, server_port)
+        if channel.closed:
+            raise ConnectionError("socket closed: pipelined connection was lost")
+        request_id = channel.next_request_id()
+        future = asyncio.get_running_loop().create_future()
+        channel.in_flight[request_id] = future
+        try:
+            if isinstance(msg, HeartBeat):
+                payload = self.encoder_decoder.encode_heartbeat_record(
+                    msg._replace(request_id=request_id)
+                )
+                key = msg.identifier if conflate else None
+                channel.outbound.put(payload, HEARTBEAT, key, future)
+            else:
+                payload = self.encoder_decoder.encode_heartbeat(
+                    msg_dict=dict(msg, request_id=request_id)
+                )
+                channel.outbound.put(payload, BULK, waiter=future)
+            log.info("Client sending pipelined request %s: %s", request_id, msg)
+            return await future
+        finally:
+            del channel.in_flight[request_id]
+
+    async def close(self) -> None:
+        """
+        Close every connection, the requests waiting for a reply fail. Closing twice is
+        harmless, clients sharing an instance all close it.
+        """
+        for channel in list(self._channels.values()):
+            channel.conn.writer.close()
+            if channel.reader_task is not None:
+                await asyncio.gather(channel.reader_task, return_exceptions=True)
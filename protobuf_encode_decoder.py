@@ -1,26 +1,107 @@
 import logging
+from collections import OrderedDict
 
 from base_enc_dec import BaseEncoderDecoder
+from message_records import INCORRECT_DECODER, HeartBeat, Record, Status
 import messages_pb2 as messages
 
 log = logging.getLogger("__main__." + __name__)
 
+MAX_UINT32 = 0xFFFFFFFF
+# field 6 of HeartBeatMessage with the varint wire type
+HEARTBEAT_REQUEST_ID_TAG = b"\x30"
+# field 4 of StatusMessage with the varint wire type
+STATUS_REQUEST_ID_TAG = b"\x20"
+
+
+def encode_varint(value: int) -> bytes:
+    """
+    Encode a non-negative integer as a protobuf base 128 varint.
+    """
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _fill_heartbeat(proto_message, msg_dict: dict) -> None:
+    proto_message.type = msg_dict.get("type")
+    proto_message.msg = msg_dict.get("msg")
+    proto_message.client_host = msg_dict.get("client_host")
+    proto_message.identifier = int(msg_dict.get("identifier"))
+    proto_message.client_port = int(msg_dict.get("client_port"))
+    proto_message.request_id = int(msg_dict.get("request_id", 0))
+
+
+def _heartbeat_to_dict(proto_message) -> dict:
+    decoded = {
+        "type": proto_message.type,
+        "msg": proto_message.msg,
+        "client_host": proto_message.client_host,
+        "identifier": proto_message.identifier,
+        "client_port": proto_message.client_port,
+    }
+    if proto_message.request_id:
+        decoded["request_id"] = proto_message.request_id
+    return decoded
+
 
 class ProtobufEncoderDecoder(BaseEncoderDecoder):
+    def __init__(self, heartbeat_cache_size: int = 1024):
+        """
+        :param heartbeat_cache_size: the number of serialized heartbeat templates to keep,
+            least recently used first out. 0 disables the cache.
+        """
+        self.heartbeat_cache_size = heartbeat_cache_size
+        self._heartbeat_templates: "OrderedDict[tuple, bytes]" = OrderedDict()
+
     def encode_heartbeat(self, msg_dict: dict) -> bytes:
         """
         Serialize a heartbeat message.
+        Everything but request_id is the same on every tick of a client, so the serialized
+        bytes of those fields are cached and only request_id is appended to them.
         :param msg_dict: the data to serialize
         :return: binary string format data.
         """
+        key = (
+            msg_dict.get("type"),
+            msg_dict.get("msg"),
+            msg_dict.get("client_host"),
+            msg_dict.get("client_port"),
+            msg_dict.get("identifier"),
+        )
+        try:
+            template = self._heartbeat_templates.get(key)
+        except TypeError:  # unhashable values can not be cached
+            return self._encode_heartbeat_message(msg_dict, None)
+        if template is None:
+            return self._encode_heartbeat_message(msg_dict, key)
+
+        self._heartbeat_templates.move_to_end(key)
+        request_id = msg_dict.get("request_id", 0)
+        if not request_id:
+            return template
+        if type(request_id) is int and 0 < request_id <= MAX_UINT32:
+            # request_id is the last field, so appending it keeps the canonical field order
+            return template + HEARTBEAT_REQUEST_ID_TAG + encode_varint(request_id)
+        return self._encode_heartbeat_message(msg_dict, None)
+
+    def _encode_heartbeat_message(self, msg_dict: dict, cache_key) -> bytes:
         try:
             proto_message = messages.HeartBeatMessage()
-            proto_message.type = msg_dict.get("type")
-            proto_message.msg = msg_dict.get("msg")
-            proto_message.client_host = msg_dict.get("client_host")
-            proto_message.identifier = int(msg_dict.get("identifier"))
-            proto_message.client_port = int(msg_dict.get("client_port"))
-            return proto_message.SerializeToString()  # serialize
+            _fill_heartbeat(proto_message, msg_dict)
+            serialized = proto_message.SerializeToString()  # serialize
+            if cache_key is not None and self.heartbeat_cache_size > 0:
+                template = serialized
+                if proto_message.request_id:
+                    proto_message.ClearField("request_id")
+                    template = proto_message.SerializeToString()
+                self._heartbeat_templates[cache_key] = template
+                if len(self._heartbeat_templates) > self.heartbeat_cache_size:
+                    self._heartbeat_templates.popitem(last=False)
+            return serialized
         except TypeError as e:
             log.error(f"encode_heartbeat exception happened")
             proto_message = messages.ErrorMessage()
@@ -28,24 +109,61 @@ class ProtobufEncoderDecoder(BaseEncoderDecoder):
             proto_message.error = str(e)
             return proto_message.SerializeToString()  # serialize
 
+    def encode_heartbeat_record(self, record: HeartBeat) -> bytes:
+        """
+        Serialize a heartbeat record, sharing the template cache with encode_heartbeat.
+        The fields are read by position, not through .get().
+        :param record: the data to serialize
+        :return: binary string format data.
+        """
+        # the first five fields are in the order of the encode_heartbeat cache key
+        key = record[:5]
+        try:
+            template = self._heartbeat_templates.get(key)
+        except TypeError:  # unhashable values can not be cached
+            return self._encode_heartbeat_message(record.to_dict(), None)
+        if template is None:
+            return self._encode_heartbeat_message(record.to_dict(), key)
+
+        self._heartbeat_templates.move_to_end(key)
+        request_id = record.request_id
+        if not request_id:
+            return template
+        if type(request_id) is int and 0 < request_id <= MAX_UINT32:
+            return template + HEARTBEAT_REQUEST_ID_TAG + encode_varint(request_id)
+        return self._encode_heartbeat_message(record.to_dict(), None)
+
+    def decode_heartbeat_record(self, binary_data: bytes) -> Record:
+        """
+        Deserialize binary data for a heartbeat message.
+        :param binary_data: the data to deserialize.
+        :return: a HeartBeat record, an Error record for any other message.
+        """
+        deserialized = messages.HeartBeatMessage.FromString(binary_data)
+        if deserialized.type == messages.MessageType.MESSAGE_TYPE_HEARTBEAT:
+            return HeartBeat(
+                deserialized.type,
+                deserialized.msg,
+                deserialized.client_host,
+                deserialized.client_port,
+                deserialized.identifier,
+                deserialized.request_id,
+            )
+        log.error(f"decode_heartbeat exception happened")
+        return INCORRECT_DECODER
+
     def decode_heartbeat(self, binary_data):
         """
         Deserialize binary data for a heartbeat message.
         :param binary_data: the data to deserialize.
-        :return: a decoded dict format message.
+        :return: a decoded dict format message. request_id is only present when it is set.
         """
         proto_message = messages.HeartBeatMessage()
         deserialized = proto_message.FromString(
             binary_data
         )  # deserialize, input will be bytes
         if deserialized.type == messages.MessageType.MESSAGE_TYPE_HEARTBEAT:
-            return {
-                "type": deserialized.type,
-                "msg": deserialized.msg,
-                "client_host": deserialized.client_host,
-                "identifier": deserialized.identifier,
-                "client_port": deserialized.client_port,
-            }
+            return _heartbeat_to_dict(deserialized)
         else:
             log.error(f"decode_heartbeat exception happened")
             return {
@@ -64,6 +182,7 @@ class ProtobufEncoderDecoder(BaseEncoderDecoder):
             proto_message.type = msg_dict.get("type")
             proto_message.identifier = int(msg_dict.get("identifier"))
             proto_message.message_count = int(msg_dict.get("message_count"))
+            proto_message.request_id = int(msg_dict.get("request_id", 0))
             return proto_message.SerializeToString()  # serialize
         except TypeError as e:
             log.error(f"encode_status exception happened")
@@ -76,21 +195,130 @@ class ProtobufEncoderDecoder(BaseEncoderDecoder):
         """
         Deserialize binary data for a status message.
         :param binary_data: the data to deserialize.
-        :return: a decoded dict format message.
+        :return: a decoded dict format message. request_id is only present when it is set.
         """
         proto_message = messages.StatusMessage()
         deserialized = proto_message.FromString(
             binary_data
         )  # deserialize, input will be bytes
         if deserialized.type == messages.MessageType.MESSAGE_TYPE_STATUS:
-            return {
+            decoded = {
                 "type": deserialized.type,
                 "message_count": deserialized.message_count,
                 "identifier": deserialized.identifier,
             }
+            if deserialized.request_id:
+                decoded["request_id"] = deserialized.request_id
+            return decoded
         else:
             log.error(f"decode_status exception happened")
             return {
                 "type": messages.MessageType.MESSAGE_TYPE_ERROR,
                 "msg": "incorrect decoder",
             }
+
+    def encode_status_record(self, record: Status) -> bytes:
+        """
+        Serialize a status record.
+        :param record: the data to serialize
+        :return: binary string format data.
+        """
+        return self.encode_status(record)
+
+    def decode_status_record(self, binary_data: bytes) -> Record:
+        """
+        Deserialize binary data for a status message.
+        :param binary_data: the data to deserialize.
+        :return: a Status record, an Error record for any other message.
+        """
+        deserialized = messages.StatusMessage.FromString(binary_data)
+        if deserialized.type == messages.MessageType.MESSAGE_TYPE_STATUS:
+            return Status(
+                deserialized.type,
+                deserialized.message_count,
+                deserialized.identifier,
+                deserialized.request_id,
+            )
+        log.error(f"decode_status exception happened")
+        return INCORRECT_DECODER
+
+    def encode_heartbeat_batch(self, msg_dict: dict) -> bytes:
+        """
+        Serialize many heartbeat messages as one HeartBeatBatch.
+        :param msg_dict: the data to serialize, the heartbeats are a list under "heartbeats".
+        :return: binary string format data.
+        """
+        try:
+            proto_message = messages.HeartBeatBatch()
+            proto_message.type = msg_dict.get("type")
+            for heartbeat in msg_dict.get("heartbeats"):
+                _fill_heartbeat(proto_message.heartbeats.add(), heartbeat)
+            return proto_message.SerializeToString()  # serialize
+        except TypeError as e:
+            log.error(f"encode_heartbeat_batch exception happened")
+            proto_message = messages.ErrorMessage()
+            proto_message.type = messages.MessageType.MESSAGE_TYPE_ERROR
+            proto_message.error = str(e)
+            return proto_message.SerializeToString()  # serialize
+
+    def decode_heartbeat_batch(self, binary_data: bytes) -> dict:
+        """
+        Deserialize binary data for a HeartBeatBatch message.
+        :param binary_data: the data to deserialize.
+        :return: a decoded dict format message with the heartbeats as a list of dicts.
+        """
+        proto_message = messages.HeartBeatBatch()
+        deserialized = proto_message.FromString(
+            binary_data
+        )  # deserialize, input will be bytes
+        if deserialized.type == messages.MessageType.MESSAGE_TYPE_HEARTBEAT_BATCH:
+            return {
+                "type": deserialized.type,
+                "heartbeats": [
+                    _heartbeat_to_dict(heartbeat)
+                    for heartbeat in deserialized.heartbeats
+                ],
+            }
+        else:
+            log.error(f"decode_heartbeat_batch exception happened")
+            return {
+                "type": messages.MessageType.MESSAGE_TYPE_ERROR,
+                "msg": "incorrect decoder",
+            }
+
+    def encode_error(self, msg_dict: dict) -> bytes:
+        """
+        Serialize an error message.
+        :param msg_dict: the data to serialize, the error text is under "msg".
+        :return: binary string format data.
+        """
+        try:
+            proto_message = messages.ErrorMessage()
+            proto_message.type = msg_dict.get("type")
+            proto_message.error = msg_dict.get("msg")
+            return proto_message.SerializeToString()  # serialize
+        except TypeError as e:
+            log.error(f"encode_error exception happened")
+            proto_message = messages.ErrorMessage()
+            proto_message.type = messages.MessageType.MESSAGE_TYPE_ERROR
+            proto_message.error = str(e)
+            return proto_message.SerializeToString()  # serialize
+
+    def decode_error(self, binary_data: bytes) -> dict:
+        """
+        Deserialize binary data for an error message.
+        :param binary_data: the data to deserialize.
+        :return: a decoded dict format message with the error text under "msg".
+        """
+        proto_message = messages.ErrorMessage()
+        deserialized = proto_message.FromString(
+            binary_data
+        )  # deserialize, input will be bytes
+        if deserialized.type == messages.MessageType.MESSAGE_TYPE_ERROR:
+            return {"type": deserialized.type, "msg": deserialized.error}
+        else:
+            log.error(f"decode_error exception happened")
+            return {
+                "type": messages.MessageType.MESSAGE_TYPE_ERROR,
+                "msg": "incorrect decoder",
+            }
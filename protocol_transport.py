@@ -0,0 +1,262 @@
+import asyncio
+import collections
+import functools
+import logging
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+from framing import HEADER, HEADER_SIZE, MAX_FRAME_SIZE, FrameError
+
+log = logging.getLogger("__main__." + __name__)
+
+# the transports Client can use
+STREAMS = "streams"
+PROTOCOL = "protocol"
+
+# the receive buffer is compacted when less than this is free at its end
+MIN_FREE = 4096
+
+
+class MessageProtocol(asyncio.BufferedProtocol):
+    """
+    A connection which receives straight into one reusable buffer and cuts it into messages
+    in buffer_updated(): frames when framed, every received chunk otherwise, like the
+    read(1024) of the streams transport.
+    The protocol is both the reader and the writer of the connection: it has the methods of
+    StreamReader and StreamWriter which Client and ConnectionPool use, so the code serving a
+    connection is the same for both transports.
+    """
+
+    def __init__(
+        self,
+        framed: bool,
+        max_frame_size: int = MAX_FRAME_SIZE,
+        buffer_size: int = 65536,
+        handler: Optional[Callable[..., Awaitable]] = None,
+    ):
+        """
+        :param framed: messages are prefixed with their length, see framing.py.
+        :param max_frame_size: the largest accepted payload.
+        :param buffer_size: the initial size of the receive buffer, it grows for larger frames.
+        :param handler: for accepted connections, called as handler(protocol, protocol).
+        """
+        self.framed = framed
+        self.max_frame_size = max_frame_size
+        self.handler = handler
+        self.transport: Optional[asyncio.Transport] = None
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # first byte not cut into a message yet
+        self._end = 0  # end of the received bytes
+        self._frame_size = 0  # size of the partly received frame, header included
+        self._messages: Deque[bytes] = collections.deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._eof = False
+        self._exception: Optional[BaseException] = None
+        self._paused = False
+        self._drain_waiter: Optional[asyncio.Future] = None
+        self._closed: Optional[asyncio.Future] = None
+        self._handler_task: Optional[asyncio.Task] = None
+
+    # asyncio.BufferedProtocol
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+        self._closed = asyncio.get_running_loop().create_future()
+        if self.handler is not None:
+            self._handler_task = asyncio.ensure_future(self._handle())
+
+    async def _handle(self) -> None:
+        try:
+            await self.handler(self, self)
+        except Exception:
+            log.exception("handling a connection failed")
+            self.close()
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        if self._start == self._end:
+            self._start = self._end = 0
+        pending = self._end - self._start
+        wanted = max(MIN_FREE, self._frame_size - pending)
+        if len(self._buffer) - self._end < wanted and self._start:
+            # move the start of the next message to the front
+            self._buffer[:pending] = self._view[self._start : self._end]
+            self._start, self._end = 0, pending
+        if len(self._buffer) - self._end < wanted:
+            # a bytearray can not be resized while a memoryview of it exists, the view
+            # handed to the transport is released once buffer_updated() returns
+            self._view.release()
+            self._buffer.extend(bytes(max(wanted, len(self._buffer))))
+            self._view = memoryview(self._buffer)
+        return self._view[self._end :]
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self._end += nbytes
+        if not self.framed:
+            self._messages.append(bytes(self._view[self._start : self._end]))
+            self._start = self._end = 0
+            self._wake()
+            return
+
+        start, end, view = self._start, self._end, self._view
+        received = len(self._messages)
+        while end - start >= HEADER_SIZE:
+            (length,) = HEADER.unpack_from(view, start)
+            if length > self.max_frame_size:
+                self._fail(
+                    FrameError(
+                        f"frame of {length} bytes exceeds {self.max_frame_size} bytes"
+                    )
+                )
+                self.transport.close()
+                return
+            payload = start + HEADER_SIZE
+            if end - payload < length:
+                # get_buffer() makes room for the rest of the frame
+                self._frame_size = HEADER_SIZE + length
+                break
+            self._messages.append(bytes(view[payload : payload + length]))
+            start = payload + length
+        else:
+            self._frame_size = 0
+        self._start = start
+        if len(self._messages) > received:
+            self._wake()
+
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._wake()
+        return False
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._eof = True
+        if exc is not None:
+            self._fail(exc)
+        self._wake()
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            if exc is None:
+                self._drain_waiter.set_result(None)
+            else:
+                self._drain_waiter.set_exception(exc)
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    def pause_writing(self) -> None:
+        self._paused = True
+
+    def resume_writing(self) -> None:
+        self._paused = False
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+
+    def _fail(self, exc: BaseException) -> None:
+        if self._exception is None:
+            self._exception = exc
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    # reader side
+
+    async def read_message(self) -> bytes:
+        """
+        :return: the next message, empty bytes when the peer closed the connection.
+        """
+        while not self._messages:
+            if self._exception is not None:
+                raise self._exception
+            if self._eof:
+                return b""
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._messages.popleft()
+
+    def at_eof(self) -> bool:
+        return self._eof and not self._messages
+
+    def exception(self) -> Optional[BaseException]:
+        return self._exception
+
+    # writer side
+
+    def write(self, data: bytes) -> None:
+        self.transport.write(data)
+
+    def writelines(self, chunks) -> None:
+        self.transport.writelines(chunks)
+
+    async def drain(self) -> None:
+        if self.transport.is_closing():
+            # let connection_lost() run, like StreamWriter.drain()
+            await asyncio.sleep(0)
+            if self._exception is not None:
+                raise self._exception
+            raise ConnectionResetError("Connection lost")
+        if self._paused:
+            self._drain_waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._drain_waiter
+            finally:
+                self._drain_waiter = None
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+
+    def is_closing(self) -> bool:
+        return self.transport is None or self.transport.is_closing()
+
+    async def wait_closed(self) -> None:
+        if self._closed is not None:
+            await asyncio.shield(self._closed)
+
+    def get_extra_info(self, name: str, default=None):
+        return self.transport.get_extra_info(name, default)
+
+
+async def open_message_connection(
+    host: str, port: int, framed: bool, max_frame_size: int = MAX_FRAME_SIZE
+) -> Tuple[MessageProtocol, MessageProtocol]:
+    """
+    Connect to a server, see asyncio.open_connection().
+    :return: (reader, writer), both are the MessageProtocol of the connection.
+    """
+    _, protocol = await asyncio.get_running_loop().create_connection(
+        lambda: MessageProtocol(framed, max_frame_size), host, port
+    )
+    return protocol, protocol
+
+
+def connector(transport: str, framed: bool) -> Optional[Callable]:
+    """
+    :return: the connect function of a ConnectionPool for a transport, None for the default.
+    """
+    if transport == PROTOCOL:
+        return functools.partial(open_message_connection, framed=framed)
+    return None
+
+
+async def start_message_server(
+    handler: Callable[..., Awaitable],
+    host: str,
+    port: int,
+    framed: bool,
+    max_frame_size: int = MAX_FRAME_SIZE,
+    **kwargs,
+) -> asyncio.AbstractServer:
+    """
+    Listen for connections, see asyncio.start_server().
+    :param handler: called as handler(reader, writer) for every accepted connection, both
+        are its MessageProtocol.
+    :param kwargs: passed to loop.create_server(), like backlog and reuse_port.
+    """
+    return await asyncio.get_running_loop().create_server(
+        lambda: MessageProtocol(framed, max_frame_size, handler=handler),
+        host,
+        port,
+        **kwargs,
+    )
@@ -0,0 +1,206 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import random
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+log = logging.getLogger("__main__." + __name__)
+
+# what to do with ticks which are due while the previous call is still running,
+# or which passed while the event loop was blocked
+SKIP = "skip"
+CATCH_UP = "catch_up"
+
+
+class ScheduledJob:
+    """
+    A coroutine function called at a fixed rate by a HeartbeatScheduler.
+    """
+
+    __slots__ = (
+        "func",
+        "interval",
+        "jitter",
+        "missed",
+        "base",
+        "owed",
+        "running",
+        "cancelled",
+        "calls",
+        "missed_ticks",
+    )
+
+    def __init__(
+        self,
+        func: Callable[[], Awaitable],
+        interval: float,
+        jitter: float,
+        missed: str,
+        base: float,
+    ):
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.missed = missed
+        self.base = base  # nominal time of the next tick, jitter is never accumulated
+        self.owed = 0
+        self.running = False
+        self.cancelled = False
+        self.calls = 0
+        self.missed_ticks = 0
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class HeartbeatScheduler:
+    """
+    Drives many periodic jobs from one coroutine with a heap ordered by deadline.
+    Ticks are fixed-rate: the n-th tick of a job is due at start + n * interval
+    however long the previous calls took, plus an optional random jitter.
+    The calls still running when run() is cancelled are cancelled with it.
+    """
+
+    def __init__(self, clock=None):
+        """
+        :param clock: where the time comes from, an object with the time() and call_at()
+            methods of an event loop. The running loop when None.
+        """
+        self._clock = clock
+        self._heap: List[Tuple[float, int, ScheduledJob]] = []
+        self._sequence = itertools.count()
+        self._waiter: Optional[asyncio.Future] = None
+        self._calls: Set[asyncio.Task] = set()
+
+    def _time(self) -> float:
+        clock = self._clock if self._clock is not None else asyncio.get_running_loop()
+        return clock.time()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(
+        self,
+        interval: float,
+        func: Callable[..., Awaitable],
+        *args,
+        start_delay: float = 0.0,
+        jitter: float = 0.0,
+        missed: str = SKIP,
+    ) -> ScheduledJob:
+        """
+        Call func(*args) every interval seconds until the job is cancelled.
+        :param interval: interval in seconds.
+        :param func: coroutine function to call.
+        :param start_delay: seconds until the first tick.
+        :param jitter: every tick is delayed by a random 0..jitter seconds to spread the load.
+        :param missed: SKIP drops ticks that could not run on time, CATCH_UP runs them late.
+        :return: the job, call cancel() on it to stop.
+        """
+        if missed not in (SKIP, CATCH_UP):
+            raise ValueError(f"unknown missed tick policy {missed}")
+        job = ScheduledJob(
+            lambda: func(*args), interval, jitter, missed, self._time() + start_delay
+        )
+        self._push(job)
+        return job
+
+    def _push(self, job: ScheduledJob) -> None:
+        when = job.base
+        if job.jitter:
+            when += random.uniform(0, job.jitter)
+        heapq.heappush(self._heap, (when, next(self._sequence), job))
+        # wake run() so it can sleep until the new earliest deadline
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _sleep_until(self, when: float) -> None:
+        loop = asyncio.get_running_loop()
+        self._waiter = loop.create_future()
+        handle = None
+        if when != math.inf:
+            clock = self._clock if self._clock is not None else loop
+            handle = clock.call_at(when, self._wake, self._waiter)
+        try:
+            await self._waiter
+        finally:
+            if handle is not None:
+                handle.cancel()
+            self._waiter = None
+
+    @staticmethod
+    def _wake(waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            waiter.set_result(None)
+
+    async def run(self) -> None:
+        """
+        Run the jobs until cancelled, then cancel the calls which are still running.
+        """
+        try:
+            while True:
+                if not self._heap:
+                    await self._sleep_until(math.inf)
+                    continue
+                when, _, job = self._heap[0]
+                now = self._time()
+                if when > now:
+                    await self._sleep_until(when)
+                    continue
+
+                heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+                self._fire(job)
+
+                job.base += job.interval
+                behind = now - job.base
+                if behind >= 0:
+                    # the loop woke up more than one interval late
+                    ticks = math.floor(behind / job.interval) + 1
+                    if job.missed == SKIP:
+                        job.base += ticks * job.interval
+                        job.missed_ticks += ticks
+                        log.debug("scheduler skipped %s ticks", ticks)
+                self._push(job)
+        finally:
+            await self.stop()
+
+    async def stop(self) -> None:
+        """
+        Cancel the calls which are still running and wait for them to finish.
+        """
+        calls = list(self._calls)
+        for call in calls:
+            call.cancel()
+        await asyncio.gather(*calls, return_exceptions=True)
+
+    def _fire(self, job: ScheduledJob) -> None:
+        if not job.running:
+            job.running = True
+            # the loop only keeps weak references to tasks
+            call = asyncio.ensure_future(self._invoke(job))
+            self._calls.add(call)
+            call.add_done_callback(self._calls.discard)
+        elif job.missed == CATCH_UP:
+            job.owed += 1
+        else:
+            job.missed_ticks += 1
+            log.debug("scheduler skipped a tick, the previous call is still running")
+
+    @staticmethod
+    async def _invoke(job: ScheduledJob) -> None:
+        try:
+            while True:
+                job.calls += 1
+                try:
+                    await job.func()
+                except Exception as e:
+                    log.error("scheduled job failed: %s", e)
+                if job.owed == 0 or job.cancelled:
+                    break
+                job.owed -= 1
+        finally:
+            job.running = False
@@ -0,0 +1,386 @@
+"""
+A local stand-in for the heartbeat server, to run the client and load tests without it.
+
+    python stand_in_server.py --port 4000 --latency 0.002 --jitter 0.001 --error-rate 0.01
+    python stand_in_server.py --status-rate 100 --client-port 3000 --identifier 1234
+
+It acks every heartbeat by echoing it with msg "ack", over UDP too with --udp, and can send
+status requests to the listener of a client at a fixed rate.
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from encode_decode_executor import EncodeDecodeExecutor
+from framing import encode_frame, read_frame
+from encoder_decoders import ENCODER_DECODERS
+import messages_pb2 as messages
+
+# the type is the first field of every message and the heartbeat type, 0, is not encoded
+HEARTBEAT_BATCH_PREFIX = bytes(
+    [0x08, messages.MessageType.MESSAGE_TYPE_HEARTBEAT_BATCH]
+)
+
+log = logging.getLogger("__main__." + __name__)
+
+
+class StandInStats:
+    """
+    What the stand-in server did so far.
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.datagrams = 0
+        self.heartbeats = 0
+        self.batches = 0
+        self.errors_injected = 0
+        self.drops_injected = 0
+        self.status_connections = 0
+        self.status_sent = 0
+        self.status_replies = 0
+        self.status_failed = 0
+        self.status_latencies: List[float] = []  # seconds from request to status reply
+
+
+class _DatagramAcker(asyncio.DatagramProtocol):
+    def __init__(self, server: "StandInServer"):
+        self.server = server
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.tasks = set()
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        task = asyncio.ensure_future(self.server.answer_datagram(data, addr))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+
+class StandInServer:
+    def __init__(
+        self,
+        encoder_decoder: EncodeDecodeExecutor,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        framed: bool = False,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: Optional[int] = None,
+        udp: bool = False,
+    ):
+        """
+        :param encoder_decoder: the encoder/decoder the clients use.
+        :param host: address to listen on.
+        :param port: port to listen on, 0 picks a free one, see port after start().
+        :param framed: read and write length-prefixed frames, like Client(framed=True).
+        :param latency: seconds to wait before every reply.
+        :param jitter: a random 0..jitter seconds added to every latency.
+        :param error_rate: share of heartbeats answered with an ErrorMessage.
+        :param drop_rate: share of heartbeats after which the connection is closed unanswered.
+        :param seed: seed of the random numbers for reproducible runs.
+        :param udp: also ack heartbeat datagrams on the same port number, drop_rate then is
+            the share of datagrams left unanswered.
+        """
+        self.encoder_decoder = encoder_decoder
+        self.host = host
+        self.port = port
+        self.framed = framed
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.stats = StandInStats()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.udp = udp
+        self._datagrams: Optional[_DatagramAcker] = None
+        self._request_ids = itertools.count()
+        # framed status connections are kept open and reused, like the real server does
+        self._status_connections: Dict[Tuple[str, int], list] = {}
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(
+            self.handle_client, self.host, self.port
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.udp:
+            (
+                _,
+                self._datagrams,
+            ) = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: _DatagramAcker(self), local_addr=(self.host, self.port)
+            )
+        log.info("stand-in server listening on %s:%s", self.host, self.port)
+
+    async def close(self) -> None:
+        for connections in self._status_connections.values():
+            for _, writer in connections:
+                writer.close()
+        self._status_connections.clear()
+        if self._datagrams is not None:
+            self._datagrams.transport.close()
+            for task in list(self._datagrams.tasks):
+                task.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _read(self, reader: asyncio.StreamReader) -> bytes:
+        if not self.framed:
+            return await reader.read(1024)
+        try:
+            return await read_frame(reader)
+        except asyncio.IncompleteReadError:
+            return b""
+
+    def _write(self, writer: asyncio.StreamWriter, payload: bytes) -> None:
+        writer.write(encode_frame(payload) if self.framed else payload)
+
+    async def _delay(self) -> None:
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _reply(self, data: bytes) -> Optional[bytes]:
+        """
+        The serialized reply to a heartbeat or a heartbeat batch, None to drop the connection.
+        """
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            self.stats.drops_injected += 1
+            return None
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats.errors_injected += 1
+            error = messages.ErrorMessage()
+            error.type = messages.MessageType.MESSAGE_TYPE_ERROR
+            error.error = "injected error"
+            return error.SerializeToString()
+
+        # the heartbeats of a batch do not decode as the msg string of a heartbeat
+        if data.startswith(HEARTBEAT_BATCH_PREFIX):
+            batch = self.encoder_decoder.decode_heartbeat_batch(data)
+            self.stats.batches += 1
+            self.stats.heartbeats += len(batch["heartbeats"])
+            for heartbeat in batch["heartbeats"]:
+                heartbeat["msg"] = "ack"
+            return self.encoder_decoder.encode_heartbeat_batch(batch)
+
+        heartbeat = self.encoder_decoder.decode_heartbeat(data)
+        if heartbeat["type"] == messages.MessageType.MESSAGE_TYPE_HEARTBEAT:
+            self.stats.heartbeats += 1
+            heartbeat["msg"] = "ack"
+            return self.encoder_decoder.encode_heartbeat(heartbeat)
+        log.error("stand-in server received an unknown message")
+        return None
+
+    async def _answer(self, data: bytes, writer: asyncio.StreamWriter) -> bool:
+        await self._delay()
+        try:
+            reply = self._reply(data)
+        except Exception as e:
+            log.error("stand-in server could not decode a message: %s", e)
+            reply = None
+        if reply is None:
+            writer.close()
+            return False
+        self._write(writer, reply)
+        await writer.drain()
+        return True
+
+    async def answer_datagram(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.stats.datagrams += 1
+        await self._delay()
+        try:
+            reply = self._reply(data)
+        except Exception as e:
+            log.error("stand-in server could not decode a datagram: %s", e)
+            return
+        if reply is not None and not self._datagrams.transport.is_closing():
+            self._datagrams.transport.sendto(reply, addr)
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Ack heartbeats until the client closes the connection. Unframed messages are answered
+        one at a time, framed ones concurrently so that pipelined requests overtake each other.
+        """
+        self.stats.connections += 1
+        tasks = set()
+        try:
+            while True:
+                data = await self._read(reader)
+                if not data:
+                    break
+                if not self.framed:
+                    if not await self._answer(data, writer):
+                        return
+                else:
+                    task = asyncio.ensure_future(self._answer(data, writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, OSError) as e:
+            log.error("stand-in server connection failed: %s", e)
+        writer.close()
+
+    async def request_status(
+        self, client_ip: str, client_port: int, identifier: int
+    ) -> Optional[dict]:
+        """
+        Ask the listener of a client for its status, then ack the status like the server does.
+        Framed connections are reused for the next requests.
+        :return: the decoded status, None when the client did not answer.
+        """
+        self.stats.status_sent += 1
+        request = {
+            "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+            "message_count": 0,
+            "identifier": identifier,
+            "request_id": next(self._request_ids) % 0xFFFFFFFF + 1,
+        }
+        start = time.perf_counter()
+        key = (client_ip, client_port)
+        idle = self._status_connections.setdefault(key, [])
+        while True:
+            reused = bool(idle)
+            if reused:
+                reader, writer = idle.pop()
+            else:
+                try:
+                    reader, writer = await asyncio.open_connection(
+                        client_ip, client_port
+                    )
+                except (ConnectionError, OSError) as e:
+                    log.error("could not connect to the client listener: %s", e)
+                    self.stats.status_failed += 1
+                    return None
+                self.stats.status_connections += 1
+            try:
+                status = await self._exchange_status(reader, writer, request)
+            except (ConnectionError, OSError) as e:
+                status = None
+                log.error("status request to the client failed: %s", e)
+            if status is None:
+                writer.close()
+                if reused:
+                    # the client closed the idle connection, try a new one
+                    continue
+                self.stats.status_failed += 1
+                return None
+            self.stats.status_latencies.append(time.perf_counter() - start)
+            self.stats.status_replies += 1
+            if self.framed:
+                idle.append((reader, writer))
+            else:
+                writer.close()
+            return status
+
+    async def _exchange_status(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        request: dict,
+    ) -> Optional[dict]:
+        self._write(writer, self.encoder_decoder.encode_status(request))
+        await writer.drain()
+        data = await self._read(reader)
+        if not data:
+            return None
+        status = self.encoder_decoder.decode_status(data)
+        ack = {
+            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+            "msg": "ack",
+            "client_host": self.host,
+            "client_port": self.port,
+            "identifier": request["identifier"],
+        }
+        self._write(writer, self.encoder_decoder.encode_heartbeat(ack))
+        await writer.drain()
+        return status
+
+    async def drive_status_requests(
+        self,
+        client_ip: str,
+        client_port: int,
+        identifiers: List[int],
+        rate: float,
+        count: Optional[int] = None,
+    ) -> None:
+        """
+        Send status requests at a fixed rate, without waiting for the earlier ones to finish,
+        cycling through the identifiers.
+        :param rate: requests per second.
+        :param count: stop after this many requests, run forever when None.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tasks = set()
+        for sent, identifier in enumerate(itertools.cycle(identifiers)):
+            if count is not None and sent >= count:
+                break
+            delay = start + sent / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.ensure_future(
+                self.request_status(client_ip, client_port, identifier)
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+async def main(args) -> None:
+    encoder_decoder = EncodeDecodeExecutor(ENCODER_DECODERS[args.encoder_decoder]())
+    server = StandInServer(
+        encoder_decoder,
+        host=args.host,
+        port=args.port,
+        framed=args.framed,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        drop_rate=args.drop_rate,
+        seed=args.seed,
+        udp=args.udp,
+    )
+    await server.start()
+    if args.status_rate:
+        identifiers = list(range(args.identifier, args.identifier + args.fleet_size))
+        await server.drive_status_requests(
+            args.client_ip, args.client_port, identifiers, args.status_rate
+        )
+    await server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--framed", action="store_true")
+    parser.add_argument("--udp", action="store_true", help="ack heartbeat datagrams")
+    parser.add_argument("--encoder-decoder", default="protobuf")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--status-rate", type=float, default=0.0)
+    parser.add_argument("--client-ip", default="127.0.0.1")
+    parser.add_argument("--client-port", type=int, default=3000)
+    parser.add_argument("--identifier", type=int, default=1234)
+    parser.add_argument("--fleet-size", type=int, default=1)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
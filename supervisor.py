@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from admission import AdmissionController
+from circuit_breaker import CircuitBreaker
+from client_fleet import ClientFleet
+from client_state import ClientState, capacity_for
+from encode_decode_executor import EncodeDecodeExecutor, make_codec_pool
+from logging_setup import configure_logging
+from metrics import REGISTRY, ClientMetrics, Registry, client_metrics
+from scheduler import SKIP
+from udp_transport import DatagramHeartbeatSender
+
+log = logging.getLogger("__main__." + __name__)
+
+# the ClientMetrics counters reported by workers and summed up by the supervisor
+WORKER_COUNTERS = (
+    "sent",
+    "acked",
+    "failed",
+    "bytes_out",
+    "bytes_in",
+    "reconnects",
+    "retransmits",
+    "conflated",
+    "circuit_rejected",
+    "status_requests",
+    "status_rejected",
+)
+# the ClientMetrics histograms reported by workers, as bucket counts, sum and count
+WORKER_HISTOGRAMS = ("heartbeat_seconds", "status_seconds")
+
+HistogramStats = Tuple[Tuple[int, ...], float, int]
+
+
+def shard(first_identifier: int, count: int, workers: int) -> List[range]:
+    """
+    Split the identifiers first_identifier.. first_identifier + count - 1 into contiguous
+    ranges, one per worker, whose sizes differ by at most one.
+    """
+    if not 0 < workers <= count:
+        raise ValueError("workers must be between 1 and the number of identifiers")
+    size, extra = divmod(count, workers)
+    shards = []
+    start = first_identifier
+    for index in range(workers):
+        end = start + size + (1 if index < extra else 0)
+        shards.append(range(start, end))
+        start = end
+    return shards
+
+
+def worker_log_filename(filename: Optional[str], index: int) -> Optional[str]:
+    # log/client.log -> log/client.worker0.log, processes do not share a log file
+    if not filename:
+        return filename
+    root, ext = os.path.splitext(filename)
+    return f"{root}.worker{index}{ext}"
+
+
+def run_worker(
+    index: int,
+    config: dict,
+    senders: range,
+    heartbeat_counts,
+    stats: multiprocessing.Queue,
+) -> None:
+    """
+    The entry point of a worker process: a ClientFleet which sends the heartbeats of senders
+    and serves status requests for every identifier on a port shared with the other workers.
+    :param config: see Supervisor.
+    """
+    logging_config = config.get("logging", {})
+    log_listener = configure_logging(
+        mode=logging_config.get("mode", "queue"),
+        filename=worker_log_filename(
+            logging_config.get("filename", "log/client.log"), index
+        ),
+        level=logging_config.get("level", logging.DEBUG),
+        rate_limit=logging_config.get("rate_limit", 0.0),
+    )
+    try:
+        asyncio.run(_worker(index, config, senders, heartbeat_counts, stats))
+    finally:
+        if log_listener is not None:
+            log_listener.stop()
+
+
+async def _worker(
+    index: int,
+    config: dict,
+    senders: range,
+    heartbeat_counts,
+    stats: multiprocessing.Queue,
+) -> None:
+    codec_pool = config.get("codec_pool", {})
+    encoder_decoder = EncodeDecodeExecutor(
+        config["encoder_decoder"](),
+        pool=make_codec_pool(codec_pool.get("kind"), codec_pool.get("workers")),
+        offload_threshold=codec_pool.get("offload_threshold", 16384),
+    )
+    # the supervisor gave every identifier its record, workers only update them
+    state = ClientState(config["state"]) if config.get("state") else None
+    datagram_sender = None
+    if config.get("datagram") is not None:
+        fleet_config = config["fleet"]
+        datagram_sender = DatagramHeartbeatSender(
+            encoder_decoder,
+            fleet_config["server_ip"],
+            fleet_config["server_port"],
+            **config["datagram"],
+        )
+    fleet = ClientFleet(
+        encoder_decoder=encoder_decoder,
+        admission=AdmissionController(**config.get("admission", {})),
+        circuit_breaker=CircuitBreaker(**config.get("circuit_breaker", {})),
+        senders=senders,
+        heartbeat_counts=heartbeat_counts,
+        reuse_port=True,
+        datagram_sender=datagram_sender,
+        state=state,
+        **config["fleet"],
+    )
+    metrics = client_metrics()
+    log.info("worker %s: sending heartbeats for %s", index, senders)
+    await fleet.start_server()
+    heartbeats = asyncio.ensure_future(
+        fleet.send_heartbeats(
+            config["heartbeat_interval"],
+            jitter=config.get("heartbeat_jitter", 0.0),
+            missed=config.get("heartbeat_missed", SKIP),
+        )
+    )
+    try:
+        while not heartbeats.done():
+            stats.put((index, os.getpid(), worker_stats(metrics)))
+            await asyncio.wait({heartbeats}, timeout=config.get("report_interval", 1.0))
+        heartbeats.result()
+    finally:
+        heartbeats.cancel()
+        await fleet.close()
+        if encoder_decoder.pool is not None:
+            encoder_decoder.pool.shutdown()
+        if state is not None:
+            state.close()
+
+
+def worker_stats(metrics: ClientMetrics) -> dict:
+    stats = {name: getattr(metrics, name).value for name in WORKER_COUNTERS}
+    for name in WORKER_HISTOGRAMS:
+        histogram = getattr(metrics, name)
+        stats[name] = (tuple(histogram.counts), histogram.sum, histogram.count)
+    return stats
+
+
+def add_histograms(histograms: Iterable[HistogramStats]) -> HistogramStats:
+    """
+    Sum up histograms reported by worker_stats() bucket by bucket.
+    """
+    counts, total, count = None, 0.0, 0
+    for histogram_counts, histogram_sum, histogram_count in histograms:
+        if counts is None:
+            counts = histogram_counts
+        else:
+            counts = tuple(a + b for a, b in zip(counts, histogram_counts))
+        total += histogram_sum
+        count += histogram_count
+    return counts or (), total, count
+
+
+class Supervisor:
+    """
+    Runs the identities of a fleet in several worker processes, one event loop per core.
+    Every worker sends the heartbeats of its share of the identifiers and all of them listen
+    on the same port with SO_REUSEPORT, the kernel spreading the status connections.
+    Heartbeat counts live in shared memory, so any worker answers for any identifier.
+    Workers which exit are started again, their metrics are summed up by the supervisor.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        first_identifier: int,
+        count: int,
+        workers: int,
+        restart_delay: float = 1.0,
+        max_restart_delay: float = 30.0,
+        poll_interval: float = 0.5,
+        registry: Registry = REGISTRY,
+        target: Callable = run_worker,
+    ):
+        """
+        :param config: the settings of the workers, picklable:
+            encoder_decoder: the encoder/decoder class,
+            fleet: the keyword arguments of ClientFleet but the encoder/decoder and admission,
+            admission: the keyword arguments of AdmissionController,
+            codec_pool: kind, workers and offload_threshold, see make_codec_pool,
+            circuit_breaker: the keyword arguments of CircuitBreaker,
+            datagram: the keyword arguments of DatagramHeartbeatSender, None to use TCP,
+            state: the path of the ClientState file of the fleet, None to not keep one,
+            heartbeat_interval, heartbeat_jitter, heartbeat_missed: see
+                ClientFleet.send_heartbeats,
+            report_interval: seconds between the metrics reports of a worker,
+            logging: mode, filename, level and rate_limit, see configure_logging.
+        :param first_identifier: the identifiers are first_identifier.. first_identifier + count - 1.
+        :param count: the number of client identities of all workers together.
+        :param workers: the number of worker processes.
+        :param restart_delay: seconds before a worker which exited is started again, doubled
+            for every exit in a row up to max_restart_delay.
+        :param max_restart_delay: a worker which ran this long is restarted after restart_delay.
+        :param poll_interval: seconds between checks of the workers.
+        :param registry: where the metrics of all workers are summed up.
+        :param target: the function run by the worker processes, see run_worker.
+        """
+        self.config = dict(config)
+        self.config["fleet"] = dict(
+            config["fleet"], first_identifier=first_identifier, count=count
+        )
+        self.first_identifier = first_identifier
+        self.shards = shard(first_identifier, count, workers)
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.poll_interval = poll_interval
+        self.target = target
+        # workers start from a clean interpreter: no event loop or logging thread of ours
+        self._context = multiprocessing.get_context("spawn")
+        self.heartbeat_counts = self._context.Array("q", count, lock=False)
+        if config.get("state"):
+            self._load_state(config["state"], first_identifier, count)
+        self.stats = self._context.Queue()
+        self.processes: List[Optional[multiprocessing.process.BaseProcess]] = [
+            None
+        ] * workers
+        self.restarts = [0] * workers
+        self._started_at = [0.0] * workers
+        self._restart_at: List[Optional[float]] = [None] * workers
+        self._failures = [0] * workers
+        # the last report of the running process of every worker
+        self._latest: Dict[int, dict] = {}
+        self.metrics = client_metrics(registry)
+        # the totals of the processes which exited
+        self._retired = dict.fromkeys(WORKER_COUNTERS, 0)
+        for name in WORKER_HISTOGRAMS:
+            histogram = getattr(self.metrics, name)
+            self._retired[name] = ((0,) * len(histogram.counts), 0.0, 0)
+        registry.gauge(
+            "supervisor_workers_alive",
+            "Worker processes running.",
+            function=lambda: sum(
+                1 for p in self.processes if p is not None and p.is_alive()
+            ),
+        )
+        registry.gauge(
+            "supervisor_worker_restarts",
+            "Worker processes started again after they exited.",
+            function=lambda: sum(self.restarts),
+        )
+        registry.gauge(
+            "supervisor_heartbeat_count",
+            "Heartbeats counted by all identities together.",
+            function=lambda: self.heartbeat_count,
+        )
+
+    def _load_state(self, path: str, first_identifier: int, count: int) -> None:
+        # records are added here, before the workers share the file
+        state = ClientState(path, capacity_for(count))
+        try:
+            for index in range(count):
+                self.heartbeat_counts[index] = state.count(
+                    state.slot(first_identifier + index)
+                )
+        finally:
+            state.close()
+
+    @property
+    def heartbeat_count(self) -> int:
+        return sum(self.heartbeat_counts)
+
+    def start(self) -> None:
+        for index in range(len(self.shards)):
+            self._start(index)
+
+    def _start(self, index: int) -> None:
+        process = self._context.Process(
+            target=self.target,
+            args=(
+                index,
+                self.config,
+                self.shards[index],
+                self.heartbeat_counts,
+                self.stats,
+            ),
+            name=f"client-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+        self._started_at[index] = time.monotonic()
+        self._restart_at[index] = None
+        log.info(
+            "worker %s started, pid %s, identifiers %s",
+            index,
+            process.pid,
+            self.shards[index],
+        )
+
+    def collect(self) -> None:
+        """
+        Read the reports waiting in the queue and update the summed up metrics.
+        """
+        while True:
+            try:
+                index, pid, stats = self.stats.get_nowait()
+            except queue.Empty:
+                break
+            process = self.processes[index]
+            # a late report of a process which was restarted is already retired
+            if process is not None and process.pid == pid:
+                self._latest[index] = stats
+        for name in WORKER_COUNTERS:
+            getattr(self.metrics, name).value = self._retired[name] + sum(
+                stats[name] for stats in self._latest.values()
+            )
+        for name in WORKER_HISTOGRAMS:
+            counts, total, count = add_histograms(
+                [self._retired[name]] + [stats[name] for stats in self._latest.values()]
+            )
+            histogram = getattr(self.metrics, name)
+            histogram.counts = list(counts)
+            histogram.sum = total
+            histogram.count = count
+
+    def poll(self, now: Optional[float] = None) -> None:
+        """
+        Collect the reports and start the workers which exited again when their delay is over.
+        """
+        if now is None:
+            now = time.monotonic()
+        self.collect()
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                self._retire(index, process, now)
+            if self._restart_at[index] is not None and now >= self._restart_at[index]:
+                self.restarts[index] += 1
+                self._start(index)
+
+    def _retire(self, index: int, process, now: float) -> None:
+        process.join()
+        stats = self._latest.pop(index, None)
+        if stats is not None:
+            for name in WORKER_COUNTERS:
+                self._retired[name] += stats[name]
+            for name in WORKER_HISTOGRAMS:
+                self._retired[name] = add_histograms([self._retired[name], stats[name]])
+        if now - self._started_at[index] >= self.max_restart_delay:
+            self._failures[index] = 0
+        delay = min(
+            self.restart_delay * 2 ** self._failures[index], self.max_restart_delay
+        )
+        self._failures[index] += 1
+        self.processes[index] = None
+        self._restart_at[index] = now + delay
+        log.error(
+            "worker %s exited with code %s, starting it again in %.1fs",
+            index,
+            process.exitcode,
+            delay,
+        )
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Terminate the workers and wait at most timeout seconds for each of them.
+        """
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+        self.processes = [None] * len(self.processes)
+        self._restart_at = [None] * len(self.processes)
+
+    async def run(self) -> None:
+        """
+        Start the workers and keep them running until cancelled.
+        """
+        self.start()
+        try:
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                self.poll()
+        finally:
+            self.stop()
@@ -0,0 +1,105 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from admission import OVERLOADED, RATE_LIMITED, AdmissionController, TokenBucket
+from client import Client
+from encode_decode_executor import EncodeDecodeExecutor
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+import messages_pb2 as messages
+
+
+class TokenBucketTestCase(TestCase):
+    def test_rate_and_burst(self):
+        bucket = TokenBucket(rate=10, burst=2, now=0.0)
+        assert bucket.try_acquire(now=0.0)
+        assert bucket.try_acquire(now=0.0)
+        assert not bucket.try_acquire(now=0.0)
+        assert bucket.try_acquire(now=0.1)
+        assert not bucket.try_acquire(now=0.1)
+        # tokens never pile up beyond the burst
+        assert bucket.try_acquire(now=10.0)
+        assert bucket.try_acquire(now=10.0)
+        assert not bucket.try_acquire(now=10.0)
+
+
+class AdmissionControllerTestCase(IsolatedAsyncioTestCase):
+    def test_max_handlers(self):
+        admission = AdmissionController(max_handlers=2)
+        assert admission.try_admit("10.0.0.1") is None
+        assert admission.try_admit("10.0.0.1") is None
+        assert admission.try_admit("10.0.0.2") == OVERLOADED
+        admission.release()
+        assert admission.try_admit("10.0.0.2") is None
+        assert admission.admitted == 3
+        assert admission.rejected == 1
+
+    def test_peer_rate(self):
+        admission = AdmissionController(peer_rate=0.001, peer_burst=1)
+        assert admission.try_admit("10.0.0.1") is None
+        assert admission.try_admit("10.0.0.1") == RATE_LIMITED
+        assert admission.try_admit("10.0.0.2") is None
+
+    async def test_status_requests_wait_for_heartbeats(self):
+        admission = AdmissionController(heartbeat_wait=1.0)
+        order = []
+
+        async def heartbeat():
+            with admission.sending_heartbeat():
+                await asyncio.sleep(0.02)
+                order.append("heartbeat")
+
+        async def status():
+            await asyncio.sleep(0)
+            await admission.wait_for_heartbeats()
+            order.append("status")
+
+        await asyncio.gather(heartbeat(), status())
+        assert order == ["heartbeat", "status"]
+
+    async def test_heartbeat_wait_is_bounded(self):
+        admission = AdmissionController(heartbeat_wait=0.01)
+        with admission.sending_heartbeat():
+            await asyncio.wait_for(admission.wait_for_heartbeats(), 1.0)
+
+
+class ClientAdmissionTestCase(IsolatedAsyncioTestCase):
+    async def test_overloaded_listener_rejects_with_error(self):
+        encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        client = Client(
+            encoder_decoder=encoder_decoder,
+            client_identifier=7777,
+            client_port=0,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=0,
+            admission=AdmissionController(max_handlers=1),
+        )
+        listener = await asyncio.start_server(
+            client.handle_server_request, "127.0.0.1", 0
+        )
+        port = listener.sockets[0].getsockname()[1]
+        request = encoder_decoder.encode_status(
+            {
+                "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+                "message_count": 0,
+                "identifier": 7777,
+            }
+        )
+        try:
+            # the first connection holds the only handler until it sends its request
+            _, first_writer = await asyncio.open_connection("127.0.0.1", port)
+            await asyncio.sleep(0.05)
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            reply = await reader.read(1024)
+            self.assertEqual(
+                encoder_decoder.decode_error(reply),
+                {"type": messages.MessageType.MESSAGE_TYPE_ERROR, "msg": OVERLOADED},
+            )
+            writer.close()
+            first_writer.close()
+            await asyncio.sleep(0.05)
+            self.assertEqual(client.admission.active, 0)
+        finally:
+            listener.close()
+            await listener.wait_closed()
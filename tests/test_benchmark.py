@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+from benchmark import compare, percentile, result
+
+
+class BenchmarkTestCase(TestCase):
+    def test_percentile(self):
+        samples = list(range(100, 0, -1))
+        assert percentile(samples, 50) == 50
+        assert percentile(samples, 99) == 99
+        assert percentile(samples, 100) == 100
+        assert percentile([5.0], 99) == 5.0
+
+    def test_compare(self):
+        baseline = {
+            "results": {
+                "ops": result(1000.0, "ops/s", True),
+                "latency": result(1.0, "ms", False),
+            }
+        }
+        current = {
+            "results": {
+                "ops": result(950.0, "ops/s", True),
+                "latency": result(1.05, "ms", False),
+                "added": result(1.0, "ms", False),
+            }
+        }
+        assert compare(baseline, current, 0.1) == []
+
+        current["results"]["ops"]["value"] = 800.0
+        current["results"]["latency"]["value"] = 0.5
+        regressions = compare(baseline, current, 0.1)
+        assert len(regressions) == 1
+        assert regressions[0].startswith("ops:")
+
+        current["results"]["latency"]["value"] = 1.5
+        assert len(compare(baseline, current, 0.1)) == 2
+
+    def test_missing_results_are_regressions(self):
+        baseline = {"results": {"ops": result(1000.0, "ops/s", True)}}
+        assert compare(baseline, {"results": {}}, 0.1) == [
+            "ops: missing from the current run"
+        ]
@@ -0,0 +1,105 @@
+import random
+import unittest
+
+from circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    Backoff,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+
+class BackoffTestCase(unittest.TestCase):
+    def test_delays_grow_with_jitter_up_to_the_cap(self):
+        backoff = Backoff(base=1.0, cap=8.0, rng=random.Random(1))
+        for attempt, ceiling in enumerate((1, 2, 4, 8, 8, 8)):
+            delay = backoff.delay(attempt)
+            self.assertGreaterEqual(delay, ceiling / 2)
+            self.assertLessEqual(delay, ceiling)
+        self.assertLessEqual(backoff.delay(10000), 8.0)
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def make_breaker(self, **kwargs):
+        return CircuitBreaker(
+            failure_threshold=3,
+            reset_timeout=1.0,
+            max_reset_timeout=10.0,
+            rng=random.Random(1),
+            **kwargs,
+        )
+
+    def test_opens_after_threshold_and_fails_fast(self):
+        breaker = self.make_breaker()
+        for _ in range(2):
+            breaker.before_call(now=0)
+            breaker.record_failure(now=0)
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.before_call(now=0)
+        breaker.record_failure(now=0)
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call(now=0.4)
+        self.assertEqual(breaker.rejected, 1)
+
+    def test_half_open_probe(self):
+        breaker = self.make_breaker()
+        for _ in range(3):
+            breaker.record_failure(now=0)
+        first_delay = breaker.open_until
+
+        # one probe at a time once the delay is over
+        breaker.before_call(now=first_delay)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call(now=first_delay)
+
+        # a failed probe opens the circuit for longer
+        breaker.record_failure(now=first_delay)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertGreater(breaker.open_until - first_delay, first_delay / 2)
+
+        breaker.before_call(now=breaker.open_until)
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.failures, 0)
+        breaker.before_call(now=0)
+
+    def test_cancelled_probe_frees_its_slot(self):
+        breaker = self.make_breaker()
+        for _ in range(3):
+            breaker.record_failure(now=0)
+        breaker.before_call(now=breaker.open_until)
+        breaker.record_abandoned()
+        breaker.before_call(now=breaker.open_until)
+
+    def test_call_records_outcomes(self):
+        breaker = self.make_breaker()
+        with self.assertRaises(OSError):
+            with breaker.call():
+                raise OSError("refused")
+        self.assertEqual(breaker.failures, 1)
+        with breaker.call():
+            pass
+        self.assertEqual(breaker.failures, 0)
+
+    def test_neutral_exceptions_are_no_failures(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        with self.assertRaises(ConnectionAbortedError):
+            with breaker.call(neutral=(ConnectionAbortedError,)):
+                raise ConnectionAbortedError()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.failures, 0)
+
+    def test_threshold_zero_never_opens(self):
+        breaker = CircuitBreaker(failure_threshold=0)
+        for _ in range(100):
+            breaker.record_failure(now=0)
+        breaker.before_call(now=0)
+        self.assertEqual(breaker.state, CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,234 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from circuit_breaker import OPEN, CircuitBreaker
+from client import Client
+from encode_decode_executor import EncodeDecodeExecutor
+from framing import FrameCodec
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+from scheduler import SKIP
+import messages_pb2 as messages
+
+
+class ClientStatusTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        self.listener = None
+
+    async def asyncTearDown(self) -> None:
+        if self.listener is not None:
+            self.listener.close()
+            await self.listener.wait_closed()
+
+    def make_client(self, **kwargs):
+        return Client(
+            encoder_decoder=self.encoder_decoder,
+            client_identifier=7777,
+            client_port=0,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=0,
+            **kwargs,
+        )
+
+    async def listen(self, client):
+        self.listener = await asyncio.start_server(
+            client.handle_server_request, "127.0.0.1", 0
+        )
+        return self.listener.sockets[0].getsockname()[1]
+
+    def status(self, message_count, request_id=0):
+        msg = {
+            "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+            "message_count": message_count,
+            "identifier": 7777,
+        }
+        if request_id:
+            msg["request_id"] = request_id
+        return msg
+
+    def ack(self):
+        return self.encoder_decoder.encode_heartbeat(
+            {
+                "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+                "msg": "ack",
+                "client_host": "127.0.0.1",
+                "client_port": 0,
+                "identifier": 7777,
+            }
+        )
+
+    def test_status_snapshot_is_encoded_once_per_heartbeat(self):
+        client = self.make_client()
+        snapshot = client.status_snapshot()
+        assert client.status_snapshot() is snapshot
+        assert snapshot == self.encoder_decoder.encode_status(self.status(0))
+
+        client.heartbeat_count += 1
+        assert client.status_snapshot() is not snapshot
+        assert client.status_snapshot() == self.encoder_decoder.encode_status(
+            self.status(1)
+        )
+
+    async def test_status_reply_echoes_request_id(self):
+        client = self.make_client()
+        client.heartbeat_count = 300
+        port = await self.listen(client)
+        for request_id in (0, 5, 2**32 - 1):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(self.encoder_decoder.encode_status(self.status(0, request_id)))
+            reply = await reader.read(1024)
+            assert reply == self.encoder_decoder.encode_status(
+                self.status(300, request_id)
+            )
+            writer.write(self.ack())
+            writer.close()
+
+    async def test_framed_status_reply(self):
+        client = self.make_client(framed=True)
+        client.heartbeat_count = 3
+        codec = FrameCodec(self.encoder_decoder)
+        port = await self.listen(client)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(codec.encode_status(self.status(0, 9)))
+        assert await codec.read_status(reader) == self.status(3, 9)
+        writer.write(
+            codec.encode_heartbeat(self.encoder_decoder.decode_heartbeat(self.ack()))
+        )
+        writer.close()
+
+    async def test_framed_connection_serves_many_requests(self):
+        client = self.make_client(framed=True)
+        codec = FrameCodec(self.encoder_decoder)
+        port = await self.listen(client)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for request_id in range(1, 4):
+            client.heartbeat_count = request_id * 10
+            writer.write(codec.encode_status(self.status(0, request_id)))
+            assert await codec.read_status(reader) == self.status(
+                request_id * 10, request_id
+            )
+            writer.write(
+                codec.encode_heartbeat(
+                    self.encoder_decoder.decode_heartbeat(self.ack())
+                )
+            )
+        assert client.admission.admitted == 1
+        writer.close()
+        await asyncio.sleep(0.05)
+        assert client.admission.active == 0
+
+    async def test_unframed_connection_is_closed_after_one_request(self):
+        client = self.make_client()
+        port = await self.listen(client)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(self.encoder_decoder.encode_status(self.status(0)))
+        assert await reader.read(1024)
+        writer.write(self.ack())
+        assert await asyncio.wait_for(reader.read(1024), 1) == b""
+        writer.close()
+
+    async def test_idle_connection_is_closed(self):
+        client = self.make_client(framed=True, status_idle_timeout=0.05)
+        port = await self.listen(client)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        assert await asyncio.wait_for(reader.read(1024), 1) == b""
+        writer.close()
+        assert client.admission.active == 0
+
+    async def test_close_closes_open_connections(self):
+        client = self.make_client(framed=True)
+        await client.start_server()
+        port = client.server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(client.close(), 1)
+        assert await asyncio.wait_for(reader.read(1024), 1) == b""
+        writer.close()
+
+    async def test_heartbeat_message_takes_the_scheduling_policy(self):
+        client = self.make_client()
+        calls = []
+
+        async def record(*args, **kwargs):
+            calls.append((args, kwargs))
+
+        heartbeats = asyncio.ensure_future(
+            client.send_heartbeat_message(
+                10, record, "beat", jitter=0, missed=SKIP, seq=1
+            )
+        )
+        await asyncio.sleep(0.05)
+        heartbeats.cancel()
+        await asyncio.gather(heartbeats, return_exceptions=True)
+        # jitter and missed go to the scheduler, not to the scheduled function
+        self.assertEqual(calls, [(("beat",), {"seq": 1})])
+        with self.assertRaises(ValueError):
+            await client.send_heartbeat_message(10, record, missed="never")
+        await client.close()
+
+
+class ClientServerFailureTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        self.connections = 0
+        self.writers = []
+        # accepts connections and never replies
+        self.server = await asyncio.start_server(self.stall, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self) -> None:
+        for writer in self.writers:
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def stall(self, reader, writer):
+        self.connections += 1
+        self.writers.append(writer)
+
+    def make_client(self, **kwargs):
+        return Client(
+            encoder_decoder=self.encoder_decoder,
+            client_identifier=7777,
+            client_port=0,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=self.port,
+            **kwargs,
+        )
+
+    async def test_stalled_server_times_out(self):
+        client = self.make_client(request_timeout=0.05)
+        reply = await asyncio.wait_for(
+            client.send_a_message_to_server(
+                "127.0.0.1", self.port, client.heartbeat_record
+            ),
+            1,
+        )
+        self.assertEqual(reply, {})
+        self.assertEqual(client.circuit_breaker.failures, 1)
+        await client.close()
+
+    async def test_open_circuit_fails_fast(self):
+        client = self.make_client(
+            request_timeout=0.02,
+            circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=10),
+        )
+        for _ in range(5):
+            await client.send_a_message_to_server(
+                "127.0.0.1", self.port, client.heartbeat_record
+            )
+        self.assertEqual(client.circuit_breaker.state, OPEN)
+        self.assertEqual(self.connections, 2)
+        self.assertEqual(client.circuit_breaker.rejected, 3)
+        await client.close()
+
+    async def test_pipelined_request_times_out(self):
+        client = self.make_client(framed=True, pipelined=True, request_timeout=0.05)
+        reply = await asyncio.wait_for(
+            client.send_pipelined("127.0.0.1", self.port, client.heartbeat_record), 1
+        )
+        self.assertEqual(reply, {})
+        self.assertEqual(client.channels.in_flight, 0)
+        await client.close()
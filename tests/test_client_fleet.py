@@ -0,0 +1,235 @@
+import asyncio
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+
+from client_fleet import ClientFleet
+from client_state import ClientState
+from connection_pool import ConnectionPool
+from encode_decode_executor import EncodeDecodeExecutor
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+from stand_in_server import StandInServer
+import messages_pb2 as messages
+
+
+class ClientFleetTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.received = []
+        self.encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        self.server = await asyncio.start_server(self.handle_heartbeat, "127.0.0.1", 0)
+        self.fleet = ClientFleet(
+            encoder_decoder=self.encoder_decoder,
+            first_identifier=1000,
+            count=3,
+            client_port=0,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=self.server.sockets[0].getsockname()[1],
+        )
+        await self.fleet.start_server()
+        self.listener_port = self.fleet.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self) -> None:
+        await self.fleet.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_heartbeat(self, reader, writer):
+        while True:
+            data = await reader.read(1024)
+            if not data:
+                break
+            reply = self.encoder_decoder.decode_heartbeat(data)
+            self.received.append(reply["identifier"])
+            reply["msg"] = "ack"
+            writer.write(self.encoder_decoder.encode_heartbeat(reply))
+            await writer.drain()
+        writer.close()
+
+    async def request_status(self, identifier):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.listener_port)
+        writer.write(
+            self.encoder_decoder.encode_status(
+                {
+                    "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+                    "message_count": 0,
+                    "identifier": identifier,
+                }
+            )
+        )
+        data = await reader.read(1024)
+        if data:
+            writer.write(
+                self.encoder_decoder.encode_heartbeat(
+                    {
+                        "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+                        "msg": "ack",
+                        "client_host": "127.0.0.1",
+                        "client_port": 0,
+                        "identifier": identifier,
+                    }
+                )
+            )
+            await writer.drain()
+        writer.close()
+        return data
+
+    async def test_status_requests_are_dispatched_by_identifier(self):
+        self.fleet.clients[1001].heartbeat_count = 5
+        data = await self.request_status(1001)
+        self.assertEqual(
+            self.encoder_decoder.decode_status(data),
+            {
+                "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+                "message_count": 5,
+                "identifier": 1001,
+            },
+        )
+        self.assertEqual(await self.request_status(4242), b"")
+
+    async def test_heartbeats_are_staggered_and_share_connections(self):
+        heartbeats = asyncio.ensure_future(self.fleet.send_heartbeats(interval=0.3))
+        await asyncio.sleep(0.25)
+        heartbeats.cancel()
+        self.assertEqual(self.received, [1000, 1001, 1002])
+        self.assertEqual(self.fleet.heartbeat_count, 3)
+        self.assertEqual(self.fleet.connection_pool.open_connections, 1)
+
+    async def test_heartbeats_are_sent_in_batches(self):
+        batches = []
+
+        async def handle_batch(reader, writer):
+            data = await reader.read(1024)
+            batch = self.encoder_decoder.decode_heartbeat_batch(data)
+            batches.append([hb["identifier"] for hb in batch["heartbeats"]])
+            writer.write(self.encoder_decoder.encode_heartbeat_batch(batch))
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle_batch, "127.0.0.1", 0)
+        fleet = ClientFleet(
+            encoder_decoder=self.encoder_decoder,
+            first_identifier=1000,
+            count=3,
+            client_port=0,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=server.sockets[0].getsockname()[1],
+            batch_size=3,
+            batch_delay=1,
+        )
+        heartbeats = asyncio.ensure_future(fleet.send_heartbeats(interval=0.06))
+        for _ in range(100):
+            if batches:
+                break
+            await asyncio.sleep(0.01)
+        heartbeats.cancel()
+        self.assertEqual(batches[0], [1000, 1001, 1002])
+        await fleet.close()
+        server.close()
+        await server.wait_closed()
+
+    async def test_pipelined_identities_share_one_connection(self):
+        server = StandInServer(self.encoder_decoder, framed=True)
+        await server.start()
+        # more identities than connections: each must not hold a connection of its own
+        fleet = ClientFleet(
+            encoder_decoder=self.encoder_decoder,
+            first_identifier=1000,
+            count=5,
+            client_port=0,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=server.port,
+            connection_pool=ConnectionPool(max_connections=2),
+            framed=True,
+            pipelined=True,
+            request_timeout=2,
+        )
+        replies = await asyncio.gather(
+            *(
+                client.send_pipelined("127.0.0.1", server.port, client.heartbeat_record)
+                for client in fleet.clients.values()
+            )
+        )
+        self.assertEqual(
+            [reply.identifier for reply in replies], [1000, 1001, 1002, 1003, 1004]
+        )
+        self.assertEqual(server.stats.connections, 1)
+        self.assertEqual(fleet.connection_pool.open_connections, 1)
+        await fleet.close()
+        await server.close()
+
+    async def test_pipelined_heartbeats_are_conflated(self):
+        server = StandInServer(self.encoder_decoder, framed=True)
+        await server.start()
+        fleet = ClientFleet(
+            encoder_decoder=self.encoder_decoder,
+            first_identifier=1000,
+            count=2,
+            client_port=0,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=server.port,
+            framed=True,
+            pipelined=True,
+        )
+        first, second = fleet.clients.values()
+
+        async def replies():
+            for client in (first, second):
+                await asyncio.gather(*client._heartbeats)
+
+        # opens the shared connection
+        await first.send_heartbeat()
+        await replies()
+        conflated = first.metrics.conflated.value
+        acked = first.metrics.acked.value
+        # the next tick of the first identity comes while its heartbeat is still queued
+        await first.send_heartbeat()
+        await second.send_heartbeat()
+        await first.send_heartbeat()
+        await replies()
+        self.assertEqual(first.metrics.conflated.value - conflated, 1)
+        self.assertEqual(first.metrics.acked.value - acked, 3)
+        self.assertEqual(server.stats.heartbeats, 3)
+        self.assertEqual(server.stats.connections, 1)
+        self.assertEqual(first.heartbeat_count, 3)
+        await fleet.close()
+        await server.close()
+
+    async def test_shared_counts(self):
+        heartbeat_counts = [4, 0, 9]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        state = ClientState(os.path.join(directory.name, "client.state"))
+        self.addCleanup(state.close)
+        slots = [state.slot(identifier) for identifier in range(1000, 1003)]
+        state.set_count(slots[2], 9)
+        fleet = ClientFleet(
+            encoder_decoder=self.encoder_decoder,
+            first_identifier=1000,
+            count=3,
+            client_port=0,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=self.server.sockets[0].getsockname()[1],
+            senders=range(1000, 1002),
+            heartbeat_counts=heartbeat_counts,
+            state=state,
+        )
+        self.assertEqual(fleet.clients[1000].heartbeat_count, 4)
+        heartbeats = asyncio.ensure_future(fleet.send_heartbeats(interval=0.3))
+        await asyncio.sleep(0.25)
+        heartbeats.cancel()
+        self.assertEqual(self.received, [1000, 1001])
+        self.assertEqual(heartbeat_counts, [5, 1, 9])
+
+        # counts of identities sent by another process are read when served
+        heartbeat_counts[2] = 12
+        self.assertEqual(fleet.status_clients.get(1002).heartbeat_count, 12)
+        heartbeat_counts[0] = 0
+        self.assertEqual(fleet.status_clients.get(1000).heartbeat_count, 5)
+        # only the records of the senders are written by this fleet
+        self.assertEqual([state.count(slot) for slot in slots], [5, 1, 9])
+        await fleet.close()
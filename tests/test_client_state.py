@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from client import Client
+from client_state import RECORD, ClientState, capacity_for
+from encode_decode_executor import EncodeDecodeExecutor
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+from stand_in_server import StandInServer
+
+
+class ClientStateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "state", "client.state")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_records_survive_reopening(self):
+        state = ClientState(self.path, capacity=1024)
+        slots = {identifier: state.slot(identifier) for identifier in range(700)}
+        self.assertEqual(len(set(slots.values())), 700)
+        for identifier, slot in slots.items():
+            state.set_count(slot, identifier * 2)
+        state.set_last_ack(slots[5], 1234.5)
+        state.close()
+
+        # the capacity of an existing file wins
+        state = ClientState(self.path, capacity=4096)
+        self.assertEqual((state.capacity, len(state)), (1024, 700))
+        self.assertEqual(os.path.getsize(self.path), RECORD.size * 1025)
+        for identifier in (0, 5, 699):
+            self.assertEqual(state.slot(identifier), slots[identifier])
+            self.assertEqual(state.count(slots[identifier]), identifier * 2)
+        self.assertEqual(state.last_ack(slots[5]), 1234.5)
+        self.assertIsNone(state.last_ack(slots[6]))
+        self.assertEqual(len(state), 700)
+        state.close()
+
+    def test_full(self):
+        state = ClientState(self.path, capacity=4)
+        for identifier in range(4):
+            state.slot(identifier)
+        with self.assertRaises(ValueError):
+            state.slot(4)
+        state.close()
+
+    def test_not_a_state_file(self):
+        with open(os.path.join(self.directory.name, "other"), "wb") as f:
+            f.write(b"not a state file")
+        with self.assertRaises(ValueError):
+            ClientState(f.name)
+        with self.assertRaises(ValueError):
+            ClientState(self.path, capacity=1000)
+
+    def test_capacity_for(self):
+        self.assertEqual(capacity_for(10), 1024)
+        self.assertEqual(capacity_for(300000), 1 << 20)
+
+    def test_client_carries_on_counting(self):
+        def make_client(state):
+            return Client(
+                encoder_decoder=EncodeDecodeExecutor(ProtobufEncoderDecoder()),
+                client_identifier=7777,
+                client_port=2222,
+                client_ip="127.0.0.1",
+                server_ip="127.0.0.1",
+                server_port=4000,
+                state=state,
+            )
+
+        state = ClientState(self.path)
+        client = make_client(state)
+        self.assertIsNone(client.last_ack)
+        client.heartbeat_count = 41
+        client.record_ack()
+        state.close()
+
+        state = ClientState(self.path)
+        client = make_client(state)
+        self.assertEqual(client.heartbeat_count, 41)
+        self.assertIsNotNone(client.last_ack)
+        state.close()
+
+
+class ClientStateAckTestCase(IsolatedAsyncioTestCase):
+    async def test_only_acks_are_recorded(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        state = ClientState(os.path.join(directory.name, "client.state"))
+        self.addCleanup(state.close)
+        encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        for error_rate, acked in ((1.0, False), (0.0, True)):
+            server = StandInServer(encoder_decoder, error_rate=error_rate)
+            await server.start()
+            client = Client(
+                encoder_decoder=encoder_decoder,
+                client_identifier=7777,
+                client_port=2222,
+                client_ip="127.0.0.1",
+                server_ip="127.0.0.1",
+                server_port=server.port,
+                state=state,
+            )
+            try:
+                await client.send_heartbeat()
+            finally:
+                await client.close()
+                await server.close()
+            self.assertEqual(client.last_ack is not None, acked)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from client import Client
+from connection_pool import ConnectionPool
+from encode_decode_executor import EncodeDecodeExecutor
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+import messages_pb2 as messages
+
+
+class ConnectionPoolTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.accepted = 0
+        self.close_after_reply = False
+        self.encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        self.server = await asyncio.start_server(self.handle_heartbeat, "127.0.0.1", 0)
+        self.server_port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_heartbeat(self, reader, writer):
+        self.accepted += 1
+        while True:
+            data = await reader.read(1024)
+            if not data:
+                break
+            reply = self.encoder_decoder.decode_heartbeat(data)
+            reply["msg"] = "ack"
+            writer.write(self.encoder_decoder.encode_heartbeat(reply))
+            await writer.drain()
+            if self.close_after_reply:
+                break
+        writer.close()
+
+    def make_client(self, pool):
+        return Client(
+            encoder_decoder=self.encoder_decoder,
+            client_identifier=7777,
+            client_port=2222,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=self.server_port,
+            connection_pool=pool,
+        )
+
+    def heartbeat(self):
+        return {
+            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+            "msg": "I’m here!",
+            "identifier": 7777,
+            "client_host": "127.0.0.1",
+            "client_port": 2222,
+        }
+
+    async def test_connection_is_reused(self):
+        pool = ConnectionPool()
+        client = self.make_client(pool)
+        for _ in range(3):
+            reply = await client.send_a_message_to_server(
+                "127.0.0.1", self.server_port, self.heartbeat()
+            )
+            self.assertEqual(reply["msg"], "ack")
+        self.assertEqual(self.accepted, 1)
+        self.assertEqual(pool.open_connections, 1)
+        await pool.close()
+        self.assertEqual(pool.open_connections, 0)
+
+    async def test_connection_closed_by_server_is_replaced(self):
+        self.close_after_reply = True
+        pool = ConnectionPool()
+        client = self.make_client(pool)
+        for _ in range(2):
+            reply = await client.send_a_message_to_server(
+                "127.0.0.1", self.server_port, self.heartbeat()
+            )
+            self.assertEqual(reply["msg"], "ack")
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.accepted, 2)
+        await pool.close()
+
+    async def test_idle_connections_are_evicted(self):
+        pool = ConnectionPool(idle_timeout=10)
+        client = self.make_client(pool)
+        await client.send_a_message_to_server(
+            "127.0.0.1", self.server_port, self.heartbeat()
+        )
+        self.assertEqual(pool.open_connections, 1)
+        for idle in pool._idle.values():
+            for conn in idle:
+                conn.last_used -= 10
+        self.assertEqual(pool.evict_idle(), 1)
+        self.assertEqual(pool.open_connections, 0)
+        await pool.close()
+
+    async def test_reaper_closes_connections_idle_after_a_slow_checkout(self):
+        pool = ConnectionPool(idle_timeout=0.1)
+        conn = await pool.acquire("127.0.0.1", self.server_port)
+        # nothing is idle while the connection is checked out
+        await asyncio.sleep(0.01)
+        await pool.release(conn)
+        await asyncio.sleep(0.3)
+        self.assertEqual(pool.open_connections, 0)
+        self.assertTrue(conn.writer.is_closing())
+        await pool.close()
+
+    async def test_max_connections_limits_concurrent_checkouts(self):
+        pool = ConnectionPool(max_connections=1)
+        first = await pool.acquire("127.0.0.1", self.server_port)
+        second = asyncio.ensure_future(pool.acquire("127.0.0.1", self.server_port))
+        await asyncio.sleep(0.01)
+        self.assertFalse(second.done())
+        await pool.release(first)
+        conn = await second
+        self.assertIs(conn, first)
+        await pool.release(conn)
+        await pool.close()
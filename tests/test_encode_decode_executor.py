@@ -0,0 +1,115 @@
+import asyncio
+import concurrent.futures
+import time
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from encode_decode_executor import (
+    PROCESS,
+    THREAD,
+    EncodeDecodeExecutor,
+    make_codec_pool,
+)
+from fast_wire_encoder_decoder import FastWireEncoderDecoder
+from message_records import HeartBeat
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+import messages_pb2 as messages
+
+
+class RecordingPool(concurrent.futures.ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(1)
+        self.submitted = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(fn, *args, **kwargs)
+
+
+class SlowFastWireEncoderDecoder(FastWireEncoderDecoder):
+    def _result(self, end: int) -> bytes:
+        # give the other pool threads time to run in the middle of an encode
+        time.sleep(0.001)
+        return super()._result(end)
+
+
+def make_batch(count: int) -> dict:
+    return {
+        "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT_BATCH,
+        "heartbeats": [HeartBeat(identifier=i, msg="ack") for i in range(count)],
+    }
+
+
+class AsyncCodecTestCase(IsolatedAsyncioTestCase):
+    async def test_without_pool_runs_inline(self):
+        encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        batch = make_batch(1000)
+        data = await encoder_decoder.aencode_heartbeat_batch(batch)
+        self.assertEqual(data, encoder_decoder.encode_heartbeat_batch(batch))
+
+    async def test_large_messages_go_to_the_pool(self):
+        pool = RecordingPool()
+        encoder_decoder = EncodeDecodeExecutor(
+            ProtobufEncoderDecoder(), pool=pool, offload_threshold=500
+        )
+        small = make_batch(2)
+        data = await encoder_decoder.aencode_heartbeat_batch(small)
+        await encoder_decoder.adecode_heartbeat_batch(data)
+        self.assertEqual(pool.submitted, 0)
+
+        large = make_batch(100)
+        data = await encoder_decoder.aencode_heartbeat_batch(large)
+        self.assertEqual(pool.submitted, 1)
+        self.assertGreater(len(data), 500)
+        decoded = await encoder_decoder.adecode_heartbeat_batch(data)
+        self.assertEqual(pool.submitted, 2)
+        self.assertEqual(len(decoded["heartbeats"]), 100)
+        self.assertEqual(decoded["heartbeats"][99]["identifier"], 99)
+        pool.shutdown()
+
+    async def test_process_pool(self):
+        pool = make_codec_pool(PROCESS, 1)
+        encoder_decoder = EncodeDecodeExecutor(
+            ProtobufEncoderDecoder(), pool=pool, offload_threshold=0
+        )
+        batch = make_batch(10)
+        data = await encoder_decoder.aencode_heartbeat_batch(batch)
+        self.assertEqual(data, encoder_decoder.encode_heartbeat_batch(batch))
+        pool.shutdown()
+
+    async def test_concurrent_calls_in_a_thread_pool(self):
+        # every pool thread must encode with a backend of its own: a shared one would
+        # overwrite its buffer while another thread is still copying out of it
+        for backend in (SlowFastWireEncoderDecoder, ProtobufEncoderDecoder):
+            pool = make_codec_pool(THREAD, 8)
+            encoder_decoder = EncodeDecodeExecutor(
+                backend(), pool=pool, offload_threshold=0
+            )
+            expected = backend()
+            heartbeats = [
+                HeartBeat(msg="x" * i, identifier=i, request_id=i + 1).to_dict()
+                for i in range(200)
+            ]
+            encoded = await asyncio.gather(
+                *map(encoder_decoder.aencode_heartbeat, heartbeats)
+            )
+            self.assertEqual(encoded, list(map(expected.encode_heartbeat, heartbeats)))
+            decoded = await asyncio.gather(
+                *map(encoder_decoder.adecode_heartbeat, encoded)
+            )
+            self.assertEqual(decoded, heartbeats)
+            pool.shutdown()
+
+
+class MakeCodecPoolTestCase(unittest.TestCase):
+    def test_kinds(self):
+        self.assertIsNone(make_codec_pool(None))
+        pool = make_codec_pool(THREAD, 2)
+        self.assertIsInstance(pool, concurrent.futures.ThreadPoolExecutor)
+        pool.shutdown()
+        with self.assertRaises(ValueError):
+            make_codec_pool("gpu")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import random
+
+from encode_decode_executor import EncodeDecodeExecutor
+from fast_wire_encoder_decoder import FastWireEncoderDecoder
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+import messages_pb2 as messages
+import test_proto_encoder_decoder as proto_tests
+
+
+class FastWireEncodeDecodeTestCase(proto_tests.ProtoBufEncodeDecodeTestCase):
+    """
+    Runs every protobuf encoder/decoder test against the hand-rolled wire codec.
+    """
+
+    def setUp(self) -> None:
+        self.protocol_buffer_enc_dec = FastWireEncoderDecoder()
+
+    def test_heartbeat_template_cache_is_lru(self):
+        pass  # specific to ProtobufEncoderDecoder
+
+    def test_same_bytes_as_protobuf(self):
+        fast_wire = EncodeDecodeExecutor(FastWireEncoderDecoder(buffer_size=8))
+        protobuf = EncodeDecodeExecutor(ProtobufEncoderDecoder(heartbeat_cache_size=0))
+        rng = random.Random(1234)
+        for _ in range(200):
+            heartbeat = {
+                "type": rng.choice([0, 1, 3, 4, -1]),
+                "msg": "".join(rng.choice("ab€ ") for _ in range(rng.randrange(200))),
+                "client_host": rng.choice(["", "0.0.0.0", "::1"]),
+                "identifier": rng.randrange(2**32),
+                "client_port": rng.choice([0, 1, 127, 128, 65535]),
+                "request_id": rng.choice([0, 1, 2**32 - 1]),
+            }
+            status = {
+                "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+                "message_count": rng.randrange(2**32),
+                "identifier": rng.randrange(2**32),
+                "request_id": rng.randrange(3),
+            }
+            batch = {
+                "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT_BATCH,
+                "heartbeats": [heartbeat] * rng.randrange(3),
+            }
+            for method in ("heartbeat", "status", "heartbeat_batch"):
+                msg_dict = {"heartbeat": heartbeat, "status": status}.get(method, batch)
+                encoded = getattr(fast_wire, "encode_" + method)(msg_dict)
+                assert encoded == getattr(protobuf, "encode_" + method)(msg_dict)
+                assert getattr(fast_wire, "decode_" + method)(encoded) == getattr(
+                    protobuf, "decode_" + method
+                )(encoded)
+
+    def test_encode_errors_match_protobuf(self):
+        fast_wire = FastWireEncoderDecoder()
+        protobuf = ProtobufEncoderDecoder()
+        for msg_dict in (
+            {"type": "heartbeat", "msg": "", "client_host": "", "identifier": 1},
+            {"type": 0, "msg": 5, "client_host": "", "identifier": 1},
+            {"type": 0, "msg": "", "client_host": "", "identifier": None},
+            {"type": 0, "msg": "", "client_host": "", "identifier": 1},
+        ):
+            assert fast_wire.encode_heartbeat(msg_dict) == protobuf.encode_heartbeat(
+                msg_dict
+            )
+        with self.assertRaises(ValueError):
+            fast_wire.encode_heartbeat(
+                {
+                    "type": 0,
+                    "msg": "",
+                    "client_host": "",
+                    "identifier": 2**32,
+                    "client_port": 1,
+                }
+            )
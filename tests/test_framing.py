@@ -0,0 +1,120 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from client import Client
+from connection_pool import ConnectionPool
+from encode_decode_executor import EncodeDecodeExecutor
+from framing import FrameCodec, FrameDecoder, FrameError, encode_frame, read_frame
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+import messages_pb2 as messages
+
+
+class FrameDecoderTestCase(TestCase):
+    def test_encode_frame(self):
+        assert encode_frame(b"\x08\x01") == b"\x00\x00\x00\x02\x08\x01"
+
+    def test_split_and_coalesced_frames(self):
+        decoder = FrameDecoder()
+        stream = encode_frame(b"first") + encode_frame(b"") + encode_frame(b"second")
+        assert decoder.feed(stream[:3]) == []
+        assert decoder.feed(stream[3:13]) == [b"first", b""]
+        assert decoder.feed(stream[13:]) == [b"second"]
+
+    def test_oversized_frame(self):
+        decoder = FrameDecoder(max_frame_size=4)
+        with self.assertRaises(FrameError):
+            decoder.feed(encode_frame(b"too long"))
+
+
+class FramedStreamTestCase(IsolatedAsyncioTestCase):
+    async def test_read_frame_from_split_segments(self):
+        reader = asyncio.StreamReader()
+        stream = encode_frame(b"hello") + encode_frame(b"world")
+        reader.feed_data(stream[:2])
+        first = asyncio.ensure_future(read_frame(reader))
+        await asyncio.sleep(0)
+        self.assertFalse(first.done())
+        reader.feed_data(stream[2:])
+        reader.feed_eof()
+        self.assertEqual(await first, b"hello")
+        self.assertEqual(await read_frame(reader), b"world")
+        with self.assertRaises(asyncio.IncompleteReadError):
+            await read_frame(reader)
+
+    async def test_framed_client_round_trip(self):
+        encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        codec = FrameCodec(encoder_decoder)
+
+        async def handle_heartbeat(reader, writer):
+            while True:
+                try:
+                    reply = await codec.read_heartbeat(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                reply["msg"] = "ack"
+                # write the frame in two segments to split it on the wire
+                frame = codec.encode_heartbeat(reply)
+                writer.write(frame[:3])
+                await writer.drain()
+                writer.write(frame[3:])
+                await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle_heartbeat, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = ConnectionPool()
+        client = Client(
+            encoder_decoder=encoder_decoder,
+            client_identifier=7777,
+            client_port=2222,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=port,
+            connection_pool=pool,
+            framed=True,
+        )
+        msg = {
+            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+            "msg": "I’m here!",
+            "identifier": 7777,
+            "client_host": "127.0.0.1",
+            "client_port": 2222,
+        }
+        for _ in range(2):
+            reply = await client.send_a_message_to_server("127.0.0.1", port, msg)
+            self.assertEqual(reply, dict(msg, msg="ack"))
+        await pool.close()
+        server.close()
+        await server.wait_closed()
+
+    async def test_bad_frames_fail_the_heartbeat(self):
+        encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+
+        async def handle_heartbeat(reader, writer):
+            await read_frame(reader)
+            # a header announcing more than MAX_FRAME_SIZE bytes
+            writer.write(b"\xff\xff\xff\xff")
+            await writer.drain()
+            await reader.read()
+            writer.close()
+
+        server = await asyncio.start_server(handle_heartbeat, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = Client(
+            encoder_decoder=encoder_decoder,
+            client_identifier=7777,
+            client_port=2222,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=port,
+            framed=True,
+        )
+        failed = client.metrics.failed.value
+        reply = await client.send_a_message_to_server(
+            "127.0.0.1", port, client.heartbeat_record
+        )
+        self.assertEqual(reply, {})
+        self.assertEqual(client.metrics.failed.value - failed, 1)
+        await client.close()
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,57 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from heartbeat_coalescer import HeartbeatCoalescer
+
+
+class HeartbeatCoalescerTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.batches = []
+
+    async def send_batch(self, heartbeats):
+        self.batches.append([heartbeat["identifier"] for heartbeat in heartbeats])
+
+    async def test_flush_on_size(self):
+        coalescer = HeartbeatCoalescer(self.send_batch, max_batch=3, max_delay=10)
+        for identifier in range(7):
+            await coalescer.add({"identifier": identifier})
+        self.assertEqual(self.batches, [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(len(coalescer), 1)
+        await coalescer.flush()
+        self.assertEqual(self.batches[-1], [6])
+
+    async def test_flush_on_time(self):
+        coalescer = HeartbeatCoalescer(self.send_batch, max_batch=100, max_delay=0.02)
+        await coalescer.add({"identifier": 1})
+        await coalescer.add({"identifier": 2})
+        self.assertEqual(self.batches, [])
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.batches, [[1, 2]])
+        self.assertEqual(len(coalescer), 0)
+
+    async def test_flush_waits_for_a_timed_batch(self):
+        sending = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_send(heartbeats):
+            sending.set()
+            await release.wait()
+            await self.send_batch(heartbeats)
+
+        coalescer = HeartbeatCoalescer(slow_send, max_batch=100, max_delay=0.01)
+        await coalescer.add({"identifier": 1})
+        await sending.wait()
+        flush = asyncio.ensure_future(coalescer.flush())
+        await asyncio.sleep(0.01)
+        self.assertFalse(flush.done())
+        release.set()
+        await flush
+        self.assertEqual(self.batches, [[1]])
+
+    async def test_failed_send_is_logged(self):
+        async def fail(heartbeats):
+            raise ConnectionError("server is down")
+
+        coalescer = HeartbeatCoalescer(fail, max_batch=1)
+        with self.assertLogs("__main__.heartbeat_coalescer", level="ERROR"):
+            await coalescer.add({"identifier": 1})
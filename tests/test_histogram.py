@@ -0,0 +1,49 @@
+import math
+import random
+from unittest import TestCase
+
+from histogram import LatencyHistogram
+
+
+class LatencyHistogramTestCase(TestCase):
+    def test_percentiles_keep_significant_figures(self):
+        rng = random.Random(7)
+        values = [rng.randint(1, 10**7) for _ in range(20000)]
+        histogram = LatencyHistogram(significant_figures=2)
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        for percentile in (50, 90, 99, 99.9):
+            exact = values[math.ceil(percentile / 100 * len(values)) - 1]
+            assert abs(histogram.value_at_percentile(percentile) - exact) <= exact / 100
+        assert histogram.value_at_percentile(100) == values[-1]
+        assert histogram.min == values[0]
+        assert histogram.total_count == len(values)
+
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram()
+        for value in range(100):
+            histogram.record(value)
+        assert histogram.value_at_percentile(50) == 49
+        assert histogram.mean == 49.5
+
+    def test_values_above_highest_are_capped(self):
+        histogram = LatencyHistogram(highest=1000)
+        histogram.record(5000)
+        assert histogram.max == 1000
+
+    def test_merge(self):
+        first = LatencyHistogram()
+        second = LatencyHistogram()
+        for value in range(1, 51):
+            first.record(value)
+        for value in range(51, 101):
+            second.record(value)
+        first.merge(second)
+        assert first.total_count == 100
+        assert first.min == 1
+        assert first.max == 100
+        assert first.value_at_percentile(50) == 50
+
+        with self.assertRaises(ValueError):
+            first.merge(LatencyHistogram(significant_figures=3))
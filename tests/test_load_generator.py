@@ -0,0 +1,58 @@
+from unittest import IsolatedAsyncioTestCase
+
+from encode_decode_executor import EncodeDecodeExecutor
+from load_generator import LoadGenerator, Step
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+from stand_in_server import StandInServer
+
+
+class LoadGeneratorTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        self.server = StandInServer(self.encoder_decoder)
+        await self.server.start()
+
+    async def asyncTearDown(self) -> None:
+        await self.server.close()
+
+    async def test_open_loop_run(self):
+        lines = []
+        generator = LoadGenerator(
+            self.encoder_decoder, "127.0.0.1", self.server.port, report=lines.append
+        )
+        results = await generator.run([Step(200, 2, 2, 0.25), Step(400, 4, 3, 0.25)])
+        assert results["total"]["ok"] == 150
+        assert results["total"]["errors"] == 0
+        assert self.server.stats.heartbeats == 150
+        assert self.server.stats.connections <= 5
+        assert results["total"]["latency_us"]["99"] > 0
+
+    async def test_errors_are_counted(self):
+        self.server.error_rate = 1.0
+        generator = LoadGenerator(
+            self.encoder_decoder,
+            "127.0.0.1",
+            self.server.port,
+            report=lambda line: None,
+        )
+        results = await generator.run([Step(100, 1, 1, 0.1)])
+        assert results["total"]["ok"] == 0
+        assert results["total"]["errors"] == 10
+
+    async def test_pipelined_identities_do_not_starve_the_pool(self):
+        server = StandInServer(self.encoder_decoder, framed=True)
+        await server.start()
+        self.addAsyncCleanup(server.close)
+        generator = LoadGenerator(
+            self.encoder_decoder,
+            "127.0.0.1",
+            server.port,
+            framed=True,
+            pipelined=True,
+            report=lambda line: None,
+        )
+        # more identities than connections
+        results = await generator.run([Step(100, 4, 2, 0.3)])
+        assert results["total"]["ok"] == 30
+        assert results["total"]["errors"] == 0
+        assert server.stats.connections == 1
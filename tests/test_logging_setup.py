@@ -0,0 +1,109 @@
+import logging
+import os
+import tempfile
+import unittest
+
+from logging_setup import (
+    QUEUE,
+    SYNC,
+    LazyQueueHandler,
+    RateLimitFilter,
+    configure_logging,
+)
+
+
+def make_record(msg: str, args: tuple = (), created: float = 100.0):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None)
+    record.created = created
+    return record
+
+
+class TestRateLimitFilter(unittest.TestCase):
+    def test_suppresses_over_burst_and_reports_count(self):
+        rate_limit = RateLimitFilter(rate=1, burst=2)
+        passed = [rate_limit.filter(make_record("sent %s", (i,))) for i in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+
+        record = make_record("sent %s", (5,), created=101.0)
+        self.assertTrue(rate_limit.filter(record))
+        self.assertEqual(record.getMessage(), "sent 5 [3 similar messages suppressed]")
+
+    def test_templates_are_limited_separately(self):
+        rate_limit = RateLimitFilter(rate=1, burst=1)
+        self.assertTrue(rate_limit.filter(make_record("one %s", (1,))))
+        self.assertFalse(rate_limit.filter(make_record("one %s", (2,))))
+        self.assertTrue(rate_limit.filter(make_record("two %s", (1,))))
+
+
+class TestLazyQueueHandler(unittest.TestCase):
+    def test_record_is_queued_unformatted(self):
+        records = []
+
+        class ListQueue:
+            def put_nowait(self, item):
+                records.append(item)
+
+        handler = LazyQueueHandler(ListQueue())
+        args = ("a", 1)
+        handler.handle(make_record("%s %d", args))
+        self.assertEqual(records[0].msg, "%s %d")
+        self.assertIs(records[0].args, args)
+
+    def test_mutable_arguments_are_formatted_when_queued(self):
+        records = []
+
+        class ListQueue:
+            def put_nowait(self, item):
+                records.append(item)
+
+        handler = LazyQueueHandler(ListQueue())
+        msg = {"request_id": 1}
+        handler.handle(make_record("sending %s", (msg,)))
+        msg["request_id"] = 2
+        self.assertEqual(records[0].getMessage(), "sending {'request_id': 1}")
+
+
+class TestConfigureLogging(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        self.saved = root.handlers[:], root.level
+        root.handlers = []
+
+    def tearDown(self):
+        root = logging.getLogger()
+        for handler in root.handlers:
+            handler.close()
+        root.handlers, level = self.saved
+        root.setLevel(level)
+
+    def test_queue_mode_writes_after_stop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "log", "client.log")
+            listener = configure_logging(QUEUE, filename, logging.INFO)
+            self.assertIsInstance(logging.getLogger().handlers[0], LazyQueueHandler)
+            logging.getLogger("test").info("heartbeat %s", 7)
+            logging.getLogger("test").debug("not logged")
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+            with open(filename) as f:
+                content = f.read()
+        self.assertIn("heartbeat 7", content)
+        self.assertNotIn("not logged", content)
+
+    def test_sync_mode_has_no_listener(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "client.log")
+            self.assertIsNone(configure_logging(SYNC, filename, rate_limit=5))
+            handlers = logging.getLogger().handlers
+            self.assertEqual(len(handlers), 2)
+            self.assertIsInstance(handlers[0].filters[0], RateLimitFilter)
+            self.assertIs(handlers[0].filters[0], handlers[1].filters[0])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            configure_logging("async")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from client import Client
+from encode_decode_executor import EncodeDecodeExecutor
+from metrics import ClientMetrics, Registry, start_metrics_server
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+from stand_in_server import StandInServer
+import messages_pb2 as messages
+
+
+class RegistryTestCase(TestCase):
+    def test_render(self):
+        registry = Registry()
+        registry.counter("sent_total", "Sent.").inc(3)
+        assert registry.counter("sent_total", "Sent.").value == 3
+        registry.gauge("open", "Open.", function=lambda: 7)
+        histogram = registry.histogram(
+            "latency_seconds", "Latency.", buckets=(0.1, 1.0), method="encode"
+        )
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+
+        assert registry.render() == (
+            "# HELP latency_seconds Latency.\n"
+            "# TYPE latency_seconds histogram\n"
+            'latency_seconds_bucket{method="encode",le="0.1"} 1\n'
+            'latency_seconds_bucket{method="encode",le="1"} 3\n'
+            'latency_seconds_bucket{method="encode",le="+Inf"} 4\n'
+            'latency_seconds_sum{method="encode"} 6.05\n'
+            'latency_seconds_count{method="encode"} 4\n'
+            "# HELP open Open.\n"
+            "# TYPE open gauge\n"
+            "open 7\n"
+            "# HELP sent_total Sent.\n"
+            "# TYPE sent_total counter\n"
+            "sent_total 3\n"
+        )
+
+        with self.assertRaises(ValueError):
+            registry.gauge("sent_total", "Sent.")
+
+    def test_executor_is_timed_with_a_registry(self):
+        registry = Registry()
+        encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder(), registry)
+        encoded = encoder_decoder.encode_status(
+            {
+                "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+                "message_count": 1,
+                "identifier": 2,
+            }
+        )
+        encoder_decoder.decode_status(encoded)
+        encoder_decoder.decode_status(encoded)
+        assert (
+            registry.histogram("codec_seconds", "", method="decode_status").count == 2
+        )
+        assert (
+            registry.histogram("codec_seconds", "", method="encode_status").count == 1
+        )
+
+        # without a registry the methods are not wrapped
+        plain = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        assert "encode_status" not in vars(plain)
+
+
+class ClientMetricsTestCase(IsolatedAsyncioTestCase):
+    async def test_client_metrics_and_endpoint(self):
+        registry = Registry()
+        encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        server = StandInServer(encoder_decoder)
+        await server.start()
+        client = Client(
+            encoder_decoder=encoder_decoder,
+            client_identifier=7777,
+            client_port=2222,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=server.port,
+            metrics=ClientMetrics(registry),
+        )
+        metrics_server = await start_metrics_server("127.0.0.1", 0, registry)
+        try:
+            for _ in range(3):
+                await client.send_a_message_to_server(
+                    "127.0.0.1", server.port, client.heartbeat_record
+                )
+            metrics = client.metrics
+            assert metrics.sent.value == 3
+            assert metrics.acked.value == 3
+            assert metrics.failed.value == 0
+            assert metrics.in_flight.value == 0
+            assert metrics.heartbeat_seconds.count == 3
+            assert metrics.bytes_out.value > metrics.bytes_in.value > 0
+
+            port = metrics_server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = (await reader.read()).decode()
+            writer.close()
+            assert response.startswith("HTTP/1.1 200 OK\r\n")
+            assert "\nclient_heartbeats_acked_total 3\n" in response
+            assert "\nclient_open_connections 1\n" in response
+        finally:
+            await client.close()
+            await server.close()
+            metrics_server.close()
+            await metrics_server.wait_closed()
+
+    async def test_error_replies_are_failures(self):
+        registry = Registry()
+        encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        server = StandInServer(encoder_decoder, error_rate=1.0)
+        await server.start()
+        client = Client(
+            encoder_decoder=encoder_decoder,
+            client_identifier=7777,
+            client_port=2222,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=server.port,
+            metrics=ClientMetrics(registry),
+        )
+        try:
+            for _ in range(2):
+                reply = await client.send_a_message_to_server(
+                    "127.0.0.1", server.port, client.heartbeat_record
+                )
+                assert reply.type == messages.MessageType.MESSAGE_TYPE_ERROR
+            assert client.metrics.acked.value == 0
+            assert client.metrics.failed.value == 2
+            assert client.metrics.heartbeat_seconds.count == 0
+        finally:
+            await client.close()
+            await server.close()
@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from framing import HEADER, encode_frame
+from outbound_buffer import OutboundBuffer, drain_above, frame_chunks
+
+
+class FakeTransport:
+    def __init__(self):
+        self.buffered = 0
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+class FakeWriter:
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.writes = []
+        self.drains = 0
+        self.closing = False
+
+    def writelines(self, chunks):
+        self.writes.append(b"".join(chunks))
+
+    async def drain(self):
+        self.drains += 1
+
+    def is_closing(self):
+        return self.closing
+
+
+class OutboundBufferTestCase(IsolatedAsyncioTestCase):
+    def test_frame_chunks(self):
+        chunks = frame_chunks(b"abc", memoryview(b"de"))
+        self.assertEqual(chunks[0], HEADER.pack(5))
+        self.assertEqual(b"".join(chunks), encode_frame(b"abcde"))
+
+    async def test_frames_of_many_coroutines_leave_in_one_write(self):
+        writer = FakeWriter()
+        buffer = OutboundBuffer(writer)
+
+        async def send(payload):
+            self.assertEqual(buffer.write_frame(payload), len(payload) + 4)
+            await buffer.drain()
+
+        payloads = [bytes([i]) * (i + 1) for i in range(10)]
+        await asyncio.gather(*(send(payload) for payload in payloads))
+        await asyncio.sleep(0)
+
+        self.assertEqual(buffer.flushes, 1)
+        self.assertEqual(
+            writer.writes, [b"".join(encode_frame(payload) for payload in payloads)]
+        )
+        self.assertEqual(writer.drains, 0)
+
+    async def test_drain_above_high_water(self):
+        writer = FakeWriter()
+        buffer = OutboundBuffer(writer, high_water=100)
+        buffer.write_frame(bytes(50))
+        await buffer.drain()
+        self.assertEqual((writer.drains, writer.writes), (0, []))
+
+        buffer.write_frame(bytes(50))
+        await buffer.drain()
+        self.assertEqual(writer.drains, 1)
+        self.assertEqual(len(writer.writes[0]), 108)
+        self.assertEqual(buffer.pending_bytes, 0)
+
+        # the flush scheduled by the first write has nothing left to send
+        await asyncio.sleep(0)
+        self.assertEqual(buffer.flushes, 1)
+
+    async def test_drain_above(self):
+        writer = FakeWriter()
+        writer.transport.buffered = 10
+        await drain_above(writer, high_water=10)
+        self.assertEqual(writer.drains, 0)
+        writer.transport.buffered = 11
+        await drain_above(writer, high_water=10)
+        self.assertEqual(writer.drains, 1)
+
+    async def test_closing_writer_is_not_written(self):
+        writer = FakeWriter()
+        buffer = OutboundBuffer(writer)
+        buffer.write(b"data")
+        writer.closing = True
+        await asyncio.sleep(0)
+        self.assertEqual(writer.writes, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
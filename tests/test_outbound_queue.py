@@ -0,0 +1,95 @@
+import asyncio
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from framing import encode_frame
+from metrics import Registry, client_metrics
+from outbound_queue import BULK, HEARTBEAT, OutboundQueue, OutboundQueueFull
+
+
+class FakeTransport:
+    def get_write_buffer_size(self):
+        return 0
+
+
+class FakeWriter:
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.writes = []
+        self.closing = False
+
+    def writelines(self, chunks):
+        self.writes.append(b"".join(chunks))
+
+    async def drain(self):
+        if self.closing:
+            raise ConnectionResetError("Connection lost")
+
+    def is_closing(self):
+        return self.closing
+
+
+class OutboundQueueTestCase(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.writer = FakeWriter()
+        self.metrics = client_metrics(Registry())
+        self.queue = OutboundQueue(self.writer, max_pending=3, metrics=self.metrics)
+
+    async def asyncTearDown(self):
+        await self.queue.close()
+
+    async def written(self):
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return self.writer.writes
+
+    async def test_priority_order(self):
+        self.queue.put(b"bulk", BULK)
+        self.queue.put(b"heartbeat", HEARTBEAT)
+        self.assertEqual(
+            await self.written(), [encode_frame(b"heartbeat") + encode_frame(b"bulk")]
+        )
+        self.assertEqual(self.metrics.bytes_out.value, 21)
+
+    async def test_latest_heartbeat_wins(self):
+        loop = asyncio.get_running_loop()
+        first, second = loop.create_future(), loop.create_future()
+        self.queue.put(b"first", HEARTBEAT, key=1, waiter=first)
+        self.queue.put(b"other", HEARTBEAT, key=2)
+        self.queue.put(b"second", HEARTBEAT, key=1, waiter=second)
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(
+            await self.written(), [encode_frame(b"second") + encode_frame(b"other")]
+        )
+        self.assertEqual(self.metrics.conflated.value, 1)
+
+        second.set_result("reply")
+        self.assertEqual(await first, "reply")
+
+    async def test_bounded(self):
+        for i in range(3):
+            self.queue.put(b"bulk", BULK)
+        with self.assertRaises(OutboundQueueFull):
+            self.queue.put(b"bulk", BULK)
+        await self.written()
+        self.queue.put(b"bulk", BULK)
+
+    async def test_abandoned_messages_are_not_written(self):
+        waiter = asyncio.get_running_loop().create_future()
+        self.queue.put(b"late", HEARTBEAT, key=1, waiter=waiter)
+        waiter.cancel()
+        self.queue.put(b"bulk", BULK)
+        self.assertEqual(await self.written(), [encode_frame(b"bulk")])
+
+    async def test_close_fails_waiters(self):
+        waiter = asyncio.get_running_loop().create_future()
+        self.queue.put(b"heartbeat", HEARTBEAT, waiter=waiter)
+        await self.queue.close()
+        with self.assertRaises(ConnectionError):
+            await waiter
+        with self.assertRaises(ConnectionError):
+            self.queue.put(b"heartbeat", HEARTBEAT)
+
+
+if __name__ == "__main__":
+    unittest.main()
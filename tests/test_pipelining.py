@@ -0,0 +1,148 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from circuit_breaker import CLOSED
+from client import Client
+from encode_decode_executor import EncodeDecodeExecutor
+from framing import FrameCodec
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+import messages_pb2 as messages
+
+
+class PipeliningTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.accepted = 0
+        self.batch = 5
+        self.encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        self.codec = FrameCodec(self.encoder_decoder)
+        self.server = await asyncio.start_server(self.handle_heartbeat, "127.0.0.1", 0)
+        self.server_port = self.server.sockets[0].getsockname()[1]
+        self.client = Client(
+            encoder_decoder=self.encoder_decoder,
+            client_identifier=7777,
+            client_port=2222,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=self.server_port,
+            framed=True,
+            pipelined=True,
+        )
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_heartbeat(self, reader, writer):
+        # collect a batch of requests and answer them in reverse order
+        self.accepted += 1
+        try:
+            while True:
+                requests = [
+                    await self.codec.read_heartbeat(reader) for _ in range(self.batch)
+                ]
+                for request in reversed(requests):
+                    request["msg"] = "ack " + request["msg"]
+                    writer.write(self.codec.encode_heartbeat(request))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+
+    def heartbeat(self, text):
+        return {
+            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+            "msg": text,
+            "identifier": 7777,
+            "client_host": "127.0.0.1",
+            "client_port": 2222,
+        }
+
+    def test_request_id_round_trip(self):
+        msg = dict(self.heartbeat("hello"), request_id=42)
+        encoded = self.encoder_decoder.encode_heartbeat(msg)
+        assert self.encoder_decoder.decode_heartbeat(encoded) == msg
+
+        status = {
+            "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+            "message_count": 100,
+            "identifier": 1234,
+            "request_id": 7,
+        }
+        encoded = self.encoder_decoder.encode_status(status)
+        assert encoded == b"\x08\x01\x10d\x18\xd2\t \x07"
+        assert self.encoder_decoder.decode_status(encoded) == status
+
+    async def test_replies_are_matched_by_request_id(self):
+        texts = [f"heartbeat {i}" for i in range(self.batch)]
+        replies = await asyncio.gather(
+            *(
+                self.client.send_pipelined(
+                    "127.0.0.1", self.server_port, self.heartbeat(text)
+                )
+                for text in texts
+            )
+        )
+        self.assertEqual(
+            [reply["msg"] for reply in replies], [f"ack {t}" for t in texts]
+        )
+        self.assertEqual(self.accepted, 1)
+        self.assertEqual(self.client.channels.in_flight, 0)
+
+    async def test_pending_requests_fail_when_connection_closes(self):
+        self.batch = 2
+        pending = asyncio.ensure_future(
+            self.client.send_pipelined(
+                "127.0.0.1", self.server_port, self.heartbeat("lonely")
+            )
+        )
+        await asyncio.sleep(0.05)
+        for channel in self.client.channels._channels.values():
+            channel.conn.writer.close()
+        self.assertEqual(await pending, {})
+        self.assertEqual(self.client.channels.in_flight, 0)
+
+    async def test_queued_heartbeats_are_conflated(self):
+        self.batch = 1
+        # open the connection first, the heartbeats are then queued together
+        await self.client.send_pipelined(
+            "127.0.0.1", self.server_port, self.client.heartbeat_record
+        )
+        conflated = self.client.metrics.conflated.value
+        replies = await asyncio.gather(
+            *(
+                self.client.send_pipelined(
+                    "127.0.0.1",
+                    self.server_port,
+                    self.client.heartbeat_record,
+                    conflate=True,
+                )
+                for _ in range(3)
+            )
+        )
+        # only the latest heartbeat was written, every sender got its reply
+        self.assertEqual([reply.request_id for reply in replies], [4, 4, 4])
+        self.assertEqual(self.client.metrics.conflated.value - conflated, 2)
+        self.assertEqual(self.client.channels.in_flight, 0)
+
+    async def test_full_queue_does_not_open_the_circuit(self):
+        self.batch = 1
+        self.client.channels.max_pending = 1
+        # open the connection first, the heartbeats are then queued together
+        await self.client.send_pipelined(
+            "127.0.0.1", self.server_port, self.client.heartbeat_record
+        )
+        sends = [
+            asyncio.ensure_future(
+                self.client.send_pipelined(
+                    "127.0.0.1", self.server_port, self.heartbeat(str(i))
+                )
+            )
+            for i in range(6)
+        ]
+        # the queue of the open connection holds one message, the others overflow at once
+        await asyncio.wait(sends[1:])
+        self.assertEqual([send.result() for send in sends[1:]], [{}] * 5)
+        self.assertEqual(self.client.circuit_breaker.state, CLOSED)
+        self.assertEqual(self.client.circuit_breaker.failures, 0)
+        self.assertEqual((await sends[0])["msg"], "ack 0")
@@ -1,7 +1,8 @@
 from unittest import TestCase
 
 from encode_decode_executor import EncodeDecodeExecutor
-from protobuf_encode_decoder import ProtobufEncoderDecoder
+from message_records import INCORRECT_DECODER, HeartBeat, Status
+from protobuf_encode_decoder import MAX_UINT32, ProtobufEncoderDecoder
 import messages_pb2 as messages
 
 
@@ -105,3 +106,149 @@ class ProtoBufEncodeDecodeTestCase(TestCase):
             "type": messages.MessageType.MESSAGE_TYPE_ERROR,
             "msg": "incorrect decoder",
         }
+
+    def test_encode_decode_heartbeat_batch(self):
+        encoder_decoder = EncodeDecodeExecutor(self.protocol_buffer_enc_dec)
+        heartbeat = {
+            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+            "msg": "ack",
+            "client_host": "0.0.0.0",
+            "identifier": 1234,
+            "client_port": 4000,
+        }
+        msg_dict = {
+            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT_BATCH,
+            "heartbeats": [heartbeat, dict(heartbeat, identifier=1235, request_id=9)],
+        }
+        encoded_binary = encoder_decoder.encode_heartbeat_batch(msg_dict)
+        assert encoded_binary == (
+            b"\x08\x04"
+            b"\x12\x14\x12\x03ack\x1a\x070.0.0.0 \xa0\x1f(\xd2\t"
+            b"\x12\x16\x12\x03ack\x1a\x070.0.0.0 \xa0\x1f(\xd3\t0\t"
+        )
+        assert encoder_decoder.decode_heartbeat_batch(encoded_binary) == msg_dict
+
+    def test_decode_heartbeat_batch_with_incorrect_message(self):
+        encoder_decoder = EncodeDecodeExecutor(self.protocol_buffer_enc_dec)
+        msg_dict = {
+            "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+            "message_count": 100,
+            "identifier": 1234,
+        }
+        encoded_binary = encoder_decoder.encode_status(msg_dict)
+        decoded_message = encoder_decoder.decode_heartbeat_batch(encoded_binary)
+        assert decoded_message == {
+            "type": messages.MessageType.MESSAGE_TYPE_ERROR,
+            "msg": "incorrect decoder",
+        }
+
+    def test_cached_heartbeat_template(self):
+        encoder_decoder = EncodeDecodeExecutor(self.protocol_buffer_enc_dec)
+        msg_dict = {
+            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+            "msg": "send me count please",
+            "client_host": "0.0.0.0",
+            "identifier": 1234,
+            "client_port": 4000,
+        }
+        uncached = ProtobufEncoderDecoder(heartbeat_cache_size=0)
+        for request_id in (0, 1, 127, 128, 300, 2**32 - 1, 0):
+            msg_dict["request_id"] = request_id
+            assert encoder_decoder.encode_heartbeat(
+                msg_dict
+            ) == uncached.encode_heartbeat(msg_dict)
+            expected = dict(msg_dict)
+            if not request_id:
+                del expected["request_id"]
+            decoded_message = encoder_decoder.decode_heartbeat(
+                encoder_decoder.encode_heartbeat(msg_dict)
+            )
+            assert decoded_message == expected
+
+    def test_encode_decode_error_message(self):
+        encoder_decoder = EncodeDecodeExecutor(self.protocol_buffer_enc_dec)
+        msg_dict = {
+            "type": messages.MessageType.MESSAGE_TYPE_ERROR,
+            "msg": "overloaded",
+        }
+        encoded_binary = encoder_decoder.encode_error(msg_dict)
+        assert encoded_binary == b"\x08\x03\x12\noverloaded"
+        assert encoder_decoder.decode_error(encoded_binary) == msg_dict
+        assert encoder_decoder.decode_error(
+            encoder_decoder.encode_status(
+                {
+                    "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+                    "message_count": 1,
+                    "identifier": 1,
+                }
+            )
+        ) == {
+            "type": messages.MessageType.MESSAGE_TYPE_ERROR,
+            "msg": "incorrect decoder",
+        }
+
+    def test_encode_decode_heartbeat_record(self):
+        encoder_decoder = EncodeDecodeExecutor(self.protocol_buffer_enc_dec)
+        record = HeartBeat(
+            msg="send me count please",
+            client_host="0.0.0.0",
+            client_port=4000,
+            identifier=1234,
+            request_id=300,
+        )
+        encoded_binary = encoder_decoder.encode_heartbeat_record(record)
+        assert encoded_binary == encoder_decoder.encode_heartbeat(record.to_dict())
+        assert encoder_decoder.decode_heartbeat_record(encoded_binary) == record
+        assert encoder_decoder.decode_heartbeat(encoded_binary) == record.to_dict()
+        assert encoder_decoder.decode_status_record(encoded_binary) == INCORRECT_DECODER
+
+    def test_heartbeat_record_shares_the_template_cache(self):
+        encoder_decoder = ProtobufEncoderDecoder()
+        record = HeartBeat(msg="I'm here!", client_host="0.0.0.0", client_port=4000)
+        first = encoder_decoder.encode_heartbeat_record(record)
+        assert encoder_decoder.encode_heartbeat(record.to_dict()) == first
+        assert len(encoder_decoder._heartbeat_templates) == 1
+        for request_id in (1, 300, MAX_UINT32):
+            with_id = record._replace(request_id=request_id)
+            assert encoder_decoder.encode_heartbeat_record(
+                with_id
+            ) == ProtobufEncoderDecoder(0).encode_heartbeat(with_id.to_dict())
+        assert len(encoder_decoder._heartbeat_templates) == 1
+
+    def test_record_get_only_knows_fields(self):
+        for record in (HeartBeat(), Status(), INCORRECT_DECODER):
+            assert record.get("count") is None
+            assert record.get("index", 7) == 7
+            assert record.get("type") == record.type
+        assert INCORRECT_DECODER.get("msg") == "incorrect decoder"
+
+    def test_encode_decode_status_record(self):
+        encoder_decoder = EncodeDecodeExecutor(self.protocol_buffer_enc_dec)
+        record = Status(message_count=10, identifier=1234)
+        encoded_binary = encoder_decoder.encode_status_record(record)
+        assert encoded_binary == encoder_decoder.encode_status(record.to_dict())
+        assert encoder_decoder.decode_status_record(encoded_binary) == record
+        assert encoder_decoder.decode_status(encoded_binary) == {
+            "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+            "message_count": 10,
+            "identifier": 1234,
+        }
+        assert (
+            encoder_decoder.decode_heartbeat_record(encoded_binary) == INCORRECT_DECODER
+        )
+
+    def test_heartbeat_template_cache_is_lru(self):
+        encoder_decoder = ProtobufEncoderDecoder(heartbeat_cache_size=2)
+        msg_dict = {
+            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+            "msg": "I'm here!",
+            "client_host": "0.0.0.0",
+            "client_port": 4000,
+        }
+        for identifier in (1, 2, 1, 3):
+            encoder_decoder.encode_heartbeat(dict(msg_dict, identifier=identifier))
+        assert [key[-1] for key in encoder_decoder._heartbeat_templates] == [1, 3]
+
+        # an incorrect message is never cached
+        encoder_decoder.encode_heartbeat({"type": 0, "identifier": 4})
+        assert len(encoder_decoder._heartbeat_templates) == 2
@@ -0,0 +1,146 @@
+import asyncio
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from client import Client
+from encode_decode_executor import EncodeDecodeExecutor
+from framing import FrameError, encode_frame
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+from protocol_transport import PROTOCOL, MessageProtocol
+from stand_in_server import StandInServer
+
+
+class FakeTransport(asyncio.Transport):
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def is_closing(self):
+        return self.closed
+
+
+def receive(protocol: MessageProtocol, data: bytes, chunk: int) -> None:
+    # what the event loop does: receive at most chunk bytes into the buffer of the protocol
+    offset = 0
+    while offset < len(data):
+        buffer = protocol.get_buffer(-1)
+        size = min(chunk, len(buffer), len(data) - offset)
+        buffer[:size] = data[offset : offset + size]
+        del buffer
+        protocol.buffer_updated(size)
+        offset += size
+
+
+class MessageProtocolTestCase(IsolatedAsyncioTestCase):
+    def make_protocol(self, framed=True, **kwargs):
+        protocol = MessageProtocol(framed, **kwargs)
+        protocol.connection_made(FakeTransport())
+        return protocol
+
+    async def test_frames_split_across_reads(self):
+        protocol = self.make_protocol(buffer_size=16)
+        payloads = [b"a" * 3, b"", b"b" * 100, b"c" * 5000]
+        receive(protocol, b"".join(map(encode_frame, payloads)), 7)
+        for payload in payloads:
+            self.assertEqual(await protocol.read_message(), payload)
+
+    async def test_large_frame_grows_the_buffer(self):
+        protocol = self.make_protocol(buffer_size=1024)
+        payload = bytes(range(256)) * 1000
+        receive(protocol, encode_frame(payload), 65536)
+        self.assertEqual(await protocol.read_message(), payload)
+
+    async def test_unframed_chunks_are_messages(self):
+        protocol = self.make_protocol(framed=False)
+        receive(protocol, b"one", 3)
+        receive(protocol, b"two", 3)
+        self.assertEqual(await protocol.read_message(), b"one")
+        self.assertEqual(await protocol.read_message(), b"two")
+
+    async def test_read_waits_and_returns_empty_at_eof(self):
+        protocol = self.make_protocol()
+        read = asyncio.ensure_future(protocol.read_message())
+        await asyncio.sleep(0)
+        self.assertFalse(read.done())
+        receive(protocol, encode_frame(b"x"), 1)
+        self.assertEqual(await read, b"x")
+        protocol.eof_received()
+        self.assertEqual(await protocol.read_message(), b"")
+        self.assertTrue(protocol.at_eof())
+
+    async def test_oversized_frame(self):
+        protocol = self.make_protocol(max_frame_size=10)
+        receive(protocol, encode_frame(b"x" * 11), 100)
+        with self.assertRaises(FrameError):
+            await protocol.read_message()
+        self.assertTrue(protocol.transport.closed)
+
+
+class ProtocolClientTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        self.servers = []
+        self.clients = []
+
+    async def asyncTearDown(self) -> None:
+        for client in self.clients:
+            await client.close()
+        for server in self.servers:
+            await server.close()
+
+    async def start(self, framed=False, **kwargs):
+        server = StandInServer(self.encoder_decoder, framed=framed)
+        await server.start()
+        self.servers.append(server)
+        client = Client(
+            encoder_decoder=self.encoder_decoder,
+            client_identifier=7777,
+            client_port=0,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=server.port,
+            framed=framed,
+            transport=PROTOCOL,
+            **kwargs,
+        )
+        self.clients.append(client)
+        return server, client
+
+    async def test_heartbeats_reuse_the_connection(self):
+        for framed in (False, True):
+            server, client = await self.start(framed=framed)
+            for _ in range(3):
+                reply = await client.send_a_message_to_server(
+                    "127.0.0.1", server.port, client.heartbeat_record
+                )
+                self.assertEqual(reply.msg, "ack")
+            self.assertEqual(server.stats.heartbeats, 3)
+            self.assertEqual(server.stats.connections, 1)
+
+    async def test_pipelined(self):
+        server, client = await self.start(framed=True, pipelined=True)
+        replies = await asyncio.gather(
+            *(
+                client.send_pipelined("127.0.0.1", server.port, client.heartbeat_record)
+                for _ in range(10)
+            )
+        )
+        self.assertEqual(sorted(r.request_id for r in replies), list(range(1, 11)))
+
+    async def test_status_requests(self):
+        for framed in (False, True):
+            server, client = await self.start(framed=framed)
+            client.heartbeat_count = 4
+            await client.start_server()
+            port = client.server.sockets[0].getsockname()[1]
+            for _ in range(2):
+                status = await server.request_status("127.0.0.1", port, 7777)
+                self.assertEqual(status["message_count"], 4)
+            self.assertGreater(client.metrics.status_requests.value, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
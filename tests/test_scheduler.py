@@ -0,0 +1,155 @@
+import asyncio
+import heapq
+import itertools
+from unittest import IsolatedAsyncioTestCase
+
+from scheduler import CATCH_UP, SKIP, HeartbeatScheduler
+
+
+class FakeClock:
+    """
+    A clock which only moves when advance() is awaited, so tick times are exact.
+    """
+
+    class Timer:
+        def __init__(self, callback, args):
+            self.callback = callback
+            self.args = args
+            self.cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    def __init__(self):
+        self.now = 0.0
+        self._timers = []
+        self._sequence = itertools.count()
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback, *args):
+        timer = self.Timer(callback, args)
+        heapq.heappush(self._timers, (when, next(self._sequence), timer))
+        return timer
+
+    async def sleep(self, seconds):
+        waiter = asyncio.get_running_loop().create_future()
+        self.call_at(self.now + seconds, waiter.set_result, None)
+        await waiter
+
+    @staticmethod
+    async def settle():
+        # lets the woken tasks run until they wait on the clock again
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    async def advance(self, seconds):
+        until = self.now + seconds
+        await self.settle()
+        while self._timers and self._timers[0][0] <= until:
+            when, _, timer = heapq.heappop(self._timers)
+            if timer.cancelled:
+                continue
+            self.now = when
+            timer.callback(*timer.args)
+            await self.settle()
+        self.now = until
+
+
+class HeartbeatSchedulerTestCase(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    async def run_for(self, scheduler, seconds):
+        runner = asyncio.ensure_future(scheduler.run())
+        await self.clock.advance(seconds)
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+
+    async def test_ticks_do_not_drift_with_slow_calls(self):
+        starts = []
+
+        async def slow():
+            starts.append(self.clock.time())
+            await self.clock.sleep(0.5)
+
+        scheduler = HeartbeatScheduler(self.clock)
+        scheduler.schedule(1, slow)
+        await self.run_for(scheduler, 4.5)
+        # the n-th call starts at n * interval, not n * (interval + call time)
+        self.assertEqual(starts, [0, 1, 2, 3, 4])
+
+    async def test_skip_drops_ticks_while_the_call_is_running(self):
+        starts = []
+
+        async def overrun():
+            starts.append(self.clock.time())
+            await self.clock.sleep(2.5)
+
+        scheduler = HeartbeatScheduler(self.clock)
+        job = scheduler.schedule(1, overrun, missed=SKIP)
+        await self.run_for(scheduler, 5.5)
+        # the ticks at 1, 2, 4 and 5 are dropped
+        self.assertEqual(starts, [0, 3])
+        self.assertEqual(job.calls, 2)
+        self.assertEqual(job.missed_ticks, 4)
+
+    async def test_catch_up_runs_missed_ticks_late(self):
+        starts = []
+
+        async def overrun():
+            starts.append(self.clock.time())
+            await self.clock.sleep(1.25)
+
+        scheduler = HeartbeatScheduler(self.clock)
+        job = scheduler.schedule(1, overrun, missed=CATCH_UP)
+        await self.run_for(scheduler, 4.5)
+        # five ticks, the missed ones run back to back
+        self.assertEqual(starts, [0, 1.25, 2.5, 3.75])
+        self.assertEqual(job.missed_ticks, 0)
+        self.assertEqual(job.calls + job.owed, 5)
+
+    async def test_start_delay_jitter_and_cancel(self):
+        calls = []
+
+        async def record(name):
+            calls.append((name, self.clock.time()))
+
+        scheduler = HeartbeatScheduler(self.clock)
+        runner = asyncio.ensure_future(scheduler.run())
+        late = scheduler.schedule(10, record, "late", start_delay=3, jitter=1)
+        scheduler.schedule(10, record, "early")
+        await self.clock.advance(2)
+        self.assertEqual(calls, [("early", 0)])
+        await self.clock.advance(2)
+        self.assertEqual(len(calls), 2)
+        name, when = calls[1]
+        self.assertEqual(name, "late")
+        self.assertTrue(3 <= when <= 4)
+        late.cancel()
+        await self.clock.advance(10)
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        self.assertEqual(calls[2:], [("early", 10)])
+
+    async def test_running_calls_are_cancelled_with_run(self):
+        cancelled = []
+
+        async def forever():
+            try:
+                await self.clock.sleep(100)
+            except asyncio.CancelledError:
+                cancelled.append(self.clock.time())
+                raise
+
+        scheduler = HeartbeatScheduler(self.clock)
+        job = scheduler.schedule(1, forever)
+        await self.run_for(scheduler, 0.5)
+        self.assertEqual(cancelled, [0.5])
+        self.assertFalse(job.running)
+        self.assertEqual(len(scheduler._calls), 0)
+
+    async def test_unknown_missed_policy(self):
+        with self.assertRaises(ValueError):
+            HeartbeatScheduler().schedule(1, asyncio.sleep, 0, missed="never")
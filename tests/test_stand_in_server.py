@@ -0,0 +1,156 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from client import Client
+from encode_decode_executor import EncodeDecodeExecutor
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+from stand_in_server import StandInServer
+import messages_pb2 as messages
+
+
+class StandInServerTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        self.servers = []
+        self.clients = []
+
+    async def asyncTearDown(self) -> None:
+        for client in self.clients:
+            await client.close()
+        for server in self.servers:
+            await server.close()
+
+    async def start_server(self, **kwargs):
+        server = StandInServer(self.encoder_decoder, seed=1, **kwargs)
+        await server.start()
+        self.servers.append(server)
+        return server
+
+    def make_client(self, server, **kwargs):
+        client = Client(
+            encoder_decoder=self.encoder_decoder,
+            client_identifier=7777,
+            client_port=2222,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=server.port,
+            **kwargs,
+        )
+        self.clients.append(client)
+        return client
+
+    def heartbeat(self):
+        return {
+            "type": messages.MessageType.MESSAGE_TYPE_HEARTBEAT,
+            "msg": "I’m here!",
+            "identifier": 7777,
+            "client_host": "127.0.0.1",
+            "client_port": 2222,
+        }
+
+    async def test_heartbeat_is_acked(self):
+        server = await self.start_server(latency=0.001, jitter=0.001)
+        client = self.make_client(server)
+        for _ in range(3):
+            reply = await client.send_a_message_to_server(
+                "127.0.0.1", server.port, self.heartbeat()
+            )
+            self.assertEqual(reply, dict(self.heartbeat(), msg="ack"))
+        self.assertEqual(server.stats.heartbeats, 3)
+        self.assertEqual(server.stats.connections, 1)
+
+    async def test_heartbeat_batch_is_acked(self):
+        for framed in (False, True):
+            server = await self.start_server(framed=framed)
+            client = self.make_client(server, framed=framed)
+            heartbeats = [dict(self.heartbeat(), identifier=i) for i in range(1, 11)]
+            reply = await client.send_heartbeat_batch(
+                "127.0.0.1", server.port, heartbeats
+            )
+            self.assertEqual(
+                reply["type"], messages.MessageType.MESSAGE_TYPE_HEARTBEAT_BATCH
+            )
+            self.assertEqual(
+                [heartbeat["identifier"] for heartbeat in reply["heartbeats"]],
+                list(range(1, 11)),
+            )
+            self.assertEqual((server.stats.batches, server.stats.heartbeats), (1, 10))
+
+    async def test_framed_pipelined_heartbeats(self):
+        server = await self.start_server(framed=True, jitter=0.005)
+        client = self.make_client(server, framed=True, pipelined=True)
+        replies = await asyncio.gather(
+            *(
+                client.send_pipelined("127.0.0.1", server.port, self.heartbeat())
+                for _ in range(10)
+            )
+        )
+        self.assertEqual(
+            sorted(reply["request_id"] for reply in replies), list(range(1, 11))
+        )
+        self.assertEqual(server.stats.heartbeats, 10)
+
+    async def test_error_injection(self):
+        server = await self.start_server(error_rate=1.0)
+        client = self.make_client(server)
+        reply = await client.send_a_message_to_server(
+            "127.0.0.1", server.port, self.heartbeat()
+        )
+        self.assertEqual(reply["type"], messages.MessageType.MESSAGE_TYPE_ERROR)
+        self.assertEqual(server.stats.errors_injected, 1)
+
+        server.error_rate = 0.0
+        server.drop_rate = 1.0
+        # a dropped connection fails the heartbeat instead of raising
+        reply = await client.send_a_message_to_server(
+            "127.0.0.1", server.port, self.heartbeat()
+        )
+        self.assertEqual(reply, {})
+        self.assertGreaterEqual(server.stats.drops_injected, 1)
+
+    async def test_drive_status_requests(self):
+        server = await self.start_server()
+        client = self.make_client(server)
+        client.heartbeat_count = 4
+        listener = await asyncio.start_server(
+            client.handle_server_request, "127.0.0.1", 0
+        )
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            status = await server.request_status("127.0.0.1", port, 7777)
+            self.assertEqual(
+                status,
+                {
+                    "type": messages.MessageType.MESSAGE_TYPE_STATUS,
+                    "message_count": 4,
+                    "identifier": 7777,
+                    "request_id": 1,
+                },
+            )
+            await server.drive_status_requests(
+                "127.0.0.1", port, [7777], rate=200, count=5
+            )
+        finally:
+            listener.close()
+            await listener.wait_closed()
+        self.assertEqual(server.stats.status_sent, 6)
+        self.assertEqual(server.stats.status_replies, 6)
+        self.assertEqual(len(server.stats.status_latencies), 6)
+
+    async def test_framed_status_requests_reuse_the_connection(self):
+        server = await self.start_server(framed=True)
+        client = self.make_client(server, framed=True)
+        listener = await asyncio.start_server(
+            client.handle_server_request, "127.0.0.1", 0
+        )
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            for _ in range(3):
+                status = await server.request_status("127.0.0.1", port, 7777)
+                self.assertEqual(status["identifier"], 7777)
+        finally:
+            await server.close()
+            listener.close()
+            await listener.wait_closed()
+        self.assertEqual(server.stats.status_replies, 3)
+        self.assertEqual(server.stats.status_connections, 1)
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import queue
+import socket
+import tempfile
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from encode_decode_executor import EncodeDecodeExecutor
+from metrics import Registry, client_metrics
+from client_state import ClientState
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+from stand_in_server import StandInServer
+from supervisor import Supervisor, shard, worker_log_filename, worker_stats
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ShardTestCase(unittest.TestCase):
+    def test_shards_cover_the_identifiers(self):
+        self.assertEqual(
+            shard(100, 10, 3), [range(100, 104), range(104, 107), range(107, 110)]
+        )
+        self.assertEqual(shard(1, 2, 2), [range(1, 2), range(2, 3)])
+        with self.assertRaises(ValueError):
+            shard(1, 2, 3)
+
+    def test_counts_are_loaded_from_the_state(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "client.state")
+            state = ClientState(path)
+            state.set_count(state.slot(501), 9)
+            state.close()
+            supervisor = Supervisor(
+                config={"fleet": {}, "state": path},
+                first_identifier=500,
+                count=3,
+                workers=1,
+                registry=Registry(),
+            )
+            self.assertEqual(list(supervisor.heartbeat_counts), [0, 9, 0])
+            state = ClientState(path)
+            self.assertEqual(len(state), 3)
+            state.close()
+
+    def test_worker_log_filename(self):
+        self.assertEqual(
+            worker_log_filename("log/client.log", 2), "log/client.worker2.log"
+        )
+        self.assertIsNone(worker_log_filename(None, 2))
+
+
+class FakeProcess:
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.alive = True
+        self.exitcode = None
+
+    def is_alive(self) -> bool:
+        return self.alive
+
+    def join(self, timeout=None) -> None:
+        pass
+
+
+class CollectTestCase(unittest.TestCase):
+    def test_histograms_are_summed_up(self):
+        registry = Registry()
+        supervisor = Supervisor(
+            config={"fleet": {}},
+            first_identifier=500,
+            count=2,
+            workers=2,
+            registry=registry,
+        )
+        supervisor.stats = queue.Queue()
+        supervisor.processes = [FakeProcess(10), FakeProcess(11)]
+        first, second = client_metrics(Registry()), client_metrics(Registry())
+        first.heartbeat_seconds.observe(0.001)
+        second.heartbeat_seconds.observe(0.001)
+        second.heartbeat_seconds.observe(10)
+        second.status_seconds.observe(0.5)
+        supervisor.stats.put((0, 10, worker_stats(first)))
+        supervisor.stats.put((1, 11, worker_stats(second)))
+        supervisor.collect()
+        heartbeat_seconds = supervisor.metrics.heartbeat_seconds
+        self.assertEqual(heartbeat_seconds.count, 3)
+        self.assertAlmostEqual(heartbeat_seconds.sum, 10.002)
+        self.assertEqual(
+            heartbeat_seconds.counts,
+            [
+                a + b
+                for a, b in zip(
+                    first.heartbeat_seconds.counts, second.heartbeat_seconds.counts
+                )
+            ],
+        )
+        self.assertEqual(supervisor.metrics.status_seconds.count, 1)
+        self.assertIn("client_heartbeat_seconds_count 3", registry.render())
+
+        # the observations of a worker which exited are kept
+        supervisor.processes[1].alive = False
+        supervisor.poll(now=0.0)
+        self.assertEqual(heartbeat_seconds.count, 3)
+        self.assertEqual(supervisor.metrics.status_seconds.sum, 0.5)
+
+
+class SupervisorTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        self.server = StandInServer(self.encoder_decoder)
+        await self.server.start()
+        self.client_port = free_port()
+        self.registry = Registry()
+
+    async def asyncTearDown(self) -> None:
+        await self.server.close()
+
+    def make_supervisor(self, **kwargs) -> Supervisor:
+        return Supervisor(
+            config={
+                "encoder_decoder": ProtobufEncoderDecoder,
+                "fleet": {
+                    "client_port": self.client_port,
+                    "client_ip": "127.0.0.1",
+                    "server_ip": "127.0.0.1",
+                    "server_port": self.server.port,
+                },
+                "heartbeat_interval": 0.2,
+                "report_interval": 0.1,
+                "logging": {"mode": "sync", "filename": None, "level": "ERROR"},
+            },
+            first_identifier=500,
+            count=4,
+            workers=2,
+            registry=self.registry,
+            **kwargs,
+        )
+
+    async def wait_for(self, condition, timeout: float = 20.0) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not condition():
+            self.assertLess(loop.time(), deadline, "timed out")
+            await asyncio.sleep(0.05)
+
+    async def test_workers_share_the_port_and_counts(self):
+        supervisor = self.make_supervisor(poll_interval=0.05)
+        run = asyncio.ensure_future(supervisor.run())
+        try:
+            await self.wait_for(lambda: min(supervisor.heartbeat_counts) >= 2)
+            for identifier in range(500, 504):
+                status = await self.server.request_status(
+                    "127.0.0.1", self.client_port, identifier
+                )
+                self.assertEqual(status["identifier"], identifier)
+                self.assertGreaterEqual(status["message_count"], 2)
+            await self.wait_for(lambda: supervisor.metrics.acked.value >= 8)
+            self.assertIn("supervisor_heartbeat_count", self.registry.render())
+        finally:
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
+        self.assertTrue(all(process is None for process in supervisor.processes))
+
+    async def test_crashed_workers_are_restarted(self):
+        supervisor = self.make_supervisor(restart_delay=0.05, poll_interval=0.05)
+        # workers fail to build their fleet and exit at once
+        supervisor.config["encoder_decoder"] = None
+        run = asyncio.ensure_future(supervisor.run())
+        try:
+            await self.wait_for(lambda: min(supervisor.restarts) >= 2)
+        finally:
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
+        self.assertGreater(supervisor._failures[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from client import Client
+from encode_decode_executor import EncodeDecodeExecutor
+from metrics import ClientMetrics, Registry
+from protobuf_encode_decoder import ProtobufEncoderDecoder
+from stand_in_server import StandInServer
+from udp_transport import MAX_SEQUENCE, DatagramHeartbeatSender
+
+
+class DatagramHeartbeatTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.encoder_decoder = EncodeDecodeExecutor(ProtobufEncoderDecoder())
+        self.metrics = ClientMetrics(Registry())
+        self.server = StandInServer(self.encoder_decoder, udp=True, seed=3)
+        await self.server.start()
+        self.senders = []
+
+    async def asyncTearDown(self) -> None:
+        for sender in self.senders:
+            sender.close()
+        await self.server.close()
+
+    def make_client(self, **kwargs):
+        sender = DatagramHeartbeatSender(
+            self.encoder_decoder,
+            "127.0.0.1",
+            self.server.port,
+            metrics=self.metrics,
+            **kwargs,
+        )
+        self.senders.append(sender)
+        return Client(
+            encoder_decoder=self.encoder_decoder,
+            client_identifier=7777,
+            client_port=0,
+            client_ip="127.0.0.1",
+            server_ip="127.0.0.1",
+            server_port=self.server.port,
+            metrics=self.metrics,
+            datagram_sender=sender,
+        )
+
+    async def test_heartbeats_are_acked_without_connections(self):
+        client = self.make_client()
+        for _ in range(3):
+            await client.send_heartbeat()
+        self.assertEqual(self.server.stats.heartbeats, 3)
+        self.assertEqual(self.server.stats.connections, 0)
+        self.assertEqual(self.metrics.acked.value, 3)
+        self.assertEqual(client.heartbeat_count, 3)
+        ack = await client.send_datagram_heartbeat(client.heartbeat_record)
+        self.assertEqual(ack.msg, "ack")
+        self.assertEqual(ack.request_id, 4)
+        await client.close()
+        self.assertIsNone(client.datagram_sender.transport)
+
+    async def test_sequence_wraps_around(self):
+        client = self.make_client()
+        client.datagram_sender._last_sequence = MAX_SEQUENCE - 1
+        for _ in range(3):
+            await client.send_heartbeat()
+        # MAX_SEQUENCE, then 1 and 2
+        self.assertEqual(client.datagram_sender._last_sequence, 2)
+        self.assertEqual(self.metrics.acked.value, 3)
+
+    async def test_lost_datagrams_are_sent_again(self):
+        client = self.make_client(ack_timeout=0.02, retries=20)
+        self.server.drop_rate = 0.5
+        for _ in range(5):
+            ack = await client.send_datagram_heartbeat(client.heartbeat_record)
+            self.assertEqual(ack.msg, "ack")
+        self.assertEqual(
+            self.metrics.retransmits.value, self.server.stats.drops_injected
+        )
+        self.assertGreater(self.metrics.retransmits.value, 0)
+
+    async def test_no_ack_gives_up(self):
+        client = self.make_client(ack_timeout=0.01, retries=2)
+        self.server.drop_rate = 1.0
+        self.assertEqual(
+            await client.send_datagram_heartbeat(client.heartbeat_record), {}
+        )
+        self.assertEqual(self.server.stats.datagrams, 3)
+        self.assertEqual(self.metrics.failed.value, 1)
+        self.assertEqual(self.senders[0].pending, {})
+
+    async def test_without_acks(self):
+        client = self.make_client(ack=False)
+        self.assertIsNone(await client.send_datagram_heartbeat(client.heartbeat_record))
+        for _ in range(100):
+            if self.server.stats.heartbeats:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.server.stats.heartbeats, 1)
+        self.assertEqual(self.metrics.acked.value, 0)
+        self.assertEqual(self.metrics.failed.value, 0)
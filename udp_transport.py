@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from encode_decode_executor import EncodeDecodeExecutor
+from message_records import HeartBeat
+from metrics import ClientMetrics, client_metrics
+
+log = logging.getLogger("__main__." + __name__)
+
+# the transports of heartbeats, status requests always use TCP
+TCP = "tcp"
+UDP = "udp"
+
+# sequence numbers are sent as the uint32 request_id, 0 meaning none
+MAX_SEQUENCE = 0xFFFFFFFF
+
+
+class _HeartbeatDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, sender: "DatagramHeartbeatSender"):
+        self.sender = sender
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.sender.ack_received(data)
+
+    def error_received(self, exc: Exception) -> None:
+        # an ICMP error for an earlier datagram, like port unreachable
+        log.debug("heartbeat datagram error: %s", exc)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.sender.connection_lost(exc)
+
+
+class DatagramHeartbeatSender:
+    """
+    Sends heartbeats as single UDP datagrams from one socket, which can be shared by every
+    identity of a fleet. The request_id of a heartbeat is its sequence number: with acks
+    the server echoes it, and a heartbeat which is not acked within ack_timeout is sent
+    again, at most retries times.
+    """
+
+    def __init__(
+        self,
+        encoder_decoder: EncodeDecodeExecutor,
+        server_ip: str,
+        server_port: int,
+        ack: bool = True,
+        ack_timeout: float = 0.5,
+        retries: int = 3,
+        metrics: Optional[ClientMetrics] = None,
+    ):
+        """
+        :param encoder_decoder: the encoder/decoder of the heartbeats.
+        :param server_ip: server ip address
+        :param server_port: the UDP port of the server.
+        :param ack: wait for the server to echo every heartbeat.
+        :param ack_timeout: seconds to wait for an ack before sending the heartbeat again.
+        :param retries: the number of times a heartbeat is sent again.
+        :param metrics: where retransmits are counted.
+        """
+        self.encoder_decoder = encoder_decoder
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.ack = ack
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.metrics = metrics if metrics is not None else client_metrics()
+        self._last_sequence = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def start(self) -> None:
+        """
+        Open the socket, send() does it when needed.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.transport is None or self.transport.is_closing():
+                loop = asyncio.get_running_loop()
+                self.transport, _ = await loop.create_datagram_endpoint(
+                    lambda: _HeartbeatDatagramProtocol(self),
+                    remote_addr=(self.server_ip, self.server_port),
+                )
+
+    async def send(self, heartbeat: HeartBeat) -> Tuple[Optional[HeartBeat], int]:
+        """
+        :param heartbeat: the heartbeat to send, its request_id is replaced.
+        :return: the ack of the server, None without acks, and the bytes sent.
+        :raise ConnectionError: when no ack came after every retry.
+        """
+        if self.transport is None or self.transport.is_closing():
+            await self.start()
+        sequence = self._next_sequence()
+        datagram = self.encoder_decoder.encode_heartbeat_record(
+            heartbeat._replace(request_id=sequence)
+        )
+        if not self.ack:
+            self.transport.sendto(datagram)
+            return None, len(datagram)
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[sequence] = future
+        sent = 0
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.metrics.retransmits.inc()
+                    log.debug("heartbeat %s not acked, sending it again", sequence)
+                self.transport.sendto(datagram)
+                sent += len(datagram)
+                try:
+                    ack = await asyncio.wait_for(
+                        asyncio.shield(future), self.ack_timeout
+                    )
+                    return ack, sent
+                except asyncio.TimeoutError:
+                    continue
+            raise ConnectionError(
+                f"heartbeat {sequence} not acked after {self.retries + 1} datagrams"
+            )
+        finally:
+            del self.pending[sequence]
+            if not future.done():
+                future.cancel()
+
+    def _next_sequence(self) -> int:
+        # wraps around like Client._next_request_id, a sender may run for days
+        self._last_sequence = self._last_sequence % MAX_SEQUENCE + 1
+        return self._last_sequence
+
+    def ack_received(self, data: bytes) -> None:
+        try:
+            ack = self.encoder_decoder.decode_heartbeat_record(binary_data=data)
+        except Exception as e:
+            log.error("could not decode a heartbeat ack datagram: %s", e)
+            return
+        future = self.pending.get(ack.get("request_id", 0))
+        # a late ack of a heartbeat which was sent again, or which gave up, is ignored
+        if future is not None and not future.done():
+            future.set_result(ack)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        error = ConnectionError(f"heartbeat socket closed: {exc}")
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None